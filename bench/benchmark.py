@@ -0,0 +1,283 @@
+# Times the stages of the CSV engine, and the plugin's view parsing, on
+# generated files of several sizes, and saves the results as JSON:
+#
+#   python bench/benchmark.py --sizes 10000,100000
+#   python bench/benchmark.py --compare bench/results/before.json
+#
+# The plugin is loaded against the Sublime Text stub in bench/stub.  Each
+# stage is run --repeat times on fresh data and the fastest time is kept.
+# Stages marked with memory are run once more under tracemalloc, and their
+# peak allocation is saved too.
+
+import argparse, datetime, gc, io, json, os, platform, shutil, subprocess, sys, tempfile, time, tracemalloc
+
+bench_directory = os.path.dirname(os.path.realpath(__file__))
+package_directory = os.path.dirname(bench_directory)
+sys.path.insert(0, os.path.join(bench_directory, 'stub'))
+sys.path.insert(0, package_directory)
+
+import sublime
+import csvplugin
+from csvengine import csvengine
+
+import generate
+
+FormatMode = csvengine.FormatMode
+SortDirection = csvengine.SortDirection
+
+class Stage:
+    """ A timed operation.  setup prepares fresh input, untimed, and returns
+    the argument to run; teardown, if any, is given it afterwards.  If
+    memory is set, the peak memory allocated by run is measured too.
+    """
+    def __init__(self, name, run, setup=None, teardown=None, memory=False):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.teardown = teardown
+        self.memory = memory
+
+    def Time(self, repeat):
+        best = None
+        for i in range(repeat):
+            state = self.setup() if self.setup else None
+
+            gc.collect()
+            start = time.perf_counter()
+            self.run(state)
+            elapsed = time.perf_counter() - start
+
+            if self.teardown:
+                self.teardown(state)
+
+            if best is None or elapsed < best:
+                best = elapsed
+
+        return best
+
+    def MeasurePeak(self):
+        """ Returns the most memory allocated at once by run, in bytes,
+        including what its result keeps.
+        """
+        state = self.setup() if self.setup else None
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = self.run(state)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        del result
+        if self.teardown:
+            self.teardown(state)
+
+        return peak
+
+def GetStages(text, path, scratch_directory):
+    tokenizer = csvengine.CSVTokenizer(',', True)
+
+    def parsed():
+        return csvengine.CSVMatrix.FromText(text, tokenizer)
+
+    def lines():
+        return (csvengine.CSVMatrix(tokenizer), text.split('\n'))
+
+    def parse_rows(state):
+        matrix, lines = state
+        for line in lines:
+            matrix.ParseRow(line)
+
+    def view():
+        return sublime.View(text, 'bench.csv')
+
+    def parsed_view():
+        view = sublime.View(text, 'bench.csv')
+        csvplugin.CSVMatrix.FromView(view)
+        return view
+
+    def edit(view):
+        # One cell in the middle of the buffer changes, as when typing.
+        middle = text.index('\n', len(text) // 2) + 1
+        view.text = text[:middle] + 'edited' + text[middle:]
+        view.changes += 1
+
+    def edited_view():
+        view = parsed_view()
+        edit(view)
+        return view
+
+    def measured_view():
+        # The cache measures the rows on first use, then updates the widths
+        # as rows are re-parsed.
+        view = parsed_view()
+        csvplugin.CSVMatrix.FromView(view).MeasureColumns()
+        edit(view)
+        return csvplugin.CSVMatrix.FromView(view)
+
+    def evict(view):
+        csvplugin.parse_cache.Evict(view.view)
+
+    def evict_view(view):
+        csvplugin.parse_cache.Evict(view)
+
+    output_path = os.path.join(scratch_directory, 'output.csv')
+
+    return [
+        Stage('ParseRow', parse_rows, lines),
+        Stage('ParseText', lambda state: parsed(), memory=True),
+        Stage('ParseTextCompact', lambda state: tokenizer.ParseTextCompact(text), memory=True),
+        Stage('MeasureColumns', lambda matrix: matrix.MeasureColumns(), parsed),
+        Stage('FormatCompacted', lambda matrix: matrix.FormatCompacted(), parsed),
+        Stage('FormatExpanded', lambda matrix: matrix.FormatExpanded(), parsed),
+        Stage('GetRowEdits', lambda matrix: matrix.GetRowEdits(FormatMode.Expanded), parsed),
+        Stage('SortByColumn', lambda matrix: matrix.SortByColumn(1, SortDirection.Ascending, True), parsed),
+        Stage('SortByColumns', lambda matrix: matrix.SortByColumns([(2, SortDirection.Ascending), (0, SortDirection.Descending)], True), parsed),
+        Stage('Evaluate', lambda matrix: matrix.Evaluate(), parsed),
+        Stage('FromView', lambda view: csvplugin.CSVMatrix.FromView(view), view, evict_view),
+        Stage('FromViewCached', lambda view: csvplugin.CSVMatrix.FromView(view), parsed_view, evict_view),
+        Stage('FromViewAfterEdit', lambda view: csvplugin.CSVMatrix.FromView(view), edited_view, evict_view),
+        Stage('MeasureColumnsCached', lambda matrix: matrix.MeasureColumns(), measured_view, evict),
+        Stage('FileSort', lambda state: csvengine.CSVFileSorter(tokenizer, 64 * 1024 * 1024).Sort(path, output_path, [(1, SortDirection.Ascending)], True)),
+        Stage('FileJustify', lambda state: csvengine.CSVFileFormatter(tokenizer, tokenizer).Format(path, output_path, FormatMode.Expanded), memory=True),
+    ]
+
+def GetCommit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=package_directory, stderr=subprocess.STDOUT)
+        return output.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def GetEnvironment(args):
+    return {
+        'commit': GetCommit(),
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'sizes': {},
+    }
+
+def Run(args):
+    numpy = csvengine.GetNumPy()
+
+    results = GetEnvironment(args)
+    results.update({
+        'numpy': numpy.__name__,
+        'generator': {
+            'columns': args.columns,
+            'quote_density': args.quote_density,
+            'numeric_ratio': args.numeric_ratio,
+            'formula_density': args.formula_density,
+            'seed': args.seed,
+        },
+    })
+
+    scratch_directory = tempfile.mkdtemp(prefix='csvbench')
+    try:
+        for rows in args.sizes:
+            text = generate.GenerateCSV(rows, args.columns, args.quote_density, args.numeric_ratio, args.formula_density, args.seed)
+
+            path = os.path.join(scratch_directory, 'input.csv')
+            with io.open(path, 'w', newline='') as file:
+                file.write(text)
+
+            timings = {}
+            peaks = {}
+            for stage in GetStages(text, path, scratch_directory):
+                if args.stages and stage.name not in args.stages:
+                    continue
+
+                timings[stage.name] = stage.Time(args.repeat)
+                line = '{0:>9} rows  {1:<22}{2:10.4f} s'.format(rows, stage.name, timings[stage.name])
+
+                if stage.memory and args.memory:
+                    peaks[stage.name] = stage.MeasurePeak()
+                    line += '{0:10.1f} MB peak'.format(peaks[stage.name] / 1048576.0)
+
+                print(line)
+                sys.stdout.flush()
+
+            results['sizes'][str(rows)] = {'bytes': len(text), 'seconds': timings, 'peak_bytes': peaks}
+    finally:
+        shutil.rmtree(scratch_directory)
+
+    return results
+
+def Compare(old_results, new_results, tolerance):
+    """ Prints the timings and peak memory of new_results against
+    old_results, and returns how many stages got slower, or use more memory,
+    by more than tolerance.
+    """
+    measures = [('seconds', 's', 1.0, 'slower', 'faster'), ('peak_bytes', 'MB', 1048576.0, 'larger', 'smaller')]
+
+    regressions = 0
+    for rows, size in sorted(new_results['sizes'].items(), key=lambda item: int(item[0])):
+        old_size = old_results['sizes'].get(rows)
+        if not old_size:
+            continue
+
+        for measure, unit, scale, worse, better in measures:
+            for name, value in sorted(size.get(measure, {}).items()):
+                old_value = old_size.get(measure, {}).get(name)
+                if not old_value:
+                    continue
+
+                ratio = value / float(old_value)
+                note = ''
+                if ratio > 1 + tolerance:
+                    note = '  ' + worse
+                    regressions += 1
+                elif ratio < 1 - tolerance:
+                    note = '  ' + better
+
+                print('{0:>9} rows  {1:<22}{2:10.4f} {6:<2} {3:10.4f} {6:<2} {4:7.2f}x{5}'.format(rows, name, old_value / scale, value / scale, ratio, note, unit))
+
+    return regressions
+
+def AddResultArguments(parser):
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, keeping the fastest (default: 3)')
+    parser.add_argument('-o', '--output', help='JSON file to write (default: bench/results/<date>.json)')
+    parser.add_argument('--compare', metavar='JSON', help='earlier results to compare with; exits with status 1 if a stage got slower or larger')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='fraction slower that counts as a regression (default: 0.1)')
+
+def SaveResults(args, results, prefix=''):
+    """ Writes results as JSON, then compares them with the --compare
+    results, if given, and exits with status 1 on a regression.
+    """
+    output_path = args.output
+    if not output_path:
+        output_path = os.path.join(bench_directory, 'results', prefix + datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    if os.path.dirname(output_path) and not os.path.isdir(os.path.dirname(output_path)):
+        os.makedirs(os.path.dirname(output_path))
+
+    with io.open(output_path, 'w') as file:
+        file.write(json.dumps(results, indent=2, sort_keys=True))
+    print('Results written to {0}'.format(output_path))
+
+    if args.compare:
+        with io.open(args.compare) as file:
+            old_results = json.load(file)
+
+        print('')
+        if Compare(old_results, results, args.tolerance):
+            sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the CSV engine and plugin stages on generated files.')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='comma separated row counts (default: 10000,100000,1000000)')
+    parser.add_argument('--stages', help='comma separated stages to run (default: all)')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="don't measure peak memory, which runs those stages once more under tracemalloc")
+    AddResultArguments(parser)
+    generate.AddGeneratorArguments(parser)
+    args = parser.parse_args()
+
+    args.sizes = [int(rows) for rows in args.sizes.split(',')]
+    args.stages = set(args.stages.split(',')) if args.stages else None
+
+    SaveResults(args, Run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Generates synthetic CSV text for the benchmarks.
+#
+#   python bench/generate.py --rows 100000 --quote-density 0.2 out.csv
+
+import argparse, io, random
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet']
+
+def GenerateCell(rng, delimiter, quote_density, numeric_ratio):
+    if rng.random() < numeric_ratio:
+        if rng.random() < 0.5:
+            return str(rng.randint(-100000, 100000))
+        return '{0:.3f}'.format(rng.uniform(-1000, 1000))
+
+    text = ' '.join(rng.choice(WORDS) for i in range(rng.randint(1, 3)))
+    if rng.random() < quote_density:
+        # Quoted cells hold what requires quoting: the delimiter, quotes and,
+        # in one of ten, a newline.
+        text = text.replace(' ', delimiter, 1) + ' ""q""'
+        if rng.random() < 0.1:
+            text += '\n' + rng.choice(WORDS)
+        return '"' + text + '"'
+
+    return text
+
+def GenerateCSV(rows, columns=8, quote_density=0.1, numeric_ratio=0.5, formula_density=0.0, seed=0, delimiter=','):
+    """ Returns CSV text with a header row and rows data rows of columns
+    cells each.  quote_density and numeric_ratio are the fractions of text
+    cells that are quoted and of cells that are numbers.  formula_density is
+    the fraction of rows whose last cell is a formula writing the sum of the
+    first two cells into the cell to its left.
+    """
+    rng = random.Random(seed)
+
+    lines = [delimiter.join('column_{0}'.format(column_index) for column_index in range(columns))]
+    for row_index in range(rows):
+        cells = [GenerateCell(rng, delimiter, quote_density, numeric_ratio) for column_index in range(columns)]
+        if columns >= 3 and rng.random() < formula_density:
+            cells[-1] = '"<=m[row,0]+m[row,1]"'
+        lines.append(delimiter.join(cells))
+
+    return '\n'.join(lines) + '\n'
+
+def AddGeneratorArguments(parser):
+    parser.add_argument('--columns', type=int, default=8, help='cells per row (default: 8)')
+    parser.add_argument('--quote-density', type=float, default=0.1, help='fraction of text cells that are quoted (default: 0.1)')
+    parser.add_argument('--numeric-ratio', type=float, default=0.5, help='fraction of cells that are numbers (default: 0.5)')
+    parser.add_argument('--formula-density', type=float, default=0.001, help='fraction of rows ending in a formula (default: 0.001)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic CSV file.')
+    parser.add_argument('output', help='file to write')
+    parser.add_argument('--rows', type=int, default=10000, help='data rows, after the header (default: 10000)')
+    AddGeneratorArguments(parser)
+    args = parser.parse_args()
+
+    text = GenerateCSV(args.rows, args.columns, args.quote_density, args.numeric_ratio, args.formula_density, args.seed)
+    with io.open(args.output, 'w', newline='') as file:
+        file.write(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# The parts of the Sublime Text API that csvplugin uses, enough to load it
+# and parse views outside the editor for the benchmarks.
+
+class Region(object):
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+class Settings(dict):
+    def has(self, name):
+        return name in self
+
+    def set(self, name, value):
+        self[name] = value
+
+    def erase(self, name):
+        self.pop(name, None)
+
+settings = Settings()
+
+def load_settings(name):
+    return settings
+
+class Selection(list):
+    def clear(self):
+        del self[:]
+
+    def add(self, region):
+        self.append(region)
+
+    def add_all(self, regions):
+        self.extend(regions)
+
+next_view_id = [1]
+
+class View(object):
+    def __init__(self, text, file_name=None):
+        self.text = text
+        self.name = file_name
+        self.view_settings = Settings()
+        self.selection = Selection([Region(0)])
+        self.changes = 1
+
+        self.view_id = next_view_id[0]
+        next_view_id[0] += 1
+
+    def id(self):
+        return self.view_id
+
+    def buffer_id(self):
+        return self.view_id
+
+    def file_name(self):
+        return self.name
+
+    def settings(self):
+        return self.view_settings
+
+    def sel(self):
+        return self.selection
+
+    def size(self):
+        return len(self.text)
+
+    def substr(self, region):
+        return self.text[region.begin():region.end()]
+
+    def change_count(self):
+        return self.changes
+
+    def replace(self, edit, region, text):
+        self.text = self.text[:region.begin()] + text + self.text[region.end():]
+        self.changes += 1
+
+    def set_status(self, key, value):
+        pass
+
+    def erase_status(self, key):
+        pass
+
+def set_timeout(callback, delay=0):
+    callback()
+
+def set_timeout_async(callback, delay=0):
+    callback()
+
+def status_message(message):
+    pass
+
+def error_message(message):
+    print(message)
@@ -0,0 +1,10 @@
+class TextCommand(object):
+    def __init__(self, view):
+        self.view = view
+
+class WindowCommand(object):
+    def __init__(self, window):
+        self.window = window
+
+class EventListener(object):
+    pass
@@ -0,0 +1,107 @@
+# Times TinyNumPy's element access on non-contiguous views and its matrix
+# product, and saves the results as JSON like benchmark.py:
+#
+#   python bench/tinynumpy_benchmark.py
+#   python bench/tinynumpy_benchmark.py --tinynumpy /path/to/other/checkout -o before.json
+#   python bench/tinynumpy_benchmark.py --compare before.json
+#
+# --tinynumpy loads TinyNumPy from another checkout of the package, so an
+# earlier version can be measured and compared against; dot is skipped if
+# that version doesn't have it.  NaiveDot, a triple loop over lists, is the
+# reference for dot.
+
+import argparse, random, sys
+
+import benchmark
+from benchmark import Stage
+
+def NaiveDot(a, b):
+    """ The product of two matrices given as lists of rows, by a triple
+    loop, for reference.
+    """
+    columns = len(b[0])
+    result = [[0.0] * columns for row in a]
+    for i in range(len(a)):
+        for j in range(columns):
+            total = 0.0
+            for k in range(len(b)):
+                total += a[i][k] * b[k][j]
+            result[i][j] = total
+    return result
+
+def GetViewStages(tnp, rows):
+    """ Stages reading and writing columns 2-4 of a rows x 8 float64 array,
+    a view whose rows aren't contiguous.
+    """
+    rng = random.Random(rows)
+    values = [[rng.uniform(-1, 1) for column in range(8)] for row in range(rows)]
+
+    def view():
+        return tnp.array(values, 'float64')[:, 2:5]
+
+    def assign(view):
+        view[:] = 1.5
+
+    def iterate(view):
+        for value in tnp.nditer(view):
+            pass
+
+    return [
+        Stage('flat', lambda view: list(view.flat), view),
+        Stage('_toflatlist', lambda view: view._toflatlist(), view),
+        Stage('__setitem__', assign, view),
+        Stage('nditer', iterate, view),
+        Stage('sum', lambda view: view.sum(), view),
+    ]
+
+def GetMatrixStages(tnp, size):
+    """ Stages multiplying two size x size float64 matrices. """
+    rng = random.Random(size)
+    a = [[rng.uniform(-1, 1) for column in range(size)] for row in range(size)]
+    b = [[rng.uniform(-1, 1) for column in range(size)] for row in range(size)]
+
+    stages = [Stage('NaiveDot', lambda state: NaiveDot(a, b))]
+    if hasattr(tnp, 'dot'):
+        stages.append(Stage('dot', lambda arrays: tnp.dot(*arrays), lambda: (tnp.array(a, 'float64'), tnp.array(b, 'float64'))))
+    return stages
+
+def Run(args, tnp):
+    results = benchmark.GetEnvironment(args)
+    results['tinynumpy'] = tnp.__file__
+
+    sizes = [(rows, GetViewStages) for rows in args.view_rows] + [(size, GetMatrixStages) for size in args.matrix_sizes]
+    for size, get_stages in sizes:
+        timings = {}
+        for stage in get_stages(tnp, size):
+            if args.stages and stage.name not in args.stages:
+                continue
+
+            timings[stage.name] = stage.Time(args.repeat)
+            print('{0:>9} rows  {1:<22}{2:10.4f} s'.format(size, stage.name, timings[stage.name]))
+            sys.stdout.flush()
+
+        results['sizes'].setdefault(str(size), {'seconds': {}})['seconds'].update(timings)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Time TinyNumPy views and matrix products.')
+    parser.add_argument('--view-rows', default='20000,40000', help='comma separated row counts of the rows x 8 arrays viewed (default: 20000,40000)')
+    parser.add_argument('--matrix-sizes', default='100,200', help='comma separated sizes of the square matrices multiplied (default: 100,200)')
+    parser.add_argument('--stages', help='comma separated stages to run (default: all)')
+    parser.add_argument('--tinynumpy', metavar='PATH', help='package checkout to load TinyNumPy from (default: this one)')
+    benchmark.AddResultArguments(parser)
+    args = parser.parse_args()
+
+    args.view_rows = [int(rows) for rows in args.view_rows.split(',') if rows]
+    args.matrix_sizes = [int(size) for size in args.matrix_sizes.split(',') if size]
+    args.stages = set(args.stages.split(',')) if args.stages else None
+
+    if args.tinynumpy:
+        sys.path.insert(0, args.tinynumpy)
+    from tinynumpy import tinynumpy as tnp
+
+    benchmark.SaveResults(args, Run(args, tnp), 'tinynumpy-')
+
+if __name__ == '__main__':
+    main()
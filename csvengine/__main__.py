@@ -0,0 +1,129 @@
+# Command line for the Advanced CSV engine, for files too large to open in
+# Sublime Text and for scripts.  Run it from the package directory:
+#
+#   python -m csvengine sort -k 3:desc input.csv output.csv
+#   python -m csvengine justify input.csv output.csv
+#
+# Except for evaluate, files are streamed a record at a time, so they don't
+# have to fit in memory.
+
+import argparse, io, os, sys
+
+from csvengine import csvengine
+
+def ParseSortKey(text):
+    column, separator, direction = text.partition(':')
+
+    directions = {'': csvengine.SortDirection.Ascending,
+                  'asc': csvengine.SortDirection.Ascending,
+                  'desc': csvengine.SortDirection.Descending}
+
+    if not column.isdigit() or int(column) < 1 or direction not in directions:
+        raise argparse.ArgumentTypeError("'{0}' is not a sort key; expected COLUMN or COLUMN:desc, with columns numbered from 1.".format(text))
+
+    return (int(column) - 1, directions[direction])
+
+def OpenText(path, mode, encoding):
+    return io.open(path, mode, encoding=encoding, errors='surrogateescape', newline='')
+
+def GetTokenizer(args):
+    """ Returns the tokenizer for the input file and its detected dialect,
+    which is None when the delimiter is given.
+    """
+    dialect = None
+    if not args.delimiter:
+        with OpenText(args.input, 'r', args.encoding) as file:
+            sample = file.read(csvengine.CSVMatrix.DIALECT_SAMPLE_SIZE)
+            truncated = file.read(1) != ''
+        dialect = csvengine.CSVMatrix.DetectDialect(sample, truncated)
+
+    delimiter = csvengine.CSVMatrix.ResolveDelimiter({}, args.delimiter, None, dialect)
+
+    return csvengine.CSVTokenizer(delimiter, args.auto_quote), dialect
+
+def Sort(args):
+    tokenizer, dialect = GetTokenizer(args)
+
+    use_header = args.header
+    if use_header is None:
+        use_header = bool(dialect and dialect['has_header'])
+
+    sort_keys = args.keys or [(0, csvengine.SortDirection.Ascending)]
+
+    sorter = csvengine.CSVFileSorter(tokenizer, args.memory_mb * 1024 * 1024, args.encoding)
+    sorter.Sort(args.input, args.output, sort_keys, use_header)
+
+def Format(args, mode):
+    tokenizer, dialect = GetTokenizer(args)
+
+    output_tokenizer = tokenizer
+    if args.output_delimiter:
+        output_delimiter = csvengine.CSVMatrix.ResolveDelimiter({}, args.output_delimiter, None)
+        output_tokenizer = csvengine.CSVTokenizer(output_delimiter, args.auto_quote)
+
+    formatter = csvengine.CSVFileFormatter(tokenizer, output_tokenizer, args.encoding)
+    formatter.Format(args.input, args.output, mode)
+
+def Evaluate(args):
+    tokenizer, dialect = GetTokenizer(args)
+
+    with OpenText(args.input, 'r', args.encoding) as file:
+        text = file.read()
+
+    matrix = csvengine.CSVMatrix.FromText(text, tokenizer)
+    matrix.Evaluate()
+
+    edits = matrix.GetRowEdits(csvengine.FormatMode.Plain, sorted(matrix.modified_row_indices))
+
+    with OpenText(args.output, 'w', args.encoding) as file:
+        file.write(matrix.GetEditedText(edits))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m csvengine', description='Sort, format and evaluate CSV files.')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('input', help='CSV file to read')
+    common.add_argument('output', help='file to write; must not be the input')
+    common.add_argument('-d', '--delimiter', help=r"input delimiter, '\t' for tabs; detected from the start of the file if not given")
+    common.add_argument('--no-auto-quote', dest='auto_quote', action='store_false', help='leave quotes in cells as they are')
+    common.add_argument('--encoding', default='utf-8', help='encoding of the input and output (default: utf-8)')
+
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('--output-delimiter', help='delimiter to write (default: the input delimiter)')
+
+    sort = subparsers.add_parser('sort', parents=[common], help='sort the records by one or more columns')
+    sort.add_argument('-k', '--key', dest='keys', action='append', type=ParseSortKey, metavar='COLUMN[:desc]',
+        help='column to sort by, numbered from 1; repeat for more keys (default: 1)')
+    sort.add_argument('--header', dest='header', action='store_true', default=None, help='keep the first record in place')
+    sort.add_argument('--no-header', dest='header', action='store_false', help='sort the first record too')
+    sort.add_argument('--memory-mb', type=int, default=64, help='records sorted in memory at once, in megabytes (default: 64)')
+    sort.set_defaults(run=Sort)
+
+    compact = subparsers.add_parser('compact', parents=[common, output], help='remove the padding around cells')
+    compact.set_defaults(run=lambda args: Format(args, csvengine.FormatMode.Compacted))
+
+    justify = subparsers.add_parser('justify', parents=[common, output], help='pad cells so the columns line up')
+    justify.set_defaults(run=lambda args: Format(args, csvengine.FormatMode.Expanded))
+
+    convert = subparsers.add_parser('convert', parents=[common, output], help='rewrite the cells with normalized quoting, and optionally a new delimiter')
+    convert.set_defaults(run=lambda args: Format(args, csvengine.FormatMode.Plain))
+
+    evaluate = subparsers.add_parser('evaluate', parents=[common], help='evaluate the formula cells; the file is loaded into memory')
+    evaluate.set_defaults(run=Evaluate)
+
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.input):
+        parser.error("the input file '{0}' doesn't exist".format(args.input))
+    if os.path.exists(args.output) and os.path.samefile(args.input, args.output):
+        parser.error('the output must not be the input file')
+
+    try:
+        args.run(args)
+    except (IOError, OSError) as e:
+        sys.exit('{0}: {1}'.format(parser.prog, e))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1860 @@
+# Originally written by Eric Martel (emartel@gmail.com / www.ericmartel.com)
+# Improved by Wade Brainerd (wadetb@gmail.com / www.wadeb.com)
+
+# The parsing, sorting, formatting and evaluation core of Advanced CSV.  It
+# doesn't depend on Sublime Text, so it can also be run from the command line;
+# see __main__.py.
+
+import array, ast, bisect, collections, fnmatch, heapq, io, itertools, os, re, tempfile, threading, time
+from math import *
+
+# http://stackoverflow.com/questions/11301138/how-to-check-if-variable-is-string-with-python-2-and-3-compatibility
+try:
+    isinstance("", basestring)
+    def isstr(s):
+        return isinstance(s, basestring)
+except NameError:
+    def isstr(s):
+        return isinstance(s, str)
+
+# NumPy, or TinyNumPy when NumPy isn't installed.  Importing NumPy is slow,
+# so it is only done on first use, by GetNumPy.
+numpy = None
+numpy_lock = threading.Lock()
+
+def GetNumPy():
+    global numpy
+
+    with numpy_lock:
+        if numpy is None:
+            import_start = time.time()
+
+            try:
+                import numpy as module
+            except ImportError:
+                print("=== NumPy disabled, using TinyNumPy instead ===")
+                print("To enable cell evaluation using the full NumPy, download NumPy from:")
+                print("    https://pypi.python.org/pypi/numpy")
+                print("and install it into Sublime Text's Packages directory.")
+                print("For information on the features and limitations of TinyNumPy, visit:")
+                print("    https://github.com/wadetb/tinynumpy")
+                print("======================")
+                from tinynumpy import tinynumpy as module
+
+            numpy = module
+            print("Loaded {0} in {1:.0f} ms.".format(numpy.__name__, (time.time() - import_start) * 1000))
+
+        return numpy
+
+class SortDirection:
+    Ascending = 1
+    Descending = 2
+
+class ReversedText:
+    __slots__ = ('text',)
+
+    def __init__(self, text): self.text = text
+    def __lt__(self, other): return other.text < self.text
+    def __gt__(self, other): return other.text > self.text
+    def __eq__(self, other): return self.text == other.text
+
+class FormatMode:
+    Plain = 1
+    Compacted = 2
+    Expanded = 3
+
+class CSVValue:
+    __slots__ = ('text', 'first_char_index', 'last_char_index', 'float_text', 'float_value')
+
+    def __init__(self, text, first_char_index=0, last_char_index=0):
+        self.text = text
+        self.first_char_index = first_char_index
+        self.last_char_index = last_char_index
+
+        # The text float_value was parsed from, so the parse is redone if text is replaced.
+        self.float_text = None
+        self.float_value = None
+
+    def AsFloat(self):
+        if self.float_text is not self.text:
+            try:
+                self.float_value = float(self.text)
+            except ValueError:
+                self.float_value = None
+            self.float_text = self.text
+
+        return self.float_value is not None, self.float_value
+
+    def SortKey(self, direction=SortDirection.Ascending, reverse=False):
+        """ Returns a key that orders numbers numerically before text, and
+        text lexicographically, or the reverse of that for Descending.
+        Empty cells sort last either way; pass reverse if the keys will be
+        sorted in reverse, so they still do.
+        """
+        if not self.text.strip():
+            return (-1,) if reverse else (2,)
+
+        is_float, float_value = self.AsFloat()
+
+        # NaN doesn't order, so it is sorted as text.
+        if is_float and float_value == float_value:
+            if direction == SortDirection.Descending:
+                return (1, -float_value)
+            return (0, float_value)
+
+        if direction == SortDirection.Descending:
+            return (0, ReversedText(self.text))
+        return (1, self.text)
+
+    def Compare(self, other):
+        a_key = self.SortKey()
+        b_key = other.SortKey()
+
+        if a_key > b_key:
+            return 1
+        if a_key < b_key:
+            return -1
+        return 0
+
+    def __lt__(self, other): return self.Compare(other) < 0
+    def __eq__(self, other): return self.Compare(other) == 0
+
+class CSVTokenizer:
+    # A field is a run of unquoted text and quoted sections, ended by the
+    # delimiter, a newline or the end of the text.  Quoted sections may contain
+    # the delimiter, newlines and doubled quotes, and may be left unterminated.
+    # The expressions are compiled once per delimiter and shared.
+    FIELD_RE_CACHE = {}
+    FIELD_PATTERN = r'[^"{0}\n]*(?:"[^"]*(?:""[^"]*)*"?[^"{0}\n]*)*'
+
+    # Expressions matching the cell in a given column, by (delimiter,
+    # column_index, quoted).
+    CELL_RE_CACHE = {}
+
+    QUOTED_RE = re.compile(r'"([^"]*(?:""[^"]*)*)"?')
+
+    def __init__(self, delimiter, auto_quote):
+        self.delimiter = delimiter
+        self.auto_quote = auto_quote
+        self.field_re = CSVTokenizer.GetFieldRegex(delimiter)
+
+    @staticmethod
+    def GetFieldRegex(delimiter):
+        field_re = CSVTokenizer.FIELD_RE_CACHE.get(delimiter)
+        if field_re is None:
+            field_re = re.compile(CSVTokenizer.FIELD_PATTERN.format(re.escape(delimiter)))
+            CSVTokenizer.FIELD_RE_CACHE[delimiter] = field_re
+        return field_re
+
+    @staticmethod
+    def GetCellRegex(delimiter, column_index, quoted):
+        """ Returns an expression whose 'cell' group matches the cell in
+        column_index.  Without quotes, it finds each line that has the cell.
+        With quotes, each match consumes one whole record, so matches must be
+        made one after another from the start of a record; a record without
+        the cell leaves the group empty.
+        """
+        key = (delimiter, column_index, quoted)
+        cell_re = CSVTokenizer.CELL_RE_CACHE.get(key)
+        if cell_re is None:
+            d = re.escape(delimiter)
+            if not quoted:
+                cell_re = re.compile(r'^(?:[^{0}\n]*{0}){{{1}}}(?P<cell>[^{0}\n]*)'.format(d, column_index), re.MULTILINE)
+            else:
+                # Each field is matched as if by an atomic group, so a field
+                # can't backtrack to end inside its quotes.
+                field = CSVTokenizer.FIELD_PATTERN.format(d)
+                def atomic(name):
+                    return r'(?=(?P<{0}>{1}))(?P={0})'.format(name, field)
+                cell_re = re.compile(r'(?:(?:{0}{1}){{{2}}}{3}|{4})(?:{1}{5})*\n?'.format(
+                    atomic('skipped'), d, column_index, atomic('cell'), atomic('first'), atomic('rest')))
+            CSVTokenizer.CELL_RE_CACHE[key] = cell_re
+        return cell_re
+
+    @staticmethod
+    def Unquote(text):
+        return CSVTokenizer.QUOTED_RE.sub(lambda match: match.group(1).replace('""', '"'), text)
+
+    def QuoteText(self, text):
+        if not self.auto_quote:
+            return text
+        if self.delimiter in text or '"' in text or '\n' in text:
+            return '"' + text.replace('"', '""') + '"'
+        else:
+            return text
+
+    def SplitRow(self, row):
+        # Fast path for rows without quotes, where str.split does all the work.
+        columns = []
+
+        if row.endswith('\r'):
+            row = row[:-1]
+
+        first_char_index = 0
+        for text in row.split(self.delimiter):
+            last_char_index = first_char_index + len(text)
+            columns.append(CSVValue(text, first_char_index, last_char_index))
+            first_char_index = last_char_index + 1
+
+        return columns
+
+    def ParseRecord(self, text, start):
+        """ Parses the record beginning at start, which may span several lines
+        if it contains quoted newlines.  Returns the columns, with character
+        indices relative to start, and the index of the newline that ends the
+        record (or len(text)).
+        """
+        end = text.find('\n', start)
+        if end < 0:
+            end = len(text)
+
+        if text.find('"', start, end) < 0:
+            return self.SplitRow(text[start:end]), end
+
+        columns = []
+
+        match = self.field_re.match
+        unquote = self.auto_quote
+        delimiter = self.delimiter
+
+        first_char_index = start
+        while True:
+            last_char_index = match(text, first_char_index).end()
+
+            terminator = text[last_char_index:last_char_index + 1]
+            if terminator != delimiter and text[last_char_index - 1:last_char_index] == '\r':
+                value_end = last_char_index - 1
+            else:
+                value_end = last_char_index
+
+            # Without auto_quote the quotes are kept, so the raw text is the value.
+            value_text = text[first_char_index:value_end]
+            if unquote and '"' in value_text:
+                value_text = CSVTokenizer.Unquote(value_text)
+
+            columns.append(CSVValue(value_text, first_char_index - start, value_end - start))
+
+            if terminator != delimiter:
+                return columns, last_char_index
+            first_char_index = last_char_index + 1
+
+    def ParseRow(self, row):
+        return self.ParseRecord(row, 0)[0]
+
+    def ParseText(self, text):
+        """ Returns the rows of text and the buffer position each one starts at. """
+        rows = []
+        row_offsets = []
+
+        if '"' not in text:
+            split_row = self.SplitRow
+            offset = 0
+            for line in text.split("\n"):
+                rows.append(split_row(line))
+                row_offsets.append(offset)
+                offset += len(line) + 1
+            return rows, row_offsets
+
+        parse_record = self.ParseRecord
+        text_length = len(text)
+        start = 0
+        while True:
+            row, end = parse_record(text, start)
+            rows.append(row)
+            row_offsets.append(start)
+            if end >= text_length:
+                return rows, row_offsets
+            start = end + 1
+
+    def ParseTextCompact(self, text):
+        """ Like ParseText, but returns the rows as a CSVCompactRows, which only
+        stores the buffer positions of each cell.
+        """
+        typecode = 'I' if len(text) < 1 << 32 else 'Q'
+        row_offsets = array.array(typecode)
+        cell_starts = array.array(typecode, [0])
+        firsts = array.array(typecode)
+        lasts = array.array(typecode)
+
+        delimiter = self.delimiter
+        parse_record = self.ParseRecord
+        text_length = len(text)
+        start = 0
+        while True:
+            end = text.find('\n', start)
+            if end < 0:
+                end = text_length
+
+            if text.find('"', start, end) < 0:
+                line_end = end
+                if line_end > start and text[line_end - 1] == '\r':
+                    line_end -= 1
+
+                first_char_index = start
+                for cell_text in text[start:line_end].split(delimiter):
+                    last_char_index = first_char_index + len(cell_text)
+                    firsts.append(first_char_index)
+                    lasts.append(last_char_index)
+                    first_char_index = last_char_index + 1
+
+            else:
+                row, end = parse_record(text, start)
+                for value in row:
+                    firsts.append(start + value.first_char_index)
+                    lasts.append(start + value.last_char_index)
+
+            row_offsets.append(start)
+            cell_starts.append(len(firsts))
+
+            if end >= text_length:
+                return CSVCompactRows(self, text, row_offsets, cell_starts, firsts, lasts), row_offsets
+            start = end + 1
+
+    def FindRecordOffsets(self, text):
+        """ Returns the buffer position each record of text starts at,
+        without tokenizing the records.  A newline ends a record unless an odd
+        number of quotes come before it in the record.
+        """
+        lines = text.split('\n')
+        line_offsets = GetLineOffsets(lines)
+
+        if '"' not in text:
+            return line_offsets
+
+        # A record that opens a quote on one line continues up to the next
+        # line that closes it, both having an odd number of quotes.
+        odd_line_indices = [line_index for line_index, line in enumerate(lines) if '"' in line and line.count('"') & 1]
+        odd_line_indices.append(len(lines) - 1)
+
+        record_offsets = []
+        next_line_index = 0
+        for first_line_index, last_line_index in zip(odd_line_indices[0::2], odd_line_indices[1::2]):
+            record_offsets.extend(line_offsets[next_line_index:first_line_index + 1])
+            next_line_index = last_line_index + 1
+        record_offsets.extend(line_offsets[next_line_index:])
+
+        return record_offsets
+
+class CSVCompactRows:
+    """ Row storage for large buffers.  Instead of a list of CSVValue lists,
+    it keeps the buffer text and, in flat arrays, where each cell starts and
+    ends in it.  CSVValue objects are created only when a cell is accessed.
+
+    It behaves like the list of rows used otherwise: rows can be indexed,
+    sliced, iterated, sorted and appended to, and each row behaves like a
+    list of CSVValues.  A row that is modified is converted to a real list
+    and kept in overrides.
+    """
+    # Rough cost in bytes of one parsed cell, as a list of CSVValues.
+    CELL_SIZE = 200
+
+    def __init__(self, tokenizer, text, row_offsets, cell_starts, firsts, lasts):
+        self.tokenizer = tokenizer
+        self.text = text
+        self.row_offsets = row_offsets
+        self.cell_starts = cell_starts
+        self.firsts = firsts
+        self.lasts = lasts
+
+        # Position in the matrix -> parsed row index.
+        self.order = array.array(row_offsets.typecode, range(len(row_offsets)))
+
+        # Parsed row index -> list of CSVValues, for modified and added rows.
+        self.overrides = {}
+        self.next_row_index = len(row_offsets)
+
+    def Copy(self):
+        rows = CSVCompactRows(self.tokenizer, self.text, self.row_offsets, self.cell_starts, array.array(self.firsts.typecode, self.firsts), array.array(self.lasts.typecode, self.lasts))
+        rows.order = array.array(self.order.typecode, self.order)
+        rows.overrides = dict((row_index, list(row)) for row_index, row in self.overrides.items())
+        rows.next_row_index = self.next_row_index
+        return rows
+
+    def GetMemoryUsage(self):
+        arrays = (self.row_offsets, self.cell_starts, self.firsts, self.lasts, self.order)
+        return sum(len(a) * a.itemsize for a in arrays) + self.CELL_SIZE * sum(len(row) for row in self.overrides.values())
+
+    def GetCellCount(self, row_index):
+        return self.cell_starts[row_index + 1] - self.cell_starts[row_index]
+
+    def GetCell(self, row_index, cell_index):
+        first_char_index = self.firsts[cell_index]
+        last_char_index = self.lasts[cell_index]
+
+        text = self.text[first_char_index:last_char_index]
+        if self.tokenizer.auto_quote and '"' in text:
+            text = CSVTokenizer.Unquote(text)
+
+        row_offset = self.row_offsets[row_index]
+        return CSVValue(text, first_char_index - row_offset, last_char_index - row_offset)
+
+    def GetCells(self, row_index):
+        cells = self.overrides.get(row_index)
+        if cells is not None:
+            return cells
+
+        get_cell = self.GetCell
+        return [get_cell(row_index, cell_index) for cell_index in range(self.cell_starts[row_index], self.cell_starts[row_index + 1])]
+
+    def Materialize(self, row_index):
+        cells = self.overrides.get(row_index)
+        if cells is None:
+            cells = self.GetCells(row_index)
+            self.overrides[row_index] = cells
+        return cells
+
+    def AddRow(self, cells):
+        row_index = self.next_row_index
+        self.next_row_index += 1
+        self.overrides[row_index] = list(cells)
+        return row_index
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CSVCompactRow(self, row_index) for row_index in self.order[index]]
+        return CSVCompactRow(self, self.order[index])
+
+    def __setitem__(self, index, rows):
+        if isinstance(index, slice):
+            self.order[index] = array.array(self.order.typecode, [self.GetRowIndex(row) for row in rows])
+        else:
+            self.order[index] = self.GetRowIndex(rows)
+
+    def __iter__(self):
+        for row_index in self.order:
+            yield CSVCompactRow(self, row_index)
+
+    def GetRowIndex(self, row):
+        if isinstance(row, CSVCompactRow) and row.rows is self:
+            return row.row_index
+        return self.AddRow(row)
+
+    def append(self, row):
+        self.order.append(self.GetRowIndex(row))
+
+    def sort(self, key=None, reverse=False):
+        self[:] = sorted(self, key=key, reverse=reverse)
+
+    def InsertColumn(self, column_index):
+        self.RebuildCells(lambda begin, end: self.InsertCell(begin, end, column_index))
+
+        for cells in self.overrides.values():
+            if column_index <= len(cells):
+                cells.insert(column_index, CSVValue(''))
+
+    def DeleteColumn(self, column_index):
+        self.RebuildCells(lambda begin, end: self.DeleteCell(begin, end, column_index))
+
+        for cells in self.overrides.values():
+            if column_index < len(cells):
+                cells.pop(column_index)
+
+    def InsertCell(self, begin, end, column_index):
+        cell_count = end - begin
+        if column_index > cell_count:
+            return self.firsts[begin:end], self.lasts[begin:end]
+
+        # The new cell is empty and sits where the cell it displaces began.
+        if column_index < cell_count:
+            point = self.firsts[begin + column_index]
+        else:
+            point = self.lasts[end - 1]
+
+        split = begin + column_index
+        firsts = self.firsts[begin:split]
+        firsts.append(point)
+        firsts.extend(self.firsts[split:end])
+        lasts = self.lasts[begin:split]
+        lasts.append(point)
+        lasts.extend(self.lasts[split:end])
+        return firsts, lasts
+
+    def DeleteCell(self, begin, end, column_index):
+        if column_index >= end - begin:
+            return self.firsts[begin:end], self.lasts[begin:end]
+
+        split = begin + column_index
+        firsts = self.firsts[begin:split]
+        firsts.extend(self.firsts[split + 1:end])
+        lasts = self.lasts[begin:split]
+        lasts.extend(self.lasts[split + 1:end])
+        return firsts, lasts
+
+    def RebuildCells(self, rebuild_row):
+        typecode = self.firsts.typecode
+        cell_starts = array.array(typecode, [0])
+        firsts = array.array(typecode)
+        lasts = array.array(typecode)
+
+        for row_index in range(len(self.cell_starts) - 1):
+            begin = self.cell_starts[row_index]
+            end = self.cell_starts[row_index + 1]
+
+            if row_index not in self.overrides:
+                row_firsts, row_lasts = rebuild_row(begin, end)
+                firsts.extend(row_firsts)
+                lasts.extend(row_lasts)
+
+            cell_starts.append(len(firsts))
+
+        self.cell_starts = cell_starts
+        self.firsts = firsts
+        self.lasts = lasts
+
+class CSVCompactRow:
+    """ A row of a CSVCompactRows, which behaves like a list of CSVValues. """
+    __slots__ = ('rows', 'row_index')
+
+    def __init__(self, rows, row_index):
+        self.rows = rows
+        self.row_index = row_index
+
+    def __len__(self):
+        cells = self.rows.overrides.get(self.row_index)
+        if cells is not None:
+            return len(cells)
+        return self.rows.GetCellCount(self.row_index)
+
+    def __getitem__(self, index):
+        cells = self.rows.overrides.get(self.row_index)
+        if cells is not None:
+            return cells[index]
+
+        cell_count = self.rows.GetCellCount(self.row_index)
+        if isinstance(index, slice):
+            begin = self.rows.cell_starts[self.row_index]
+            return [self.rows.GetCell(self.row_index, begin + i) for i in range(*index.indices(cell_count))]
+
+        if index < 0:
+            index += cell_count
+        if index < 0 or index >= cell_count:
+            raise IndexError('cell index out of range')
+        return self.rows.GetCell(self.row_index, self.rows.cell_starts[self.row_index] + index)
+
+    def __iter__(self):
+        return iter(self.rows.GetCells(self.row_index))
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    # Modifying a row converts it to a list of CSVValues.
+    def __setitem__(self, index, value): self.rows.Materialize(self.row_index)[index] = value
+    def __delitem__(self, index): del self.rows.Materialize(self.row_index)[index]
+    def append(self, value): self.rows.Materialize(self.row_index).append(value)
+    def insert(self, index, value): self.rows.Materialize(self.row_index).insert(index, value)
+    def pop(self, index=-1): return self.rows.Materialize(self.row_index).pop(index)
+
+class CSVLazyRows:
+    """ Row storage for commands that look at only part of a large buffer.
+    Only where each record starts is found up front; a row is tokenized when
+    it is first accessed.  Rows are read-only.
+    """
+    def __init__(self, tokenizer, text):
+        self.tokenizer = tokenizer
+        self.text = text
+        self.row_offsets = tokenizer.FindRecordOffsets(text)
+        self.parsed_rows = {}
+
+    def __len__(self):
+        return len(self.row_offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[row_index] for row_index in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        row = self.parsed_rows.get(index)
+        if row is None:
+            row = self.tokenizer.ParseRecord(self.text, self.row_offsets[index])[0]
+            self.parsed_rows[index] = row
+        return row
+
+    def __iter__(self):
+        for row_index in range(len(self)):
+            yield self[row_index]
+
+    def GetColumnSpans(self, column_index):
+        """ Yields the (begin, end) buffer positions of the cell in
+        column_index of each row that has one.  The cells are found by one
+        regular expression over the text, without tokenizing the rows.
+        """
+        text = self.text
+        delimiter = self.tokenizer.delimiter
+        quoted = '"' in text
+        has_cr = '\r' in text
+
+        cell_re = CSVTokenizer.GetCellRegex(delimiter, column_index, quoted)
+        matches = cell_re.finditer(text)
+        if quoted:
+            # The expression also matches the empty text after the last record.
+            matches = itertools.islice(matches, len(self.row_offsets))
+
+        for match in matches:
+            begin, end = match.span('cell')
+            if begin < 0:
+                continue
+
+            # As in ParseRecord, a CRLF line ending is not part of the last cell.
+            if has_cr and text[end - 1:end] == '\r' and text[end:end + 1] != delimiter:
+                end -= 1
+
+            yield begin, end
+
+def GetLineOffsets(lines):
+    """ Returns where each of lines starts in the text they were split from
+    at newlines.
+    """
+    line_offsets = [0]
+    line_offsets.extend(itertools.accumulate(len(line) + 1 for line in lines))
+    line_offsets.pop()
+    return line_offsets
+
+class CSVFormula:
+    def __init__(self, row_index, column_index, value, expression_match):
+        self.row_index = row_index
+        self.column_index = column_index
+        self.value = value
+        self.expression_match = expression_match
+
+        # Filled in by CSVMatrix.AnalyzeFormula, as (row_begin, row_end,
+        # column_begin, column_end) ranges.
+        self.target_range = None
+        self.read_ranges = None
+
+        self.has_dependents = False
+
+class CSVMatrix:
+    def __init__(self, tokenizer):
+        self.rows = []
+        self.row_offsets = []
+        self.text = ''
+        self.num_columns = 0
+        self.valid = False
+
+        self.tokenizer = tokenizer
+        self.delimiter = tokenizer.delimiter
+        self.auto_quote = tokenizer.auto_quote
+
+        # Buffer edits made by InsertColumn, DeleteColumn and
+        # DeleteTrailingColumns, as [begin, end, text] lists in buffer order.
+        self.edits = []
+
+        # Rows whose cells were changed by Evaluate.
+        self.modified_row_indices = set()
+
+        # Whether cells were added, removed or replaced since parsing.
+        self.rows_changed = False
+
+        # Whether the rows are shared, as with a parse cache, and must be
+        # copied before they are modified; see ClaimRows.
+        self.rows_shared = False
+
+        # Called with the fraction done of long operations; see ReportProgress.
+        self.progress = None
+        self.progress_stage = (0.0, 1.0)
+
+    @staticmethod
+    def ResolveDelimiter(settings, delimiter, filename, dialect=None):
+        # Second highest priority: filename-based matching
+        if not delimiter:
+            if filename:
+                delimiter_mapping = settings.get('delimiter_mapping', {})
+                for k, v in delimiter_mapping.items():
+                    if fnmatch.fnmatch(filename, k):
+                        delimiter = v
+                        break
+
+        # Third priority: detected from a sample of the text.
+        if not delimiter and dialect:
+            delimiter = dialect['delimiter']
+
+        # Final priority: user or system setting, fallback to comma. 
+        if not delimiter:
+            delimiter = settings.get('delimiter', ',')
+
+        # Special case for recognizing '\t' for tabs.
+        if delimiter == '\\t':
+            delimiter = '\t'
+
+        if not isstr(delimiter) or len(delimiter) != 1:
+            print("'{0}' is not a valid delimiter, reverting to ','.".format(delimiter))
+            delimiter = ','
+
+        return delimiter
+
+    # Characters at the start of a buffer sampled to detect its dialect.
+    DIALECT_SAMPLE_SIZE = 8192
+
+    DELIMITER_CANDIDATES = [',', '\t', ';', '|']
+
+    @staticmethod
+    def DetectDialect(sample, truncated=False):
+        """ Returns the dialect of the text that sample starts, as a dict with
+        the 'delimiter' (None if no candidate splits the rows) and whether it
+        'has_header'.  Returns None for an empty sample.
+
+        Each candidate delimiter is scored by how many rows of the sample have
+        its most common column count; more columns break ties.
+        """
+        if truncated:
+            # The last record may be cut short.
+            end = sample.rfind('\n')
+            if end > 0:
+                sample = sample[:end]
+
+        best_score = None
+        best_rows = None
+        delimiter = None
+        for candidate in CSVMatrix.DELIMITER_CANDIDATES:
+            rows, row_offsets = CSVTokenizer(candidate, True).ParseText(sample)
+            rows = [row for row in rows if len(row) > 1 or row[0].text]
+            if not rows:
+                return None
+
+            column_count, row_count = collections.Counter(len(row) for row in rows).most_common(1)[0]
+            if column_count < 2:
+                continue
+
+            score = (float(row_count) / len(rows), column_count)
+            if best_score is None or score > best_score:
+                best_score = score
+                best_rows = [row for row in rows if len(row) == column_count]
+                delimiter = candidate
+
+        if best_rows is None:
+            best_rows = rows
+
+        return {'delimiter': delimiter, 'has_header': CSVMatrix.DetectHeader(best_rows)}
+
+    @staticmethod
+    def DetectHeader(rows):
+        """ Guesses whether the first row is a header, by voting on each
+        column: a header cell differs in type from a numeric column, or in
+        length from a column whose cells all have one length.
+        """
+        if len(rows) < 2:
+            return False
+
+        votes = 0
+        for column_index, header_value in enumerate(rows[0]):
+            values = [row[column_index] for row in rows[1:] if column_index < len(row) and row[column_index].text]
+            if not values:
+                continue
+
+            numeric_count = sum(1 for value in values if value.AsFloat()[0])
+            if numeric_count * 2 > len(values):
+                votes += -1 if header_value.AsFloat()[0] else 1
+            else:
+                lengths = set(len(value.text) for value in values)
+                if len(lengths) == 1:
+                    votes += -1 if len(header_value.text) in lengths else 1
+
+        return votes > 0
+
+    def ClaimRows(self):
+        """ Copies the rows if they are shared, so they can be modified. """
+        if not self.rows_shared:
+            return
+
+        if isinstance(self.rows, CSVCompactRows):
+            self.rows = self.rows.Copy()
+        else:
+            self.rows = [list(row) for row in self.rows]
+        self.rows_shared = False
+
+    def AddRow(self, row):
+        self.ClaimRows()
+        self.rows.append(row)
+        self.rows_changed = True
+
+    def Finalize(self):
+        if not len(self.rows):
+            return
+
+        self.num_columns = 0
+        for row in self.rows:
+            if len(row) > self.num_columns:
+                self.num_columns = len(row)
+
+        self.valid = True
+
+    @staticmethod
+    def GetCellValue(row, column_index):
+        try:
+            return row[column_index]
+        except IndexError:
+            return CSVValue('')
+
+    # Rows processed between progress reports.
+    PROGRESS_INTERVAL = 4096
+
+    def ReportProgress(self, done, total):
+        """ Reports done out of total of the current stage to self.progress,
+        which may raise CSVTaskCancelled to stop the operation.
+        """
+        if self.progress:
+            begin, end = self.progress_stage
+            self.progress(begin + (end - begin) * done / float(total or 1))
+
+    def BeginProgressStage(self, begin, end):
+        """ Narrows progress reports to the [begin, end] fraction of the
+        current stage, returning the stage to restore afterwards.
+        """
+        stage = self.progress_stage
+        outer_begin, outer_end = stage
+        width = outer_end - outer_begin
+        self.progress_stage = (outer_begin + width * begin, outer_begin + width * end)
+        return stage
+
+    def SortByColumn(self, column_index, direction, use_header):
+        self.SortByColumns([(column_index, direction)], use_header)
+
+    def SortByColumns(self, sort_keys, use_header):
+        """ Sorts rows by a list of (column_index, direction) keys, most
+        significant first, in a single stable sort.  Each row's key is
+        computed once.
+        """
+        get_cell_value = CSVMatrix.GetCellValue
+
+        # With a single direction, sort ascending keys and let the sort reverse
+        # them; this is stable too.  Otherwise the keys encode the direction.
+        self.ClaimRows()
+
+        directions = set(direction for column_index, direction in sort_keys)
+        if len(directions) == 1:
+            reverse = SortDirection.Descending in directions
+            sort_keys = [(column_index, SortDirection.Ascending) for column_index, direction in sort_keys]
+        else:
+            reverse = False
+
+        if len(sort_keys) == 1:
+            column_index, direction = sort_keys[0]
+            key = lambda row: get_cell_value(row, column_index).SortKey(direction, reverse)
+        else:
+            key = lambda row: tuple([get_cell_value(row, column_index).SortKey(direction, reverse) for column_index, direction in sort_keys])
+
+        if self.progress:
+            # The sort computes every key before comparing any, so count them.
+            row_key = key
+            row_count = len(self.rows)
+            key_count = [0]
+
+            def key(row):
+                key_count[0] += 1
+                if key_count[0] % CSVMatrix.PROGRESS_INTERVAL == 0:
+                    self.ReportProgress(key_count[0], row_count)
+                return row_key(row)
+
+        if use_header:
+            self.rows[1:] = sorted(self.rows[1:], key=key, reverse=reverse)
+        else:
+            self.rows.sort(key=key, reverse=reverse)
+
+    def InsertColumn(self, column_index):
+        self.ClaimRows()
+        parsed_row_count = len(self.row_offsets)
+        self.rows_changed = True
+
+        for row_index, row in enumerate(self.rows):
+            if column_index <= len(row):
+                if row_index < parsed_row_count and row:
+                    if column_index < len(row):
+                        point = self.row_offsets[row_index] + row[column_index].first_char_index
+                        self.edits.append([point, point, self.delimiter])
+                    elif self.text.count('"', self.row_offsets[row_index], self.row_offsets[row_index] + row[-1].last_char_index) % 2:
+                        # The row ends inside an unterminated quote, rewrite it.
+                        begin, end = self.GetRowRegion(row_index)
+                        self.edits.append([begin, end, self.FormatRow(row + [CSVValue('')], FormatMode.Plain)])
+                    else:
+                        point = self.row_offsets[row_index] + row[-1].last_char_index
+                        self.edits.append([point, point, self.delimiter])
+
+        if isinstance(self.rows, CSVCompactRows):
+            self.rows.InsertColumn(column_index)
+        else:
+            for row in self.rows:
+                if column_index <= len(row):
+                    row.insert(column_index, CSVValue(''))
+
+    def DeleteColumn(self, column_index):
+        self.ClaimRows()
+        parsed_row_count = len(self.row_offsets)
+        self.rows_changed = True
+
+        for row_index, row in enumerate(self.rows):
+            if column_index < len(row):
+                if row_index < parsed_row_count:
+                    offset = self.row_offsets[row_index]
+
+                    # Remove the cell along with one of its delimiters.
+                    if len(row) == 1:
+                        begin, end = row[0].first_char_index, row[0].last_char_index
+                    elif column_index < len(row) - 1:
+                        begin, end = row[column_index].first_char_index, row[column_index + 1].first_char_index
+                    else:
+                        begin, end = row[column_index - 1].last_char_index, row[column_index].last_char_index
+                    self.edits.append([offset + begin, offset + end, ''])
+
+        if isinstance(self.rows, CSVCompactRows):
+            self.rows.DeleteColumn(column_index)
+        else:
+            for row in self.rows:
+                if column_index < len(row):
+                    row.pop(column_index)
+
+    def DeleteTrailingColumns(self, column_index):
+        self.ClaimRows()
+        parsed_row_count = len(self.row_offsets)
+        self.rows_changed = True
+
+        row_count = len(self.rows)
+
+        for row_index, row in enumerate(self.rows):
+            if row_index % CSVMatrix.PROGRESS_INTERVAL == 0:
+                self.ReportProgress(row_index, row_count)
+
+            last_column_index = 0
+
+            for column_index, value in enumerate(row):
+                if len(value.text.strip()) > 0:
+                    last_column_index = column_index
+
+            first_empty_column_index = last_column_index + 1
+
+            if row_index < parsed_row_count and first_empty_column_index < len(row):
+                offset = self.row_offsets[row_index]
+                begin = row[last_column_index].last_char_index
+                end = row[-1].last_char_index
+                self.edits.append([offset + begin, offset + end, ''])
+
+            del row[first_empty_column_index:]
+
+    def GetRowRegion(self, row_index):
+        begin = self.row_offsets[row_index]
+
+        if row_index + 1 < len(self.row_offsets):
+            end = self.row_offsets[row_index + 1] - 1
+        else:
+            end = len(self.text)
+
+        # The tokenizer leaves CRLF line endings out of the row.
+        if end > begin and self.text[end - 1] == '\r':
+            end -= 1
+
+        return begin, end
+
+    def GetRowEdits(self, mode, row_indices=None):
+        """ Returns edits that replace each parsed row whose formatted text
+        differs from the buffer, and append any rows added since parsing.
+        """
+        stage = self.progress_stage
+        if mode == FormatMode.Expanded:
+            self.BeginProgressStage(0.0, 0.3)
+            self.MeasureColumns()
+            self.progress_stage = stage
+            self.BeginProgressStage(0.3, 1.0)
+
+        if row_indices is None:
+            row_indices = range(len(self.rows))
+        row_count = len(row_indices)
+
+        edits = []
+
+        text = self.text
+        format_row = self.FormatRow
+        parsed_row_count = len(self.row_offsets)
+
+        for count, row_index in enumerate(row_indices):
+            if row_index >= parsed_row_count:
+                break
+
+            if count % CSVMatrix.PROGRESS_INTERVAL == 0:
+                self.ReportProgress(count, row_count)
+
+            begin, end = self.GetRowRegion(row_index)
+            row_text = format_row(self.rows[row_index], mode)
+
+            if end - begin != len(row_text) or not text.startswith(row_text, begin):
+                edits.append([begin, end, row_text])
+
+        if len(self.rows) > parsed_row_count:
+            added_rows = [format_row(row, mode) for row in self.rows[parsed_row_count:]]
+            edits.append([len(text), len(text), '\n' + '\n'.join(added_rows)])
+
+        self.progress_stage = stage
+
+        return self.CoalesceEdits(edits)
+
+    def GetEdits(self):
+        return self.CoalesceEdits(self.edits)
+
+    # Past this many edits, one larger replacement is cheaper to apply than
+    # many small ones.
+    MAX_BUFFER_EDITS = 10000
+
+    def CoalesceEdits(self, edits):
+        if len(edits) <= CSVMatrix.MAX_BUFFER_EDITS:
+            return edits
+
+        parts = []
+        position = edits[0][0]
+        for begin, end, text in edits:
+            parts.append(self.text[position:begin])
+            parts.append(text)
+            position = end
+
+        return [[edits[0][0], position, ''.join(parts)]]
+
+    def GetEditedText(self, edits):
+        """ Returns the text with edits applied. """
+        parts = []
+        position = 0
+        for begin, end, text in edits:
+            parts.append(self.text[position:begin])
+            parts.append(text)
+            position = end
+        parts.append(self.text[position:])
+
+        return ''.join(parts)
+
+    def GetColumnSpans(self, column_index):
+        """ Yields the (begin, end) buffer positions of the cell in
+        column_index of each parsed row that has one.
+        """
+        if isinstance(self.rows, CSVLazyRows):
+            for span in self.rows.GetColumnSpans(column_index):
+                yield span
+            return
+
+        for offset, row in zip(self.row_offsets, self.rows):
+            if column_index < len(row):
+                value = row[column_index]
+                yield offset + value.first_char_index, offset + value.last_char_index
+
+    def QuoteText(self, text):
+        return self.tokenizer.QuoteText(text)
+
+    def MeasureColumns(self):
+        self.column_widths = [0] * self.num_columns
+
+        quote_text = self.tokenizer.QuoteText
+        column_widths = self.column_widths
+        row_count = len(self.rows)
+
+        for row_index, row in enumerate(self.rows):
+            if row_index % CSVMatrix.PROGRESS_INTERVAL == 0:
+                self.ReportProgress(row_index, row_count)
+
+            # Rows may have grown since Finalize, e.g. after InsertColumn.
+            if len(row) > len(column_widths):
+                column_widths.extend([0] * (len(row) - len(column_widths)))
+
+            for column_index, value in enumerate(row):
+                width = len(quote_text(value.text))
+
+                if width > column_widths[column_index]:
+                    column_widths[column_index] = width
+
+    def FormatRow(self, row, mode):
+        quote_text = self.tokenizer.QuoteText
+
+        if mode == FormatMode.Compacted:
+            cells = [quote_text(value.text.strip()) for value in row]
+        elif mode == FormatMode.Expanded:
+            cells = [quote_text(value.text).ljust(column_width) for value, column_width in zip(row, self.column_widths)]
+        else:
+            cells = [quote_text(value.text) for value in row]
+
+        return self.delimiter.join(cells)
+
+    def FormatRows(self, mode):
+        if mode == FormatMode.Expanded:
+            self.MeasureColumns()
+
+        format_row = self.FormatRow
+        for row in self.rows:
+            yield format_row(row, mode)
+
+    def FormatText(self, mode):
+        # Rows are produced one at a time and joined once, which keeps the
+        # work linear in the size of the output.
+        return '\n'.join(self.FormatRows(mode))
+
+    def Format(self):
+        return self.FormatText(FormatMode.Plain)
+
+    def FormatCompacted(self):
+        return self.FormatText(FormatMode.Compacted)
+
+    def FormatExpanded(self):
+        return self.FormatText(FormatMode.Expanded)
+
+    def ParseRow(self, row):
+        return self.tokenizer.ParseRow(row)
+
+    @staticmethod
+    def FromText(text, tokenizer):
+        matrix = CSVMatrix(tokenizer)
+
+        matrix.text = text
+        matrix.rows, matrix.row_offsets = tokenizer.ParseText(text)
+
+        matrix.Finalize()
+
+        return matrix
+
+    def GetColumnIndexFromPoint(self, point):
+        # Rows may span several lines, so locate the point by buffer position.
+        row_index = bisect.bisect_right(self.row_offsets, point) - 1
+        col_index = point - self.row_offsets[row_index]
+
+        if row_index < len(self.rows):
+            row = self.rows[row_index]
+
+            for column_index, value in enumerate(row):
+                if value.first_char_index > col_index:
+                    return column_index - 1
+
+            return len(row) - 1
+
+        else:
+            return 0
+
+    EXPRESSION_RE = re.compile(r'''
+        \s*
+        (\[
+            (?P<row_begin_mod>[+-])?
+            (?P<row_begin>\d+)?
+            (?P<row_delim>:)?
+            (?P<row_end_mod>[+-])?
+            (?P<row_end>\d+)?
+            (?P<comma>,)?
+            (?P<column_begin_mod>[+-])?
+            (?P<column_begin>\d+)?
+            (?P<column_delim>:)?
+            (?P<column_end_mod>[+-])?
+            (?P<column_end>\d+)?
+        \])?
+        \s*
+        (?P<direction>[<>v^])?
+        \s*
+        =
+        \s*
+        (?P<expression>.+)
+        ''', re.VERBOSE)
+
+    def ApplyModifier(self, value, mod, base_value):
+        if mod == '+':
+            return base_value + value
+        elif mod == '-':
+            return base_value - value
+        else:
+            return value
+
+    def GetCoordinateRange(self, begin_mod, begin, delim, end_mod, end, base_value):
+        if delim:
+            if begin is None:
+                begin = 0
+            else:
+                begin = self.ApplyModifier(int(begin), begin_mod, base_value)
+            if end is None:
+                end = len(self.rows)
+            else:
+                end = self.ApplyModifier(int(end), end_mod, base_value)
+        else:
+            if begin is None:
+                begin = base_value
+                end = base_value + 1
+            else:
+                begin = self.ApplyModifier(int(begin), begin_mod, base_value)
+                end = begin + 1
+
+        return (begin, end)
+
+    def GetRowColumnCoordinateRange(self, coordinate_match, base_row_index, base_column_index):
+        row_begin_mod = coordinate_match.group('row_begin_mod')
+        row_begin = coordinate_match.group('row_begin')
+        row_delim = coordinate_match.group('row_delim')
+        row_end_mod = coordinate_match.group('row_end_mod')
+        row_end = coordinate_match.group('row_end')
+
+        row_range = self.GetCoordinateRange(row_begin_mod, row_begin, row_delim, row_end_mod, row_end, base_row_index)
+
+        column_begin_mod = coordinate_match.group('column_begin_mod')
+        column_begin = coordinate_match.group('column_begin')
+        column_delim = coordinate_match.group('column_delim')
+        column_end_mod = coordinate_match.group('column_end_mod')
+        column_end = coordinate_match.group('column_end')
+
+        column_range = self.GetCoordinateRange(column_begin_mod, column_begin, column_delim, column_end_mod, column_end, base_column_index)
+
+        return (row_range[0], row_range[1], column_range[0], column_range[1])
+
+    def ApplyDirectionOffsetToRange(self, direction_match, coord_range):
+        direction = direction_match.group('direction')
+
+        if direction == '^':
+            return (coord_range[0] - 1, coord_range[1] - 1, coord_range[2], coord_range[3])
+        elif direction == 'v':
+            return (coord_range[0] + 1, coord_range[1] + 1, coord_range[2], coord_range[3])
+        elif direction == '<':
+            return (coord_range[0], coord_range[1], coord_range[2] - 1, coord_range[3] - 1)
+        elif direction == '>':
+            return (coord_range[0], coord_range[1], coord_range[2] + 1, coord_range[3] + 1)
+        else:
+            return coord_range
+
+    # Compiled expressions by source text, shared across evaluations.
+    EXPRESSION_CACHE = {}
+    EXPRESSION_CACHE_LIMIT = 1000
+
+    TARGET_NAMES = frozenset(['row', 'col'])
+
+    @staticmethod
+    def UsesNames(code, names):
+        if not names.isdisjoint(code.co_names) or not names.isdisjoint(code.co_varnames):
+            return True
+        for const in code.co_consts:
+            if hasattr(const, 'co_names') and CSVMatrix.UsesNames(const, names):
+                return True
+        return False
+
+    @staticmethod
+    def CompileExpression(expression):
+        """ Returns (code, uses_target, references) for an expression, where
+        uses_target is whether it reads the target cell's row or col, and
+        references is as returned by GetExpressionReferences.
+        """
+        compiled = CSVMatrix.EXPRESSION_CACHE.get(expression)
+        if compiled is None:
+            code = compile(expression, '<string>', 'eval')
+            compiled = (code, CSVMatrix.UsesNames(code, CSVMatrix.TARGET_NAMES), CSVMatrix.GetExpressionReferences(expression))
+
+            if len(CSVMatrix.EXPRESSION_CACHE) >= CSVMatrix.EXPRESSION_CACHE_LIMIT:
+                CSVMatrix.EXPRESSION_CACHE.clear()
+            CSVMatrix.EXPRESSION_CACHE[expression] = compiled
+
+        return compiled
+
+    @staticmethod
+    def GetSubscriptIndices(node):
+        if type(node).__name__ == 'Index':
+            node = node.value
+        if type(node).__name__ == 'ExtSlice':
+            return [dim.value if type(dim).__name__ == 'Index' else dim for dim in node.dims]
+        if isinstance(node, ast.Tuple):
+            return list(node.elts)
+        return [node]
+
+    @staticmethod
+    def CompileIndexNode(node):
+        if node is None:
+            return None
+        return compile(ast.fix_missing_locations(ast.Expression(body=node)), '<string>', 'eval')
+
+    @staticmethod
+    def GetIndexReference(node):
+        """ Classifies one index of an m[...] subscript as:
+            ('slice', lower code, upper code)
+            ('value', code)
+            ('target', name, sign, offset code), for row or col plus or minus an offset
+            ('all',), when the index can't be bounded
+        """
+        if isinstance(node, ast.Slice):
+            if node.step is not None:
+                return ('all',)
+            return ('slice', CSVMatrix.CompileIndexNode(node.lower), CSVMatrix.CompileIndexNode(node.upper))
+
+        names = set(child.id for child in ast.walk(node) if isinstance(child, ast.Name))
+
+        if names.isdisjoint(CSVMatrix.TARGET_NAMES) and 'm' not in names:
+            return ('value', CSVMatrix.CompileIndexNode(node))
+
+        if isinstance(node, ast.Name) and node.id in CSVMatrix.TARGET_NAMES:
+            return ('target', node.id, 1, None)
+
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub)):
+            left, right = node.left, node.right
+            if isinstance(left, ast.Name) and left.id in CSVMatrix.TARGET_NAMES:
+                target, offset = left, right
+                sign = 1 if isinstance(node.op, ast.Add) else -1
+            elif isinstance(right, ast.Name) and right.id in CSVMatrix.TARGET_NAMES and isinstance(node.op, ast.Add):
+                target, offset = right, left
+                sign = 1
+            else:
+                return ('all',)
+
+            offset_names = set(child.id for child in ast.walk(offset) if isinstance(child, ast.Name))
+            if offset_names.isdisjoint(CSVMatrix.TARGET_NAMES) and 'm' not in offset_names:
+                return ('target', target.id, sign, CSVMatrix.CompileIndexNode(offset))
+
+        return ('all',)
+
+    @staticmethod
+    def GetExpressionReferences(expression):
+        """ Returns the m[...] subscripts in an expression, as lists of index
+        references, or None if m is used in a way whose reads can't be
+        bounded, such as m.sum().
+        """
+        try:
+            tree = ast.parse(expression, mode='eval')
+        except SyntaxError:
+            return []
+
+        references = []
+        m_count = 0
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node.id == 'm':
+                m_count += 1
+            elif isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == 'm':
+                references.append([CSVMatrix.GetIndexReference(index) for index in CSVMatrix.GetSubscriptIndices(node.slice)])
+
+        if m_count != len(references):
+            return None
+
+        return references
+
+    @staticmethod
+    def ResolveIndexReference(reference, size, names, target_begin, target_end):
+        """ Returns the (begin, end) range of an axis of m read by an index
+        reference, for a formula whose target spans target_begin to
+        target_end on that axis.
+        """
+        try:
+            if reference[0] == 'slice':
+                lower = eval(reference[1], None, names) if reference[1] else None
+                upper = eval(reference[2], None, names) if reference[2] else None
+                begin, end, step = slice(lower, upper).indices(size)
+                return (begin, max(begin, end))
+
+            elif reference[0] == 'value':
+                index = eval(reference[1], None, names)
+                if index < 0:
+                    index += size
+                return (index, index + 1)
+
+            elif reference[0] == 'target':
+                offset = eval(reference[3], None, names) if reference[3] else 0
+                begin = target_begin + reference[2] * offset
+                end = target_end + reference[2] * offset
+                # Negative indices wrap around, so the read can't be bounded.
+                if begin >= 0:
+                    return (begin, min(end, size))
+
+        except Exception:
+            pass
+
+        return (0, size)
+
+    def AnalyzeFormula(self, formula, num_rows, num_columns):
+        target_range = self.GetRowColumnCoordinateRange(formula.expression_match, formula.row_index, formula.column_index)
+        formula.target_range = self.ApplyDirectionOffsetToRange(formula.expression_match, target_range)
+
+        try:
+            code, uses_target, references = CSVMatrix.CompileExpression(str(formula.expression_match.group('expression')))
+        except Exception:
+            references = []
+
+        if references is None:
+            formula.read_ranges = [(0, num_rows, 0, num_columns)]
+            return
+
+        names = {'frow': formula.row_index, 'fcol': formula.column_index}
+
+        formula.read_ranges = []
+        for indices in references:
+            row_range = (0, num_rows)
+            column_range = (0, num_columns)
+
+            if len(indices) > 2:
+                pass
+            elif indices:
+                row_range = CSVMatrix.ResolveIndexReference(indices[0], num_rows, names, formula.target_range[0], formula.target_range[1])
+                if len(indices) > 1:
+                    column_range = CSVMatrix.ResolveIndexReference(indices[1], num_columns, names, formula.target_range[2], formula.target_range[3])
+
+            formula.read_ranges.append(row_range + column_range)
+
+    # Targets taller than this are checked against every read in their
+    # column, rather than found by bisecting on their first row.
+    TALL_TARGET_ROWS = 64
+
+    def GetFormulaOrder(self, formulas):
+        """ Returns formulas in dependency order, so a formula is evaluated
+        after every formula whose target range it reads.  Formulas keep
+        document order where there is no dependency between them.
+        """
+        short_targets = collections.defaultdict(list)
+        tall_targets = collections.defaultdict(list)
+
+        for index, formula in enumerate(formulas):
+            row_begin, row_end, column_begin, column_end = formula.target_range
+            targets = short_targets if row_end - row_begin <= CSVMatrix.TALL_TARGET_ROWS else tall_targets
+            # Nothing reads beyond the columns of m.
+            for column_index in range(column_begin, min(column_end, self.num_columns)):
+                targets[column_index].append((row_begin, row_end, index))
+
+        for targets in short_targets.values():
+            targets.sort()
+        target_starts = dict((column_index, [target[0] for target in targets]) for column_index, targets in short_targets.items())
+
+        dependents = [set() for formula in formulas]
+        dependency_counts = [0] * len(formulas)
+
+        def AddDependency(source_index, index):
+            if source_index != index and index not in dependents[source_index]:
+                dependents[source_index].add(index)
+                dependency_counts[index] += 1
+
+        for index, formula in enumerate(formulas):
+            for row_begin, row_end, column_begin, column_end in formula.read_ranges:
+                for column_index in range(column_begin, column_end):
+                    targets = short_targets.get(column_index)
+                    if targets:
+                        starts = target_starts[column_index]
+                        lo = bisect.bisect_left(starts, row_begin - CSVMatrix.TALL_TARGET_ROWS)
+                        hi = bisect.bisect_left(starts, row_end)
+                        for target_row_begin, target_row_end, source_index in targets[lo:hi]:
+                            if target_row_end > row_begin:
+                                AddDependency(source_index, index)
+
+                    for target_row_begin, target_row_end, source_index in tall_targets.get(column_index, ()):
+                        if target_row_begin < row_end and target_row_end > row_begin:
+                            AddDependency(source_index, index)
+
+        for index, formula in enumerate(formulas):
+            formula.has_dependents = bool(dependents[index])
+
+        ready = [index for index in range(len(formulas)) if dependency_counts[index] == 0]
+        heapq.heapify(ready)
+
+        order = []
+        while ready:
+            index = heapq.heappop(ready)
+            order.append(formulas[index])
+            for dependent_index in dependents[index]:
+                dependency_counts[dependent_index] -= 1
+                if dependency_counts[dependent_index] == 0:
+                    heapq.heappush(ready, dependent_index)
+
+        if len(order) < len(formulas):
+            print("Circular reference between formulas, evaluating {0} of them in document order.".format(len(formulas) - len(order)))
+            order.extend(formulas[index] for index in range(len(formulas)) if dependency_counts[index] > 0)
+
+        return order
+
+    def GetRangesFingerprint(self, ranges):
+        texts = []
+        for row_begin, row_end, column_begin, column_end in ranges:
+            for row_index in range(max(row_begin, 0), min(row_end, len(self.rows))):
+                row = self.rows[row_index]
+                for column_index in range(max(column_begin, 0), min(column_end, len(row))):
+                    texts.append(row[column_index].text.strip())
+                texts.append(None)
+        return hash(tuple(texts))
+
+    def SetExpressionResult(self, target_row_index, target_column_index, result_text, m=None):
+        try:
+            row = self.rows[target_row_index]
+            self.modified_row_indices.add(target_row_index % len(self.rows))
+            self.rows_changed = True
+
+            while target_column_index >= len(row):
+                row.append(CSVValue(''.ljust(self.column_widths[len(row)])))
+
+            # Replace rather than modify the value, it may be shared with the parse cache.
+            target_value = row[target_column_index]
+            row[target_column_index] = CSVValue(result_text.ljust(len(target_value.text)), target_value.first_char_index, target_value.last_char_index)
+
+        except IndexError:
+            print("Invalid expression target cell [{0}, {1}].".format(target_row_index, target_column_index))
+            return
+
+        # Let formulas evaluated later read the result.
+        if m is not None and 0 <= target_row_index < m.shape[0] and 0 <= target_column_index < m.shape[1]:
+            is_float, float_value = CSVValue(result_text).AsFloat()
+            m[target_row_index, target_column_index] = float_value if is_float else 0
+
+    def EvaluateExpressionCell(self, m, row_index, column_index, value, expression_match, update_matrix=False):
+        target_range = self.GetRowColumnCoordinateRange(expression_match, row_index, column_index)
+
+        target_range = self.ApplyDirectionOffsetToRange(expression_match, target_range)
+
+        expression = str(expression_match.group('expression'))
+
+        # Expand sheet for target range.
+        while target_range[1] >= len(self.rows):
+            self.rows.append([])
+        while target_range[3] >= len(self.column_widths):
+            self.column_widths.append(0)
+
+        try:
+            code, uses_target, references = CSVMatrix.CompileExpression(expression)
+        except Exception as e:
+            print("Exception '{0}' compiling expression '{1}'.".format(str(e), expression))
+            code, uses_target = None, False
+            error_text = str(e)
+
+        result_m = m if update_matrix else None
+
+        l = {'m': m, 'frow': row_index, 'fcol': column_index}
+
+        # An expression that does not read row or col has the same result in
+        # every target cell, so it is evaluated only once.
+        if not uses_target:
+            if code is not None:
+                l['row'] = target_range[0]
+                l['col'] = target_range[2]
+                try:
+                    result_text = str(eval(code, None, l))
+                except Exception as e:
+                    print("Exception '{0}' evaluating expression for target range [{1}:{2}, {3}:{4}].".format(str(e), *target_range))
+                    result_text = str(e)
+            else:
+                result_text = error_text
+
+            for target_row_index in range(target_range[0], target_range[1]):
+                for target_column_index in range(target_range[2], target_range[3]):
+                    self.SetExpressionResult(target_row_index, target_column_index, result_text, result_m)
+            return
+
+        for target_row_index in range(target_range[0], target_range[1]):
+            l['row'] = target_row_index
+            for target_column_index in range(target_range[2], target_range[3]):
+                l['col'] = target_column_index
+                try:
+                    result = eval(code, None, l)
+
+                except Exception as e:
+                    print("Exception '{0}' evaluating expression for target cell [{1}, {2}].".format(str(e), target_row_index, target_column_index))
+                    result = str(e)
+
+                self.SetExpressionResult(target_row_index, target_column_index, str(result), result_m)
+
+    def GetNumericMatrix(self, dimensions):
+        """ Returns the rows as an ndarray of floats, with 0 for non-numeric
+        and missing cells.  The values are gathered into one flat buffer
+        which the array then wraps, rather than stored one by one.
+        """
+        numpy = GetNumPy()
+
+        num_rows, num_columns = dimensions
+        if num_rows * num_columns == 0:
+            return numpy.zeros(dimensions)
+
+        values = array.array('d', [0.0]) * (num_rows * num_columns)
+
+        for row_index, row in enumerate(self.rows):
+            if row_index % CSVMatrix.PROGRESS_INTERVAL == 0:
+                self.ReportProgress(row_index, num_rows)
+
+            row_values = []
+            for value in row:
+                is_float, float_value = value.AsFloat()
+                row_values.append(float_value if is_float else 0.0)
+
+            offset = row_index * num_columns
+            values[offset:offset + len(row_values)] = array.array('d', row_values)
+
+        if not hasattr(numpy, 'frombuffer'):
+            # TinyNumPy
+            return numpy.ndarray(dimensions, 'float64', buffer=values)
+
+        return numpy.frombuffer(values, dtype=numpy.float64).reshape(dimensions)
+
+    def Evaluate(self, previous_state=None):
+        """ Evaluates the formula cells.  Formulas whose inputs and outputs
+        are unchanged since previous_state, the state returned by an earlier
+        evaluation of the same text, are skipped.
+        """
+        if not GetNumPy():
+            print("Cannot evaluate without NumPy.")
+            return previous_state
+
+        self.ClaimRows()
+
+        stage = self.BeginProgressStage(0.0, 0.1)
+        self.MeasureColumns()
+        self.progress_stage = stage
+
+        dimensions = (len(self.rows), self.num_columns)
+
+        self.BeginProgressStage(0.1, 0.2)
+        m = self.GetNumericMatrix(dimensions)
+        self.progress_stage = stage
+
+        formulas = []
+        for row_index, row in enumerate(self.rows):
+            for column_index, value in enumerate(row):
+                expression_match = CSVMatrix.EXPRESSION_RE.match(value.text)
+                if expression_match:
+                    formulas.append(CSVFormula(row_index, column_index, value, expression_match))
+
+        for formula in formulas:
+            self.AnalyzeFormula(formula, dimensions[0], dimensions[1])
+
+        if previous_state is None:
+            previous_state = {}
+        state = {}
+
+        self.BeginProgressStage(0.2, 1.0)
+
+        for formula_index, formula in enumerate(self.GetFormulaOrder(formulas)):
+            self.ReportProgress(formula_index, len(formulas))
+
+            key = (formula.row_index, formula.column_index, formula.value.text)
+
+            inputs = self.GetRangesFingerprint(formula.read_ranges)
+
+            previous = previous_state.get(key)
+            if previous and previous[0] == inputs and previous[1] == self.GetRangesFingerprint([formula.target_range]):
+                state[key] = previous
+                continue
+
+            self.EvaluateExpressionCell(m, formula.row_index, formula.column_index, formula.value, formula.expression_match, formula.has_dependents)
+
+            state[key] = (inputs, self.GetRangesFingerprint([formula.target_range]))
+
+        self.progress_stage = stage
+
+        return state
+
+class CSVRecordTooLarge(IOError):
+    pass
+
+class CSVFileStream:
+    """ Reads a CSV file one record at a time, so files too large to load
+    can be processed.
+    """
+    # Largest record read, in characters; a larger one most likely comes from
+    # an unbalanced quote, which would otherwise read the rest of the file
+    # into one record.
+    RECORD_LIMIT = 64 * 1024 * 1024
+
+    def __init__(self, tokenizer, encoding='utf-8'):
+        self.tokenizer = tokenizer
+        self.encoding = encoding
+        self.record_count = 0
+        self.record_limit = CSVFileStream.RECORD_LIMIT
+        self.line_ending = '\n'
+        self.final_newline = False
+
+    def OpenText(self, path, mode):
+        # Lines end only at '\n', so a '\r' in a quoted field stays in it.
+        return io.open(path, mode, encoding=self.encoding, errors='surrogateescape', newline='\n')
+
+    def ReadRecords(self, file):
+        """ Yields the text of each record, joining lines while a quoted
+        field is open.  A field is open while the record has an odd number
+        of quotes; lines inside it keep their own line endings.  The line
+        ending of the first record is kept in line_ending, and whether the
+        file ends with one in final_newline.
+        """
+        self.record_count = 0
+
+        parts = []
+        size = 0
+        quoted = False
+        for line in file:
+            self.final_newline = line.endswith('\n')
+
+            if line.count('"') % 2:
+                quoted = not quoted
+
+            if quoted:
+                parts.append(line)
+                size += len(line)
+                if size > self.record_limit:
+                    raise CSVRecordTooLarge("Record {0} is over {1} characters long; it may have an unbalanced quote.".format(self.record_count + 1, self.record_limit))
+                continue
+
+            if line.endswith('\r\n'):
+                if self.record_count == 0:
+                    self.line_ending = '\r\n'
+                line = line[:-2]
+            elif line.endswith('\n'):
+                line = line[:-1]
+
+            self.record_count += 1
+            if parts:
+                parts.append(line)
+                yield ''.join(parts)
+                parts = []
+                size = 0
+            else:
+                yield line
+
+        if parts:
+            last = parts[-1]
+            if last.endswith('\r\n'):
+                parts[-1] = last[:-2]
+            elif last.endswith('\n'):
+                parts[-1] = last[:-1]
+
+            self.record_count += 1
+            yield ''.join(parts)
+
+    def ReadRows(self, file):
+        parse_record = self.tokenizer.ParseRecord
+        for record in self.ReadRecords(file):
+            yield parse_record(record, 0)[0]
+
+class CSVFileSorter(CSVFileStream):
+    """ Sorts a CSV file too large to load, by sorting chunks that fit in
+    the memory budget into temporary run files and merging the runs.
+    """
+    # Most runs merged at once; more than this are merged in several passes.
+    MERGE_FAN_IN = 64
+
+    # Rough per-record overhead in bytes, on top of the record text.
+    RECORD_SIZE = 200
+
+    def __init__(self, tokenizer, memory_budget, encoding='utf-8'):
+        CSVFileStream.__init__(self, tokenizer, encoding)
+        self.memory_budget = memory_budget
+        self.record_limit = min(self.record_limit, memory_budget)
+
+    def GetSortKey(self, record, sort_keys):
+        row = self.tokenizer.ParseRecord(record, 0)[0]
+        return tuple([CSVMatrix.GetCellValue(row, column_index).SortKey(direction) for column_index, direction in sort_keys])
+
+    def WriteRun(self, records):
+        handle, path = tempfile.mkstemp(prefix='csvsort', suffix='.run')
+        os.close(handle)
+
+        # Length-prefixed, since records may contain newlines.
+        with self.OpenText(path, 'w') as file:
+            for record in records:
+                file.write(u'{0}\n'.format(len(record)))
+                file.write(record)
+
+        return path
+
+    def ReadRun(self, path, run_index, sort_keys):
+        with self.OpenText(path, 'r') as file:
+            sequence = 0
+            while True:
+                length = file.readline()
+                if not length:
+                    break
+
+                record = file.read(int(length))
+                yield (self.GetSortKey(record, sort_keys), run_index, sequence, record)
+                sequence += 1
+
+    def MergeRuns(self, paths, sort_keys):
+        # Run index and sequence keep the merge stable and ensure records are
+        # never compared.
+        runs = [self.ReadRun(path, run_index, sort_keys) for run_index, path in enumerate(paths)]
+        for key, run_index, sequence, record in heapq.merge(*runs):
+            yield record
+
+    def Sort(self, input_path, output_path, sort_keys, use_header, progress=None):
+        run_paths = []
+
+        try:
+            header = None
+
+            with self.OpenText(input_path, 'r') as file:
+                chunk = []
+                chunk_size = 0
+
+                for record in self.ReadRecords(file):
+                    if use_header and header is None:
+                        header = record
+                        continue
+
+                    chunk.append((self.GetSortKey(record, sort_keys), record))
+                    chunk_size += len(record) + CSVFileSorter.RECORD_SIZE
+
+                    if chunk_size >= self.memory_budget:
+                        chunk.sort(key=lambda item: item[0])
+                        run_paths.append(self.WriteRun([record for key, record in chunk]))
+                        chunk = []
+                        chunk_size = 0
+
+                        if progress:
+                            progress(self.record_count)
+
+                chunk.sort(key=lambda item: item[0])
+                run_paths.append(self.WriteRun([record for key, record in chunk]))
+                chunk = None
+
+            while len(run_paths) > CSVFileSorter.MERGE_FAN_IN:
+                merged_paths = []
+                for index in range(0, len(run_paths), CSVFileSorter.MERGE_FAN_IN):
+                    group = run_paths[index:index + CSVFileSorter.MERGE_FAN_IN]
+                    merged_paths.append(self.WriteRun(self.MergeRuns(group, sort_keys)))
+                    for path in group:
+                        os.remove(path)
+                run_paths = merged_paths
+
+            with self.OpenText(output_path, 'w') as output:
+                first = True
+                if header is not None:
+                    output.write(header)
+                    first = False
+
+                for record in self.MergeRuns(run_paths, sort_keys):
+                    if not first:
+                        output.write(self.line_ending)
+                    output.write(record)
+                    first = False
+
+                if self.final_newline:
+                    output.write(self.line_ending)
+
+        finally:
+            for path in run_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+class CSVFileFormatter(CSVFileStream):
+    """ Rewrites a CSV file one record at a time with the delimiter and
+    quoting of output_tokenizer, compacting or justifying the cells.  Only
+    the column widths of a justified file are held in memory; measuring them
+    takes a first pass over the file.
+    """
+    def __init__(self, tokenizer, output_tokenizer, encoding='utf-8'):
+        CSVFileStream.__init__(self, tokenizer, encoding)
+        self.output_tokenizer = output_tokenizer
+
+    def MeasureColumns(self, input_path):
+        quote_text = self.output_tokenizer.QuoteText
+        column_widths = []
+
+        with self.OpenText(input_path, 'r') as file:
+            for row in self.ReadRows(file):
+                if len(row) > len(column_widths):
+                    column_widths.extend([0] * (len(row) - len(column_widths)))
+
+                for column_index, value in enumerate(row):
+                    width = len(quote_text(value.text))
+
+                    if width > column_widths[column_index]:
+                        column_widths[column_index] = width
+
+        return column_widths
+
+    def Format(self, input_path, output_path, mode):
+        matrix = CSVMatrix(self.output_tokenizer)
+        if mode == FormatMode.Expanded:
+            matrix.column_widths = self.MeasureColumns(input_path)
+
+        format_row = matrix.FormatRow
+
+        with self.OpenText(input_path, 'r') as file:
+            with self.OpenText(output_path, 'w') as output:
+                first = True
+                for row in self.ReadRows(file):
+                    if not first:
+                        output.write(self.line_ending)
+                    output.write(format_row(row, mode))
+                    first = False
+
+                if self.final_newline:
+                    output.write(self.line_ending)
@@ -1,75 +1,290 @@
 # Originally written by Eric Martel (emartel@gmail.com / www.ericmartel.com)
 # Improved by Wade Brainerd (wadetb@gmail.com / www.wadeb.com)
 
+import time
+plugin_load_start = time.time()
+
 import sublime
 import sublime_plugin
 
-import fnmatch, os, re, sys
-from math import *
-
-# http://stackoverflow.com/questions/11301138/how-to-check-if-variable-is-string-with-python-2-and-3-compatibility
-try:
-    isinstance("", basestring)
-    def isstr(s):
-        return isinstance(s, basestring)
-except NameError:
-    def isstr(s):
-        return isinstance(s, str)
+import bisect, collections, io, os, re, sys, threading, zlib
 
 directory = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(directory)
 
-from tinynumpy import tinynumpy
-
-try:
-    import numpy
-except ImportError:
-    print("=== NumPy disabled, using TinyNumPy instead ===")
-    print("To enable cell evaluation using the full NumPy, download NumPy from:")
-    print("    https://pypi.python.org/pypi/numpy")
-    print("and install it into Sublime Text's Packages directory.")
-    print("For information on the features and limitations of TinyNumPy, visit:")
-    print("    https://github.com/wadetb/tinynumpy")
-    print("======================")
-    numpy = tinynumpy
-
-class SortDirection:
-    Ascending = 1
-    Descending = 2
-
-class CSVValue:
-    def __init__(self, text, first_char_index=0, last_char_index=0):
-        self.text = text
-        self.first_char_index = first_char_index
-        self.last_char_index = last_char_index
+from csvengine import csvengine
+
+def CommonPrefixLength(a, b, limit):
+    # Compare in growing blocks to find the first difference, then bisect it.
+    length = 0
+    block = 4096
+    while length < limit:
+        end = min(length + block, limit)
+        if a[length:end] != b[length:end]:
+            break
+        length = end
+        block = min(block * 2, 1 << 20)
+    else:
+        return limit
+
+    lo, hi = length, min(length + block, limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[length:mid] == b[length:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def CommonSuffixLength(a, b, limit):
+    a_length = len(a)
+    b_length = len(b)
+
+    length = 0
+    block = 4096
+    while length < limit:
+        end = min(length + block, limit)
+        if a[a_length - end:a_length - length] != b[b_length - end:b_length - length]:
+            break
+        length = end
+        block = min(block * 2, 1 << 20)
+    else:
+        return limit
+
+    lo, hi = length, min(length + block, limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[a_length - mid:a_length - length] == b[b_length - mid:b_length - length]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+class CSVColumnWidths:
+    """ Counts how many cells of each column have each quoted width, so
+    the widest cell of a column is known without measuring every row again
+    after an edit.
+    """
+    def __init__(self, tokenizer):
+        self.quote_text = tokenizer.QuoteText
+
+        # Per column, a {width: cell_count} histogram and the widest width in it.
+        self.counts = []
+        self.widths = []
+
+    def AddRows(self, rows):
+        quote_text = self.quote_text
+        counts = self.counts
+        widths = self.widths
+
+        for row in rows:
+            if len(row) > len(counts):
+                for column_index in range(len(counts), len(row)):
+                    counts.append({})
+                    widths.append(0)
 
-    def AsFloat(self):
-        try:
-            return True, float(self.text)
-        except ValueError:
-            return False, None
+            for column_index, value in enumerate(row):
+                width = len(quote_text(value.text))
+
+                column_counts = counts[column_index]
+                column_counts[width] = column_counts.get(width, 0) + 1
+
+                if width > widths[column_index]:
+                    widths[column_index] = width
+
+    def RemoveRows(self, rows):
+        quote_text = self.quote_text
+        counts = self.counts
+        widths = self.widths
+
+        # Columns that lost their last cell of the widest width.
+        narrowed = set()
+
+        for row in rows:
+            for column_index, value in enumerate(row):
+                width = len(quote_text(value.text))
 
-    def Compare(self, other):
-        a_is_float, a_float = self.AsFloat()
-        b_is_float, b_float = other.AsFloat()
+                column_counts = counts[column_index]
+                count = column_counts[width] - 1
+                if count:
+                    column_counts[width] = count
+                else:
+                    del column_counts[width]
+                    if width == widths[column_index]:
+                        narrowed.add(column_index)
+
+        for column_index in narrowed:
+            widths[column_index] = max(counts[column_index]) if counts[column_index] else 0
+
+    def ReplaceRows(self, old_rows, new_rows):
+        # Adding first keeps the widest width counted when an edit keeps it.
+        self.AddRows(new_rows)
+        self.RemoveRows(old_rows)
+
+    def GetWidths(self, num_columns):
+        return self.widths[:num_columns] + [0] * (num_columns - len(self.widths))
+
+class CSVParseCacheEntry:
+    def __init__(self, tokenizer, compact_threshold, change_count, text, rows, row_offsets):
+        self.tokenizer = tokenizer
+        self.compact_threshold = compact_threshold
+        self.change_count = change_count
+        self.text = text
+        self.rows = rows
+        self.row_offsets = row_offsets
 
-        if a_is_float and b_is_float:
-            return a_float - b_float
+        # A CSVColumnWidths for the rows, built when first asked for.
+        self.column_widths = None
+        if isinstance(rows, csvengine.CSVCompactRows):
+            self.size = len(text) + rows.GetMemoryUsage()
+        else:
+            self.size = len(text) + csvengine.CSVCompactRows.CELL_SIZE * sum(len(row) for row in rows)
+
+class CSVParseCache:
+    def __init__(self):
+        # Least recently used entries first.
+        self.entries = collections.OrderedDict()
+        self.total_size = 0
+        self.lock = threading.Lock()
+
+    def GetRows(self, view, tokenizer, limit, compact_threshold):
+        with self.lock:
+            entry = self.Update(view, tokenizer, compact_threshold)
+            self.Trim(limit)
+
+            # The rows are shared with the matrix, which copies them before
+            # modifying them.
+            return entry.rows, entry.row_offsets, entry.text
+
+    def Refresh(self, view):
+        """ Re-parses an edited view ahead of the next command.  Buffers
+        stored compactly are always parsed in full, which takes seconds, so
+        they are left to the next command that needs their rows.
+        """
+        with self.lock:
+            entry = self.entries.get(view.id())
+            if entry and not isinstance(entry.rows, csvengine.CSVCompactRows) and view.size() < entry.compact_threshold:
+                self.Update(view, entry.tokenizer, entry.compact_threshold)
+
+    def Update(self, view, tokenizer, compact_threshold):
+        view_id = view.id()
+        change_count = view.change_count()
+
+        entry = self.entries.pop(view_id, None)
+        if entry:
+            self.total_size -= entry.size
+
+            # Cached rows are only reusable if the dialect didn't change.
+            if (entry.tokenizer.delimiter, entry.tokenizer.auto_quote) != (tokenizer.delimiter, tokenizer.auto_quote):
+                entry = None
+
+        if not entry or entry.change_count != change_count:
+            text = view.substr(sublime.Region(0, view.size()))
+            column_widths = None
+
+            # Compact rows are always parsed in full, which is still a single pass.
+            if len(text) >= compact_threshold:
+                rows, row_offsets = tokenizer.ParseTextCompact(text)
+            elif entry and not isinstance(entry.rows, csvengine.CSVCompactRows):
+                rows, row_offsets, changed = CSVParseCache.ReparseChangedRecords(tokenizer, entry.text, entry.rows, entry.row_offsets, text)
+
+                # Only the changed rows are measured again.
+                column_widths = entry.column_widths
+                if column_widths:
+                    begin, old_end, new_end = changed
+                    column_widths.ReplaceRows(entry.rows[begin:old_end], rows[begin:new_end])
+            else:
+                rows, row_offsets = tokenizer.ParseText(text)
 
-        if self.text > other.text:
-            return 1
-        if self.text < other.text:
-            return -1
-        return 0
+            entry = CSVParseCacheEntry(tokenizer, compact_threshold, change_count, text, rows, row_offsets)
+            entry.column_widths = column_widths
+        else:
+            entry.compact_threshold = compact_threshold
+
+        self.entries[view_id] = entry
+        self.total_size += entry.size
 
-    def __lt__(self, other): return self.Compare(other) < 0
-    def __eq__(self, other): return self.Compare(other) == 0
+        return entry
 
-class CSVMatrix:
+    @staticmethod
+    def ReparseChangedRecords(tokenizer, old_text, old_rows, old_row_offsets, text):
+        """ Returns the rows and row offsets of text, and which rows changed
+        as (begin, old_end, new_end): old_rows[begin:old_end] were replaced by
+        rows[begin:new_end].
+        """
+        limit = min(len(old_text), len(text))
+        prefix = CommonPrefixLength(old_text, text, limit)
+        if prefix == len(old_text) == len(text):
+            return old_rows, old_row_offsets, (0, 0, 0)
+        suffix = CommonSuffixLength(old_text, text, limit - prefix)
+
+        # Records that end before the first changed character are kept as
+        # they are.
+        row_index = bisect.bisect_right(old_row_offsets, prefix) - 1
+        rows = old_rows[:row_index]
+        row_offsets = old_row_offsets[:row_index]
+
+        # Parse from there until a record ends on a newline inside the
+        # unchanged suffix, at a place where a record also began in the old
+        # text.  Parsing restarts from scratch at every record, so the rest of
+        # the old records can be reused with their offsets shifted.
+        delta = len(text) - len(old_text)
+        suffix_start = len(text) - suffix
+        text_length = len(text)
+        start = old_row_offsets[row_index]
+        while True:
+            row, end = tokenizer.ParseRecord(text, start)
+            rows.append(row)
+            row_offsets.append(start)
+            if end >= text_length:
+                return rows, row_offsets, (row_index, len(old_rows), len(rows))
+            start = end + 1
+
+            if end >= suffix_start:
+                old_row_index = bisect.bisect_left(old_row_offsets, start - delta)
+                if old_row_index < len(old_row_offsets) and old_row_offsets[old_row_index] == start - delta:
+                    changed = (row_index, old_row_index, len(rows))
+                    rows.extend(old_rows[old_row_index:])
+                    row_offsets.extend([offset + delta for offset in old_row_offsets[old_row_index:]])
+                    return rows, row_offsets, changed
+
+    def Trim(self, limit):
+        while self.total_size > limit and self.entries:
+            view_id, entry = self.entries.popitem(last=False)
+            self.total_size -= entry.size
+
+    def Evict(self, view):
+        with self.lock:
+            entry = self.entries.pop(view.id(), None)
+            if entry:
+                self.total_size -= entry.size
+
+    def Contains(self, view):
+        return view.id() in self.entries
+
+    def GetColumnWidths(self, view, text, num_columns):
+        """ Returns the widest quoted cell of each column of the view's rows,
+        or None if they are no longer the rows parsed from text.
+        """
+        with self.lock:
+            entry = self.entries.get(view.id())
+            if not entry or entry.text is not text:
+                return None
+
+            if entry.column_widths is None:
+                entry.column_widths = CSVColumnWidths(entry.tokenizer)
+                entry.column_widths.AddRows(entry.rows)
+
+            return entry.column_widths.GetWidths(num_columns)
+
+parse_cache = CSVParseCache()
+
+# Per view, the input and output fingerprints of each formula at its last
+# evaluation, keyed by (row_index, column_index, text).
+evaluation_state = {}
+
+class CSVMatrix(csvengine.CSVMatrix):
     def __init__(self, view):
-        self.rows = []
-        self.num_columns = 0
-        self.valid = False
         self.view = view
 
         self.settings = sublime.load_settings('AdvancedCSV.sublime-settings')
@@ -78,6 +293,8 @@ class CSVMatrix:
 
         self.auto_quote = self.GetViewOrUserSetting( 'auto_quote', True )
 
+        csvengine.CSVMatrix.__init__(self, csvengine.CSVTokenizer(self.delimiter, self.auto_quote))
+
     def GetViewOrUserSetting(self, name, default):
         if self.view.settings().has(name):
             return self.view.settings().get(name)
@@ -85,494 +302,387 @@ class CSVMatrix:
             return self.settings.get(name, default)
 
     def ChooseDelimiter(self):
-        self.delimiter = None
+        delimiter = None
+        dialect = None
 
         # Highest priority: per-view saved setting (CSV -> Set Delimiter).
         if self.view.settings().has('delimiter'):
-            self.delimiter = self.view.settings().get('delimiter')
-
-        # Second highest priority: filename-based matching
-        if not self.delimiter:
-            filename = self.view.file_name()
-
-            if filename:
-                self.delimiter_mapping = self.settings.get('delimiter_mapping', {})
-                for k, v in self.delimiter_mapping.items():
-                    if fnmatch.fnmatch(filename, k):
-                        self.delimiter = v
-                        break
-
-        # Final priority: user or system setting, fallback to comma. 
-        if not self.delimiter:
-            self.delimiter = self.settings.get('delimiter', ',')
-
-        # Special case for recognizing '\t' for tabs.
-        if self.delimiter == '\\t':
-            self.delimiter = '\t'
-
-        if not isstr(self.delimiter) or len(self.delimiter) != 1:
-            print("'{0}' is not a valid delimiter, reverting to ','.".format(self.delimiter))
-            self.delimiter = ','
+            delimiter = self.view.settings().get('delimiter')
+        elif self.GetViewOrUserSetting('detect_dialect', True):
+            dialect = CSVMatrix.GetViewDialect(self.view)
 
-        print("Using delimiter: '{0}'.".format(self.delimiter))
-
-    def AddRow(self, row):
-        self.rows.append(row)
-
-    def Finalize(self):
-        if not len(self.rows):
-            return
-
-        self.num_columns = 0
-        for row in self.rows:
-            if len(row) > self.num_columns:
-                self.num_columns = len(row)
-
-        self.valid = True
+        self.delimiter = CSVMatrix.ResolveDelimiter(self.settings, delimiter, self.view.file_name(), dialect)
 
     @staticmethod
-    def GetCellValue(row, column_index):
-        try:
-            return row[column_index]
-        except IndexError:
-            return CSVValue('')
-
-    def SortByColumn(self, column_index, direction, use_header):
-        class Compare:
-            def __init__(self, row): self.value = CSVMatrix.GetCellValue(row, column_index)
-            def __lt__(self, other): return self.value < other.value
-            def __eq__(self, other): return self.value == other.value
-
-        reverse = direction == SortDirection.Descending
-
-        if use_header:
-            self.rows[1:] = sorted(self.rows[1:], key=lambda row: Compare(row), reverse=reverse)
+    def GetViewDialect(view):
+        """ Returns the dialect detected from the start of the view.  It is
+        kept in the view's settings with a checksum of the sample it was
+        detected from, and detected again once that sample changes.
+        """
+        sample = view.substr(sublime.Region(0, min(view.size(), CSVMatrix.DIALECT_SAMPLE_SIZE)))
+        truncated = view.size() > len(sample)
+        sample_checksum = [zlib.crc32(sample.encode('utf-8', 'surrogatepass')), truncated]
+
+        if view.settings().get('csv_dialect_sample_checksum') == sample_checksum:
+            return view.settings().get('csv_detected_dialect')
+
+        dialect = CSVMatrix.DetectDialect(sample, truncated)
+        if dialect:
+            view.settings().set('csv_detected_dialect', dialect)
         else:
-            self.rows.sort(key=lambda row: Compare(row), reverse=reverse)
-
-    def InsertColumn(self, column_index):
-        for row in self.rows:
-            if column_index <= len(row):
-                row.insert(column_index, CSVValue(''))
+            view.settings().erase('csv_detected_dialect')
+        view.settings().set('csv_dialect_sample_checksum', sample_checksum)
+        return dialect
 
-    def DeleteColumn(self, column_index):
-        for row in self.rows:
-            if column_index < len(row):
-                row.pop(column_index)
-
-    def DeleteTrailingColumns(self, column_index):
-        for row in self.rows:
-            last_column_index = 0
+    @staticmethod
+    def ApplyEdits(view, edit, edits, saved_selection=None):
+        if saved_selection is not None:
+            saved_selection = CSVMatrix.MapSelection(view, saved_selection, edits)
 
-            for column_index, value in enumerate(row):
-                if len(value.text.strip()) > 0:
-                    last_column_index = column_index
+        # Apply from the end of the buffer so earlier positions stay valid.
+        for begin, end, text in reversed(edits):
+            view.replace(edit, sublime.Region(begin, end), text)
 
-            first_empty_column_index = last_column_index + 1
-            del row[first_empty_column_index:]
+        if saved_selection is not None:
+            CSVMatrix.RestoreSelection(view, saved_selection)
 
     def SelectColumn(self, column_index, view):
-        view.sel().clear()
-
-        for row_index, row in enumerate(self.rows):
-            if column_index < len(row):
-                value = row[column_index]
-                a = view.text_point(row_index, value.first_char_index)
-                b = view.text_point(row_index, value.last_char_index)
+        regions = [sublime.Region(a, b) for a, b in self.GetColumnSpans(column_index)]
 
-                region = sublime.Region(a, b)
-                view.sel().add(region)
+        view.sel().clear()
+        view.sel().add_all(regions)
 
     @staticmethod
     def SaveSelection(view):
-        saved_selection = []
+        return [(region.a, region.b) for region in view.sel()]
 
-        for region in view.sel():
-            a_row, a_col = view.rowcol(region.a)
-            b_row, b_col = view.rowcol(region.b)
-
-            rowcol_region = (a_row, a_col, b_row, b_col)
+    @staticmethod
+    def MapSelection(view, saved_selection, edits):
+        """ Returns a saved selection moved through edits that are about to
+        be applied to the view, in buffer order.  Regions keep covering the
+        same text: text inserted where a region begins, or at a caret, goes
+        before it, and text inserted where a region ends goes after it.  A
+        point inside or at the end of a replaced range keeps its line and
+        column within the range, clamped to the replacement.
+        """
+        # Points as (position, moves_past_inserts); the points that stay
+        # before inserts at a position are mapped first.
+        points = set()
+        for a, b in saved_selection:
+            points.add((min(a, b), True))
+            points.add((max(a, b), a == b))
+        mapped_points = {}
+
+        edit_index = 0
+        delta = 0
+        line_offsets = None
+
+        for point, moves_past_inserts in sorted(points):
+            # Skip the edits that end before the point.
+            while edit_index < len(edits):
+                begin, end, text = edits[edit_index]
+                if end > point or end == point and (begin < end or not moves_past_inserts):
+                    break
+                delta += len(text) - (end - begin)
+                edit_index += 1
+                line_offsets = None
+
+            if edit_index < len(edits) and edits[edit_index][0] < point:
+                begin, end, text = edits[edit_index]
+                if line_offsets is None:
+                    old_text = view.substr(sublime.Region(begin, end))
+                    line_offsets = csvengine.GetLineOffsets(old_text.split('\n')), csvengine.GetLineOffsets(text.split('\n'))
+                old_line_offsets, new_line_offsets = line_offsets
+
+                offset = point - begin
+                line_index = bisect.bisect_right(old_line_offsets, offset) - 1
+                column = offset - old_line_offsets[line_index]
+
+                if line_index < len(new_line_offsets):
+                    if line_index + 1 < len(new_line_offsets):
+                        line_end = new_line_offsets[line_index + 1] - 1
+                    else:
+                        line_end = len(text)
+                    offset = min(new_line_offsets[line_index] + column, line_end)
+                else:
+                    offset = len(text)
 
-            saved_selection.append(rowcol_region)
+                mapped_points[point, moves_past_inserts] = begin + delta + offset
+            else:
+                mapped_points[point, moves_past_inserts] = point + delta
 
-        return saved_selection
+        mapped_selection = []
+        for a, b in saved_selection:
+            begin = mapped_points[min(a, b), True]
+            end = mapped_points[max(a, b), a == b]
+            mapped_selection.append((begin, end) if a <= b else (end, begin))
+        return mapped_selection
 
     @staticmethod
     def RestoreSelection(view, saved_selection):
-        view.sel().clear()
-
-        for rowcol_region in saved_selection:
-            a = view.text_point(rowcol_region[0], rowcol_region[1])
-            b = view.text_point(rowcol_region[2], rowcol_region[3])
+        regions = [sublime.Region(a, b) for a, b in saved_selection]
 
-            region = sublime.Region(a, b)
-            view.sel().add(region)
-
-    def QuoteText(self, text):
-        if not self.auto_quote:
-            return text
-        if self.delimiter in text or '"' in text:
-            return '"' + text.replace('"', '""') + '"'
-        else:
-            return text
+        view.sel().clear()
+        view.sel().add_all(regions)
 
     def MeasureColumns(self):
-        self.column_widths = [0] * self.num_columns
+        # Rows as parsed have their widths kept by the parse cache.
+        if not self.rows_changed:
+            column_widths = parse_cache.GetColumnWidths(self.view, self.text, self.num_columns)
+            if column_widths is not None:
+                self.column_widths = column_widths
+                return
 
-        for row in self.rows:
-            for column_index, value in enumerate(row):
-                text = self.QuoteText(value.text)
-                width = len(text)
-
-                if width > self.column_widths[column_index]:
-                    self.column_widths[column_index] = width
-
-    def Format(self):
-        output = ''
-
-        for row_index, row in enumerate(self.rows):
-            row_text = ''
-
-            for column_index, value in enumerate(row):
-                quoted_text = self.QuoteText(value.text)
-
-                row_text += quoted_text
-
-                if column_index < len(row) - 1:
-                    row_text += self.delimiter
-
-            output += row_text
-
-            if row_index < len(self.rows) - 1:
-                output += '\n'
-
-        return output
-
-    def FormatCompacted(self):
-        output = ''
-
-        for row_index, row in enumerate(self.rows):
-            row_text = ''
+        csvengine.CSVMatrix.MeasureColumns(self)
 
-            for column_index, value in enumerate(row):
-                quoted_trimmed_text = self.QuoteText(value.text.strip())
-
-                row_text += quoted_trimmed_text
-
-                if column_index < len(row) - 1:
-                    row_text += self.delimiter
-
-            output += row_text
-
-            if row_index < len(self.rows) - 1:
-                output += '\n'
+    @staticmethod
+    def FromView(view):
+        matrix = CSVMatrix(view)
 
-        return output
+        cache_limit = matrix.settings.get('parse_cache_size_mb', 256) * 1024 * 1024
+        compact_threshold = matrix.GetViewOrUserSetting('compact_storage_threshold_mb', 32) * 1024 * 1024
+        matrix.rows, matrix.row_offsets, matrix.text = parse_cache.GetRows(view, matrix.tokenizer, cache_limit, compact_threshold)
+        matrix.rows_shared = True
 
-    def FormatExpanded(self):
-        self.MeasureColumns()
+        matrix.Finalize()
 
-        output = ''
+        return matrix
 
-        for row_index, row in enumerate(self.rows):
-            row_text = ''
+    @staticmethod
+    def FromViewLazily(view):
+        """ Like FromView, but rows are only tokenized as they are accessed,
+        for commands that need a few rows or one column.  The matrix doesn't
+        know its column count and must not be modified.
+        """
+        matrix = CSVMatrix(view)
 
-            for column_index, value in enumerate(row):
-                quoted_text = self.QuoteText(value.text)
+        matrix.text = view.substr(sublime.Region(0, view.size()))
+        matrix.rows = csvengine.CSVLazyRows(matrix.tokenizer, matrix.text)
+        matrix.row_offsets = matrix.rows.row_offsets
+        matrix.valid = True
 
-                column_width = self.column_widths[column_index]
+        return matrix
 
-                quoted_padded_text = quoted_text.ljust(column_width)
+    def GetColumnIndexFromCursor(self, view):
+        selection = view.sel()[0]
 
-                row_text += quoted_padded_text
+        return self.GetColumnIndexFromPoint(selection.begin())
 
-                if column_index < len(row) - 1:
-                    row_text += self.delimiter
+    def GetSortKeysFromSelection(self, selection, directions):
+        """ Returns one (column_index, direction) sort key per region of
+        the selection, in buffer order.  Key i sorts in directions[i], or in
+        the last of directions when there are fewer.
+        """
+        sort_keys = []
+        column_indices = set()
 
-            output += row_text
+        for region in selection:
+            column_index = self.GetColumnIndexFromPoint(region.begin())
+            if column_index in column_indices:
+                continue
+            column_indices.add(column_index)
 
-            if row_index < len(self.rows) - 1:
-                output += '\n'
+            sort_keys.append((column_index, directions[min(len(sort_keys), len(directions) - 1)]))
 
-        return output
+        return sort_keys
 
-    def ParseRow(self, row):
-        columns = []
+    def Evaluate(self):
+        state = csvengine.CSVMatrix.Evaluate(self, evaluation_state.get(self.view.id()))
+        if state is not None:
+            evaluation_state[self.view.id()] = state
 
-        currentword = ''
-        first_char_index = 0
-        insidequotes = False
+class CSVTaskCancelled(Exception):
+    pass
 
-        char_index = 0
-        while char_index < len(row):
-            char = row[char_index]
+class CSVTask:
+    """ Runs a long command on the async thread, showing its progress in
+    the status bar.  Its work function returns csv_set_output arguments,
+    which are applied only if the buffer hasn't changed since it started.
+    """
+    STATUS_KEY = 'csv_task'
 
-            if insidequotes:
-                if char == '"':
-                    if char_index < len(row) - 1 and row[char_index + 1] == '"':
-                        if self.auto_quote:
-                            currentword += '"'
-                        else:
-                            currentword += '""'
-                        char_index += 2
-                        continue
-                     
-                    insidequotes = False
-                    if not self.auto_quote:
-                        currentword += char
-                        
-                else:
-                    currentword += char
+    # Least time between status bar updates, in seconds.
+    STATUS_INTERVAL = 0.1
 
-            else:
-                if char == '"':
-                    insidequotes = True
-                    if not self.auto_quote:
-                        currentword += char
+    # The running task of each view, by view id.
+    running = {}
 
-                elif char == self.delimiter:
-                    columns.append(CSVValue(currentword, first_char_index, char_index))
-                    currentword = ''
-                    first_char_index = char_index + 1
+    def __init__(self, view, name, work):
+        self.view = view
+        self.name = name
+        self.work = work
+        self.change_count = view.change_count()
+        self.cancelled = False
+        self.status_time = 0
 
-                else:
-                    currentword += char
+    @staticmethod
+    def Start(view, name, work):
+        CSVTask.Cancel(view)
 
-            char_index += 1
+        task = CSVTask(view, name, work)
+        CSVTask.running[view.id()] = task
 
-        columns.append(CSVValue(currentword, first_char_index, char_index))
+        view.set_status(CSVTask.STATUS_KEY, name + '...')
+        sublime.set_timeout_async(task.Run, 0)
 
-        return columns
+        return task
 
     @staticmethod
-    def FromView(view):
-        matrix = CSVMatrix(view)
-
-        text = view.substr(sublime.Region(0, view.size()))
+    def Cancel(view):
+        task = CSVTask.running.get(view.id())
+        if task:
+            task.cancelled = True
 
-        for line in text.split("\n"):
-            row = matrix.ParseRow(line)
+    def Progress(self, fraction):
+        if self.cancelled:
+            raise CSVTaskCancelled()
 
-            matrix.AddRow(row)
+        now = time.time()
+        if now - self.status_time >= CSVTask.STATUS_INTERVAL:
+            self.status_time = now
+            self.view.set_status(CSVTask.STATUS_KEY, '{0}: {1:.0f}%'.format(self.name, fraction * 100))
 
-        matrix.Finalize()
+    def GetMatrix(self):
+        matrix = CSVMatrix.FromView(self.view)
+        if not matrix.valid:
+            sublime.set_timeout(lambda: sublime.error_message(__name__ + ": The buffer doesn't appear to be a CSV file"), 0)
+            return None
 
+        matrix.progress = self.Progress
         return matrix
 
-    def GetColumnIndexFromCursor(self, view):
-        selection = view.sel()[0]
-
-        row_index, col_index = view.rowcol(selection.begin())
-
-        if row_index < len(self.rows):
-            row = self.rows[row_index]
-
-            for column_index, value in enumerate(row):
-                if value.first_char_index > col_index:
-                    return column_index - 1
-
-            return len(row) - 1
-
-        else:
-            return 0
-
-    EXPRESSION_RE = re.compile(r'''
-        \s*
-        (\[
-            (?P<row_begin_mod>[+-])?
-            (?P<row_begin>\d+)?
-            (?P<row_delim>:)?
-            (?P<row_end_mod>[+-])?
-            (?P<row_end>\d+)?
-            (?P<comma>,)?
-            (?P<column_begin_mod>[+-])?
-            (?P<column_begin>\d+)?
-            (?P<column_delim>:)?
-            (?P<column_end_mod>[+-])?
-            (?P<column_end>\d+)?
-        \])?
-        \s*
-        (?P<direction>[<>v^])?
-        \s*
-        =
-        \s*
-        (?P<expression>.+)
-        ''', re.VERBOSE)
-
-    def ApplyModifier(self, value, mod, base_value):
-        if mod == '+':
-            return base_value + value
-        elif mod == '-':
-            return base_value - value
-        else:
-            return value
-
-    def GetCoordinateRange(self, begin_mod, begin, delim, end_mod, end, base_value):
-        if delim:
-            if begin is None:
-                begin = 0
-            else:
-                begin = self.ApplyModifier(int(begin), begin_mod, base_value)
-            if end is None:
-                end = len(self.rows)
-            else:
-                end = self.ApplyModifier(int(end), end_mod, base_value)
+    def Run(self):
+        try:
+            if self.cancelled:
+                raise CSVTaskCancelled()
+            args = self.work(self)
+        except CSVTaskCancelled:
+            sublime.set_timeout(lambda: self.Finish(self.name + ' cancelled'), 0)
+            return
+        except Exception:
+            sublime.set_timeout(lambda: self.Finish(self.name + ' failed, see the console'), 0)
+            raise
+
+        sublime.set_timeout(lambda: self.Apply(args), 0)
+
+    def Apply(self, args):
+        if self.cancelled:
+            self.Finish(self.name + ' cancelled')
+        elif self.view.change_count() != self.change_count:
+            self.Finish(self.name + ' discarded, the buffer changed while it ran')
+        elif args is None:
+            self.Finish(None)
         else:
-            if begin is None:
-                begin = base_value
-                end = base_value + 1
-            else:
-                begin = self.ApplyModifier(int(begin), begin_mod, base_value)
-                end = begin + 1
-
-        return (begin, end)
-
-    def GetRowColumnCoordinateRange(self, coordinate_match, base_row_index, base_column_index):
-        row_begin_mod = coordinate_match.group('row_begin_mod')
-        row_begin = coordinate_match.group('row_begin')
-        row_delim = coordinate_match.group('row_delim')
-        row_end_mod = coordinate_match.group('row_end_mod')
-        row_end = coordinate_match.group('row_end')
-
-        row_range = self.GetCoordinateRange(row_begin_mod, row_begin, row_delim, row_end_mod, row_end, base_row_index)
-
-        column_begin_mod = coordinate_match.group('column_begin_mod')
-        column_begin = coordinate_match.group('column_begin')
-        column_delim = coordinate_match.group('column_delim')
-        column_end_mod = coordinate_match.group('column_end_mod')
-        column_end = coordinate_match.group('column_end')
-
-        column_range = self.GetCoordinateRange(column_begin_mod, column_begin, column_delim, column_end_mod, column_end, base_column_index)
-
-        return (row_range[0], row_range[1], column_range[0], column_range[1])
+            self.view.run_command('csv_set_output', args)
+            self.Finish(self.name + ' done')
 
-    def ApplyDirectionOffsetToRange(self, direction_match, coord_range):
-        direction = direction_match.group('direction')
+    def Finish(self, message):
+        if CSVTask.running.get(self.view.id()) is self:
+            del CSVTask.running[self.view.id()]
+            self.view.erase_status(CSVTask.STATUS_KEY)
 
-        if direction == '^':
-            return (coord_range[0] - 1, coord_range[1] - 1, coord_range[2], coord_range[3])
-        elif direction == 'v':
-            return (coord_range[0] + 1, coord_range[1] + 1, coord_range[2], coord_range[3])
-        elif direction == '<':
-            return (coord_range[0], coord_range[1], coord_range[2] - 1, coord_range[3] - 1)
-        elif direction == '>':
-            return (coord_range[0], coord_range[1], coord_range[2] + 1, coord_range[3] + 1)
-        else:
-            return coord_range
+        if message:
+            sublime.status_message(message)
 
-    def EvaluateExpressionCell(self, m, row_index, column_index, value, expression_match):
-        target_range = self.GetRowColumnCoordinateRange(expression_match, row_index, column_index)
+class CsvParseCacheListener(sublime_plugin.EventListener):
+    # Delay before re-parsing an edited view, so typing doesn't trigger a parse per keystroke.
+    REFRESH_DELAY = 500
 
-        target_range = self.ApplyDirectionOffsetToRange(expression_match, target_range)
+    def on_modified_async(self, view):
+        if not parse_cache.Contains(view):
+            return
 
-        expression = expression_match.group('expression')
+        change_count = view.change_count()
 
-        # Expand sheet for target range.
-        while target_range[1] >= len(self.rows):
-            self.rows.append([])
-        while target_range[3] >= len(self.column_widths):
-            self.column_widths.append(0)
+        def refresh():
+            if view.change_count() == change_count:
+                parse_cache.Refresh(view)
 
-        for target_row_index in range(target_range[0], target_range[1]):
-            for target_column_index in range(target_range[2], target_range[3]):
-                try:
-                    l = {}
-                    l['m'] = m
-                    l['row'] = target_row_index
-                    l['col'] = target_column_index
-                    l['frow'] = row_index
-                    l['fcol'] = column_index
-                    result = eval(str(expression), None, l)
+        sublime.set_timeout_async(refresh, CsvParseCacheListener.REFRESH_DELAY)
 
-                except Exception as e:
-                    print("Exception '{0}' evaluating expression for target cell [{1}, {2}].".format(str(e), target_row_index, target_column_index))
-                    result = str(e)
+    def on_close(self, view):
+        CSVTask.Cancel(view)
+        parse_cache.Evict(view)
+        evaluation_state.pop(view.id(), None)
 
-                try:
-                    row = self.rows[target_row_index]
+class CsvSetOutputCommand(sublime_plugin.TextCommand):
+    def run(self, edit, **args):
+        edits = args.get('edits', [])
+        if 'output' in args:
+            edits = [[0, self.view.size(), args['output']]]
 
-                    while target_column_index >= len(row):
-                        row.append(CSVValue(''.ljust(self.column_widths[len(row)])))
+        CSVMatrix.ApplyEdits(self.view, edit, edits, args.get('saved_selection'))
 
-                    target_value = self.rows[target_row_index][target_column_index]
-                    target_value.text = str(result).ljust(len(target_value.text))
+def GetSortDirections(direction, names):
+    """ Returns the directions of the sort keys: those named in names, each
+    'asc' or 'desc', then direction for the remaining keys.  Returns None if
+    a name isn't valid.
+    """
+    directions = []
+    for name in names or []:
+        if name not in ('asc', 'desc'):
+            sublime.error_message(__name__ + ": '{0}' is not a sort direction; use 'asc' or 'desc'.".format(name))
+            return None
+        directions.append(csvengine.SortDirection.Ascending if name == 'asc' else csvengine.SortDirection.Descending)
 
-                except IndexError:
-                    print("Invalid expression target cell [{0}, {1}].".format(target_row_index, target_column_index))
+    return directions + [direction]
 
-    def Evaluate(self):
-        if not numpy:
-            print("Cannot evaluate without NumPy.")
-            return
+def SortTask(selection, directions, use_header, saved_selection):
+    def sort(task):
+        matrix = task.GetMatrix()
+        if not matrix:
+            return None
 
-        self.MeasureColumns()
+        sort_keys = matrix.GetSortKeysFromSelection(selection, directions)
 
-        dimensions = (len(self.rows), self.num_columns)
+        matrix.BeginProgressStage(0.0, 0.5)
+        matrix.SortByColumns(sort_keys, use_header)
+        matrix.progress_stage = (0.5, 1.0)
+        edits = matrix.GetRowEdits(csvengine.FormatMode.Plain)
 
-        m = numpy.zeros(dimensions)
+        return {'edits': edits, 'saved_selection': saved_selection}
 
-        for row_index, row in enumerate(self.rows):
-            for column_index, value in enumerate(row):
-                is_float, float_value = value.AsFloat()
-                if is_float:
-                    m[row_index,column_index] = float_value
-
-        for row_index, row in enumerate(self.rows):
-            for column_index, value in enumerate(row):
-                expression_match = CSVMatrix.EXPRESSION_RE.match(value.text)
-                if expression_match:
-                    self.EvaluateExpressionCell(m, row_index, column_index, value, expression_match)
-
-class CsvSetOutputCommand(sublime_plugin.TextCommand):
-    def run(self, edit, **args):
-        if 'output' in args:
-            self.view.replace(edit, sublime.Region(0, self.view.size()), args['output']);
-        
-        if 'saved_selection' in args:
-            CSVMatrix.RestoreSelection(self.view, args['saved_selection'])
+    return sort
 
 class CsvSortByColAscCommand(sublime_plugin.TextCommand):
-    def run(self, edit):
-        self.matrix = CSVMatrix.FromView(self.view)
-        if not self.matrix.valid:
-            sublime.error_message(__name__ + ": The buffer doesn't appear to be a CSV file")
+    def run(self, edit, directions=None):
+        self.directions = GetSortDirections(csvengine.SortDirection.Ascending, directions)
+        if not self.directions:
             return
-        self.saved_selection = self.matrix.SaveSelection(self.view)
 
-        self.view.window().show_quick_panel(['Use header row', 'Don\'t use header row'], self.on_select_header_done)
+        self.selection = list(self.view.sel())
+        self.saved_selection = CSVMatrix.SaveSelection(self.view)
+
+        dialect = CSVMatrix.GetViewDialect(self.view)
+        self.view.window().show_quick_panel(['Use header row', 'Don\'t use header row'], self.on_select_header_done,
+            0, 0 if dialect and dialect['has_header'] else 1)
 
     def on_select_header_done(self, picked):
         if picked < 0:
             return
         use_header = picked == 0
 
-        column_index = self.matrix.GetColumnIndexFromCursor(self.view)
-        self.matrix.SortByColumn(column_index, SortDirection.Ascending, use_header)
-        output = self.matrix.Format()
-
-        self.view.run_command('csv_set_output', {'output': output, 'saved_selection': self.saved_selection})
+        CSVTask.Start(self.view, 'Sorting', SortTask(self.selection, self.directions, use_header, self.saved_selection))
 
 class CsvSortByColDescCommand(sublime_plugin.TextCommand):
-    def run(self, edit):
-        self.matrix = CSVMatrix.FromView(self.view)
-        if not self.matrix.valid:
-            sublime.error_message(__name__ + ": The buffer doesn't appear to be a CSV file")
+    def run(self, edit, directions=None):
+        self.directions = GetSortDirections(csvengine.SortDirection.Descending, directions)
+        if not self.directions:
             return
-        self.saved_selection = self.matrix.SaveSelection(self.view)
 
-        self.view.window().show_quick_panel(['Use header row', 'Don\'t use header row'], self.on_select_header_done)
+        self.selection = list(self.view.sel())
+        self.saved_selection = CSVMatrix.SaveSelection(self.view)
+
+        dialect = CSVMatrix.GetViewDialect(self.view)
+        self.view.window().show_quick_panel(['Use header row', 'Don\'t use header row'], self.on_select_header_done,
+            0, 0 if dialect and dialect['has_header'] else 1)
 
     def on_select_header_done(self, picked):
         if picked < 0:
             return
-#        use_header = picked == 0
-        use_header = False
-
-        column_index = self.matrix.GetColumnIndexFromCursor(self.view)
-        self.matrix.SortByColumn(column_index, SortDirection.Descending, use_header)
-        output = self.matrix.Format()
+        use_header = picked == 0
 
-        self.view.run_command('csv_set_output', {'output': output, 'saved_selection': self.saved_selection})
+        CSVTask.Start(self.view, 'Sorting', SortTask(self.selection, self.directions, use_header, self.saved_selection))
 
 class CsvInsertColCommand(sublime_plugin.TextCommand):
     def run(self, edit):
@@ -580,15 +690,12 @@ class CsvInsertColCommand(sublime_plugin.TextCommand):
         if not matrix.valid:
             sublime.error_message(__name__ + ": The buffer doesn't appear to be a CSV file")
             return
-        saved_selection = matrix.SaveSelection(self.view)
+        saved_selection = CSVMatrix.SaveSelection(self.view)
 
         column_index = matrix.GetColumnIndexFromCursor(self.view)
         matrix.InsertColumn(column_index)
 
-        output = matrix.Format()
-
-        self.view.replace(edit, sublime.Region(0, self.view.size()), output);
-        matrix.RestoreSelection(self.view, saved_selection)
+        CSVMatrix.ApplyEdits(self.view, edit, matrix.GetEdits(), saved_selection)
 
 class CsvDeleteColCommand(sublime_plugin.TextCommand):
     def run(self, edit):
@@ -596,82 +703,80 @@ class CsvDeleteColCommand(sublime_plugin.TextCommand):
         if not matrix.valid:
             sublime.error_message(__name__ + ": The buffer doesn't appear to be a CSV file")
             return
-        saved_selection = matrix.SaveSelection(self.view)
+        saved_selection = CSVMatrix.SaveSelection(self.view)
 
         column_index = matrix.GetColumnIndexFromCursor(self.view)
         matrix.DeleteColumn(column_index)
 
-        output = matrix.Format()
-
-        self.view.replace(edit, sublime.Region(0, self.view.size()), output);
-        matrix.RestoreSelection(self.view, saved_selection)
+        CSVMatrix.ApplyEdits(self.view, edit, matrix.GetEdits(), saved_selection)
 
 class CsvDeleteTrailingColsCommand(sublime_plugin.TextCommand):
     def run(self, edit):
-        matrix = CSVMatrix.FromView(self.view)
-        if not matrix.valid:
-            sublime.error_message(__name__ + ": The buffer doesn't appear to be a CSV file")
-            return
-        saved_selection = matrix.SaveSelection(self.view)
+        point = self.view.sel()[0].begin()
+        saved_selection = CSVMatrix.SaveSelection(self.view)
 
-        column_index = matrix.GetColumnIndexFromCursor(self.view)
-        matrix.DeleteTrailingColumns(column_index)
+        def delete_trailing_columns(task):
+            matrix = task.GetMatrix()
+            if not matrix:
+                return None
+
+            matrix.DeleteTrailingColumns(matrix.GetColumnIndexFromPoint(point))
 
-        output = matrix.Format()
+            return {'edits': matrix.GetEdits(), 'saved_selection': saved_selection}
 
-        self.view.replace(edit, sublime.Region(0, self.view.size()), output);
-        matrix.RestoreSelection(self.view, saved_selection)
+        CSVTask.Start(self.view, 'Deleting trailing columns', delete_trailing_columns)
 
 class CsvSelectColCommand(sublime_plugin.TextCommand):
     def run(self, edit):
-        matrix = CSVMatrix.FromView(self.view)
-        if not matrix.valid:
-            sublime.error_message(__name__ + ": The buffer doesn't appear to be a CSV file")
-            return
+        matrix = CSVMatrix.FromViewLazily(self.view)
 
         column_index = matrix.GetColumnIndexFromCursor(self.view)
         matrix.SelectColumn(column_index, self.view)
 
+def FormatTask(mode, saved_selection):
+    def format_rows(task):
+        matrix = task.GetMatrix()
+        if not matrix:
+            return None
+
+        return {'edits': matrix.GetRowEdits(mode), 'saved_selection': saved_selection}
+
+    return format_rows
+
 class CsvFormatCompactCommand(sublime_plugin.TextCommand):
     def run(self, edit):
-        matrix = CSVMatrix.FromView(self.view)
-        if not matrix.valid:
-            sublime.error_message(__name__ + ": The buffer doesn't appear to be a CSV file")
-            return
-        saved_selection = matrix.SaveSelection(self.view)
-
-        output = matrix.FormatCompacted()
+        saved_selection = CSVMatrix.SaveSelection(self.view)
 
-        self.view.replace(edit, sublime.Region(0, self.view.size()), output);
-        matrix.RestoreSelection(self.view, saved_selection)
+        CSVTask.Start(self.view, 'Compacting columns', FormatTask(csvengine.FormatMode.Compacted, saved_selection))
 
 class CsvFormatExpandCommand(sublime_plugin.TextCommand):
     def run(self, edit):
-        matrix = CSVMatrix.FromView(self.view)
-        if not matrix.valid:
-            sublime.error_message(__name__ + ": The buffer doesn't appear to be a CSV file")
-            return
-        saved_selection = matrix.SaveSelection(self.view)
+        saved_selection = CSVMatrix.SaveSelection(self.view)
 
-        output = matrix.FormatExpanded()
-
-        self.view.replace(edit, sublime.Region(0, self.view.size()), output);
-        matrix.RestoreSelection(self.view, saved_selection)
+        CSVTask.Start(self.view, 'Justifying columns', FormatTask(csvengine.FormatMode.Expanded, saved_selection))
 
 class CsvEvaluateCommand(sublime_plugin.TextCommand):
     def run(self, edit):
-        matrix = CSVMatrix.FromView(self.view)
-        if not matrix.valid:
-            sublime.error_message(__name__ + ": The buffer doesn't appear to be a CSV file")
-            return
-        saved_selection = matrix.SaveSelection(self.view)
+        saved_selection = CSVMatrix.SaveSelection(self.view)
+
+        def evaluate(task):
+            matrix = task.GetMatrix()
+            if not matrix:
+                return None
 
-        matrix.Evaluate()
-        output = matrix.Format()
+            matrix.BeginProgressStage(0.0, 0.8)
+            matrix.Evaluate()
+            matrix.progress_stage = (0.8, 1.0)
+            edits = matrix.GetRowEdits(csvengine.FormatMode.Plain, sorted(matrix.modified_row_indices))
+
+            return {'edits': edits, 'saved_selection': saved_selection}
+
+        CSVTask.Start(self.view, 'Evaluating', evaluate)
+
+class CsvCancelCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        CSVTask.Cancel(self.view)
 
-        self.view.replace(edit, sublime.Region(0, self.view.size()), output);
-        matrix.RestoreSelection(self.view, saved_selection)
-        
 class CsvFormatCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         self.matrix = CSVMatrix.FromView(self.view)
@@ -685,16 +790,14 @@ class CsvFormatCommand(sublime_plugin.TextCommand):
     CELL_RE = re.compile(r'{\d+}')
 
     def on_done(self, input):             
-        output = ''
-        numrows = len(self.matrix.rows)
+        formatted_rows = []
         for rowindex, row in enumerate(self.matrix.rows):
             formatted_row = input
             for columnindex, column in enumerate(row):                
                 formatted_row = formatted_row.replace('{' + str(columnindex) + '}', str(column.text))
             formatted_row = CsvFormatCommand.CELL_RE.sub('', formatted_row)
-            output += formatted_row
-            if rowindex < (numrows - 1):
-                output += '\n'
+            formatted_rows.append(formatted_row)
+        output = '\n'.join(formatted_rows)
 
         view = self.view.window().new_file()
         view.set_name('Formatted Output')
@@ -708,6 +811,82 @@ class CsvFormatCommand(sublime_plugin.TextCommand):
     def on_cancel(self):
         pass
 
+class CsvSortFileOnDiskCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        view = self.window.active_view()
+        filename = view.file_name() if view else None
+
+        self.window.show_input_panel('File to sort', filename or '',
+            self.on_path_done, None, None)
+
+    def on_path_done(self, input_path):
+        self.input_path = input_path
+
+        # Detect the dialect from the start of the file.
+        self.dialect = None
+        sample_size = CSVMatrix.DIALECT_SAMPLE_SIZE
+        try:
+            with io.open(input_path, encoding='utf-8', errors='replace', newline='') as file:
+                sample = file.read(sample_size + 1)
+            self.dialect = CSVMatrix.DetectDialect(sample[:sample_size], len(sample) > sample_size)
+        except (IOError, OSError):
+            pass
+
+        root, ext = os.path.splitext(input_path)
+        self.window.show_input_panel('Sorted output file', root + '.sorted' + ext,
+            self.on_output_done, None, None)
+
+    def on_output_done(self, output_path):
+        self.output_path = output_path
+
+        # Columns are numbered from 1, as on the csvengine command line.
+        self.window.show_input_panel('Sort by column (numbered from 1)', '1',
+            self.on_column_done, None, None)
+
+    def on_column_done(self, input):
+        if not input.strip().isdigit() or int(input) < 1:
+            sublime.error_message(__name__ + ": '{0}' is not a column number; columns are numbered from 1".format(input))
+            return
+        self.column_index = int(input) - 1
+
+        self.window.show_quick_panel(['Ascending', 'Descending'], self.on_select_direction_done)
+
+    def on_select_direction_done(self, picked):
+        if picked < 0:
+            return
+        self.direction = csvengine.SortDirection.Ascending if picked == 0 else csvengine.SortDirection.Descending
+
+        self.window.show_quick_panel(['Use header row', 'Don\'t use header row'], self.on_select_header_done,
+            0, 0 if self.dialect and self.dialect['has_header'] else 1)
+
+    def on_select_header_done(self, picked):
+        if picked < 0:
+            return
+        self.use_header = picked == 0
+
+        sublime.set_timeout_async(self.sort, 0)
+
+    def sort(self):
+        settings = sublime.load_settings('AdvancedCSV.sublime-settings')
+
+        dialect = self.dialect if settings.get('detect_dialect', True) else None
+        delimiter = CSVMatrix.ResolveDelimiter(settings, None, self.input_path, dialect)
+        tokenizer = csvengine.CSVTokenizer(delimiter, settings.get('auto_quote', True))
+
+        memory_budget = settings.get('external_sort_memory_mb', 64) * 1024 * 1024
+        sorter = csvengine.CSVFileSorter(tokenizer, memory_budget)
+
+        def progress(record_count):
+            sublime.status_message('Sorting {0}: {1} rows read'.format(os.path.basename(self.input_path), record_count))
+
+        try:
+            sorter.Sort(self.input_path, self.output_path, [(self.column_index, self.direction)], self.use_header, progress)
+        except (IOError, OSError) as e:
+            sublime.error_message(__name__ + ": Sorting failed: {0}".format(e))
+            return
+
+        sublime.status_message('Sorted {0} rows into {1}'.format(sorter.record_count, self.output_path))
+
 class CsvSetDelimiterCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         self.view.window().show_input_panel('Delimiter character', "",
@@ -721,3 +900,14 @@ class CsvSetDelimiterCommand(sublime_plugin.TextCommand):
 
     def on_cancel(self):
         pass
+
+plugin_load_time = time.time() - plugin_load_start
+
+def plugin_loaded():
+    print("Advanced CSV loaded in {0:.0f} ms.".format(plugin_load_time * 1000))
+
+    # Import NumPy in the background, so the first evaluation doesn't wait for it.
+    if sublime.load_settings('AdvancedCSV.sublime-settings').get('numpy_warm_up', True):
+        thread = threading.Thread(target=csvengine.GetNumPy)
+        thread.daemon = True
+        thread.start()
@@ -0,0 +1,137 @@
+# Checks that CSVCompactRows behaves like the list of CSVValue lists it
+# stands in for.
+
+import os, random, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from csvengine import csvengine
+
+FormatMode = csvengine.FormatMode
+SortDirection = csvengine.SortDirection
+
+def GetCells(rows):
+    return [[(value.text, value.first_char_index, value.last_char_index) for value in row] for row in rows]
+
+class CSVCompactRowsTest(unittest.TestCase):
+    # Random texts per test.
+    TEXT_COUNT = 500
+
+    ALPHABET = ['a', 'b', '1', '2', ' ', ',', ',', '"', '""', '\n', '\n', '\r\n']
+
+    def GetMatrices(self, seed):
+        """ Yields a random generator and two matrices of the same random
+        text, one with list rows and one with compact rows.
+        """
+        rng = random.Random(seed)
+        for text_index in range(self.TEXT_COUNT):
+            tokenizer = csvengine.CSVTokenizer(',', rng.random() < 0.5)
+            text = ''.join(rng.choice(self.ALPHABET) for i in range(rng.randint(0, 60)))
+
+            matrices = []
+            for parse in [tokenizer.ParseText, tokenizer.ParseTextCompact]:
+                matrix = csvengine.CSVMatrix(tokenizer)
+                matrix.text = text
+                matrix.rows, matrix.row_offsets = parse(text)
+                matrix.Finalize()
+                matrices.append(matrix)
+
+            yield rng, matrices[0], matrices[1]
+
+    def CheckSame(self, matrix, compact_matrix, message=None, cells=GetCells):
+        self.assertEqual(cells(compact_matrix.rows), cells(matrix.rows), message)
+        self.assertEqual(list(compact_matrix.row_offsets), list(matrix.row_offsets), message)
+        self.assertEqual(compact_matrix.GetEdits(), matrix.GetEdits(), message)
+        for mode in [FormatMode.Plain, FormatMode.Compacted, FormatMode.Expanded]:
+            self.assertEqual(compact_matrix.GetRowEdits(mode), matrix.GetRowEdits(mode), message)
+
+    def test_parse(self):
+        for rng, matrix, compact_matrix in self.GetMatrices(1):
+            self.assertIsInstance(compact_matrix.rows, csvengine.CSVCompactRows)
+            self.CheckSame(matrix, compact_matrix, matrix.text)
+            self.assertEqual(compact_matrix.num_columns, matrix.num_columns)
+
+    def test_access(self):
+        for rng, matrix, compact_matrix in self.GetMatrices(2):
+            rows, compact_rows = matrix.rows, compact_matrix.rows
+            self.assertEqual(len(compact_rows), len(rows))
+
+            for row_index in range(-len(rows), len(rows)):
+                row, compact_row = rows[row_index], compact_rows[row_index]
+                self.assertEqual(len(compact_row), len(row))
+                for cell_index in range(-len(row), len(row)):
+                    self.assertEqual(GetCells([[compact_row[cell_index]]]), GetCells([[row[cell_index]]]))
+                self.assertRaises(IndexError, lambda: compact_row[len(row)])
+
+                begin = rng.randint(0, len(row))
+                end = rng.randint(begin, len(row))
+                self.assertEqual(GetCells([compact_row[begin:end]]), GetCells([row[begin:end]]))
+                self.assertEqual(GetCells([compact_row + [csvengine.CSVValue('x')]]), GetCells([row + [csvengine.CSVValue('x')]]))
+
+            begin = rng.randint(0, len(rows))
+            end = rng.randint(begin, len(rows))
+            self.assertEqual(GetCells(compact_rows[begin:end]), GetCells(rows[begin:end]))
+
+    def test_sort(self):
+        for rng, matrix, compact_matrix in self.GetMatrices(3):
+            sort_keys = [(rng.randint(0, 2), rng.choice([SortDirection.Ascending, SortDirection.Descending])) for i in range(rng.randint(1, 2))]
+            use_header = rng.random() < 0.5
+            for m in [matrix, compact_matrix]:
+                m.SortByColumns(sort_keys, use_header)
+            self.CheckSame(matrix, compact_matrix, (matrix.text, sort_keys, use_header))
+
+    def test_columns(self):
+        operations = [
+            lambda m, column_index: m.InsertColumn(column_index),
+            lambda m, column_index: m.DeleteColumn(column_index),
+            lambda m, column_index: m.DeleteTrailingColumns(column_index),
+        ]
+
+        for rng, matrix, compact_matrix in self.GetMatrices(4):
+            operation = rng.choice(operations)
+            column_index = rng.randint(0, matrix.num_columns)
+            for m in [matrix, compact_matrix]:
+                operation(m, column_index)
+
+            # Where in the row an inserted cell sits doesn't matter, its
+            # delimiter is in the edits.
+            self.CheckSame(matrix, compact_matrix, matrix.text, lambda rows: [[value.text for value in row] for row in rows])
+
+    def test_modify(self):
+        for rng, matrix, compact_matrix in self.GetMatrices(5):
+            for i in range(5):
+                row_index = rng.randrange(len(matrix.rows))
+                value = csvengine.CSVValue(rng.choice(['x', 'y,z', '"q"']))
+                action = rng.randint(0, 3)
+                add_row = rng.random() < 0.2
+                for m in [matrix, compact_matrix]:
+                    row = m.rows[row_index]
+                    if action == 0:
+                        row.append(value)
+                    elif action == 1:
+                        row.insert(0, value)
+                    elif action == 2 and len(row) > 1:
+                        row.pop()
+                    elif action == 3:
+                        row[0] = value
+                    if add_row:
+                        m.AddRow([value, value])
+            self.CheckSame(matrix, compact_matrix, matrix.text)
+
+    def test_copy(self):
+        tokenizer = csvengine.CSVTokenizer(',', True)
+        rows, row_offsets = tokenizer.ParseTextCompact('b,1\na,2\n')
+        rows[0][0] = csvengine.CSVValue('c')
+        cells = GetCells(rows)
+
+        copy = rows.Copy()
+        copy[0][1] = csvengine.CSVValue('3')
+        copy.sort(key=lambda row: row[0].text)
+        copy.append([csvengine.CSVValue('d')])
+        copy.InsertColumn(0)
+
+        self.assertEqual(GetCells(rows), cells)
+        self.assertEqual([[value.text for value in row] for row in copy], [['', ''], ['', 'a', '2'], ['', 'c', '3'], ['', 'd']])
+
+if __name__ == '__main__':
+    unittest.main()
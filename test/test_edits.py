@@ -0,0 +1,106 @@
+# Checks the buffer edits made by the column commands and by GetRowEdits
+# against replacing the whole buffer with the formatted rows, as the
+# commands did before.
+
+import os, random, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from csvengine import csvengine
+
+FormatMode = csvengine.FormatMode
+
+def GetTexts(tokenizer, text):
+    return [[value.text for value in row] for row in tokenizer.ParseText(text)[0]]
+
+class EditsTest(unittest.TestCase):
+    # Random texts per tokenizer.
+    TEXT_COUNT = 2000
+
+    ALPHABET = ['a', 'b', ' ', ',', ',', '"', '""', '\n', '\n']
+
+    def GenerateText(self, rng):
+        return ''.join(rng.choice(self.ALPHABET) for i in range(rng.randint(0, 40)))
+
+    def GetMatrices(self, seed):
+        rng = random.Random(seed)
+        for text_index in range(self.TEXT_COUNT):
+            tokenizer = csvengine.CSVTokenizer(',', rng.random() < 0.5)
+            text = self.GenerateText(rng)
+            matrix = csvengine.CSVMatrix.FromText(text, tokenizer)
+            if matrix.valid:
+                yield rng, tokenizer, text, matrix
+
+    def CheckColumnEdits(self, modify, seed):
+        for rng, tokenizer, text, matrix in self.GetMatrices(seed):
+            column_index = rng.randint(0, matrix.num_columns)
+            modify(matrix, column_index)
+
+            # The cells are the same as in the whole formatted buffer, though
+            # the unchanged cells keep their quoting.
+            edited_text = matrix.GetEditedText(matrix.GetEdits())
+            message = '{0!r}, column {1}, auto_quote {2}'.format(text, column_index, tokenizer.auto_quote)
+            self.assertEqual(GetTexts(tokenizer, edited_text), GetTexts(tokenizer, matrix.Format()), message)
+
+    def test_insert_column(self):
+        self.CheckColumnEdits(lambda matrix, column_index: matrix.InsertColumn(column_index), 1)
+
+    def test_delete_column(self):
+        self.CheckColumnEdits(lambda matrix, column_index: matrix.DeleteColumn(column_index), 2)
+
+    def test_delete_trailing_columns(self):
+        self.CheckColumnEdits(lambda matrix, column_index: matrix.DeleteTrailingColumns(column_index), 3)
+
+    def test_row_edits(self):
+        for rng, tokenizer, text, matrix in self.GetMatrices(4):
+            mode = rng.choice([FormatMode.Plain, FormatMode.Compacted, FormatMode.Expanded])
+            if rng.random() < 0.5:
+                matrix.SortByColumn(0, csvengine.SortDirection.Ascending, False)
+            if rng.random() < 0.3:
+                matrix.AddRow([csvengine.CSVValue('x'), csvengine.CSVValue('y,"z')])
+
+            edited_text = matrix.GetEditedText(matrix.GetRowEdits(mode))
+            self.assertEqual(edited_text, matrix.FormatText(mode), '{0!r}, mode {1}'.format(text, mode))
+
+    def test_row_edits_subset(self):
+        tokenizer = csvengine.CSVTokenizer(',', True)
+        matrix = csvengine.CSVMatrix.FromText('a,b\nc,d\ne,f', tokenizer)
+        matrix.rows[0][0] = csvengine.CSVValue('x')
+        matrix.rows[2][1] = csvengine.CSVValue('y')
+
+        # Only the rows asked for are rewritten.
+        self.assertEqual(matrix.GetRowEdits(FormatMode.Plain, [2]), [[8, 11, 'e,y']])
+
+    def test_crlf(self):
+        tokenizer = csvengine.CSVTokenizer(',', True)
+        matrix = csvengine.CSVMatrix.FromText('b , 1\r\na,2\r\n', tokenizer)
+        matrix.SortByColumn(0, csvengine.SortDirection.Ascending, False)
+
+        # Line endings are left as they were.
+        self.assertEqual(matrix.GetEditedText(matrix.GetRowEdits(FormatMode.Compacted)), 'a,2\r\nb,1\r\n')
+
+    def test_coalesce(self):
+        tokenizer = csvengine.CSVTokenizer(',', True)
+        text = '\n'.join(['a,b'] * 50)
+        expected = None
+
+        for limit in [csvengine.CSVMatrix.MAX_BUFFER_EDITS, 10]:
+            saved_limit = csvengine.CSVMatrix.MAX_BUFFER_EDITS
+            csvengine.CSVMatrix.MAX_BUFFER_EDITS = limit
+            try:
+                matrix = csvengine.CSVMatrix.FromText(text, tokenizer)
+                matrix.InsertColumn(1)
+                edits = matrix.GetEdits()
+            finally:
+                csvengine.CSVMatrix.MAX_BUFFER_EDITS = saved_limit
+
+            edited_text = matrix.GetEditedText(edits)
+            if expected is None:
+                expected = edited_text
+                self.assertEqual(len(edits), 50)
+            else:
+                self.assertEqual(edited_text, expected)
+                self.assertEqual(len(edits), 1)
+
+if __name__ == '__main__':
+    unittest.main()
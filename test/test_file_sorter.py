@@ -0,0 +1,117 @@
+# Checks CSVFileSorter's external merge sort against sorting the records
+# in memory with SortByColumns.
+
+import io, os, random, shutil, sys, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from csvengine import csvengine
+
+SortDirection = csvengine.SortDirection
+
+def ReferenceSort(text, tokenizer, sort_keys, use_header):
+    """ Sorts the records of text in memory, keeping each record's text as it
+    was, with the line ending of the first record between them.
+    """
+    rows, row_offsets = tokenizer.ParseText(text)
+
+    records = []
+    for row_index, offset in enumerate(row_offsets):
+        end = row_offsets[row_index + 1] - 1 if row_index + 1 < len(row_offsets) else len(text)
+        records.append(text[offset:end])
+
+    line_ending = '\n'
+    if len(records) > 1:
+        if records[0].endswith('\r'):
+            line_ending = '\r\n'
+        records = [record[:-1] if record.endswith('\r') else record for record in records[:-1]] + records[-1:]
+
+    # A final newline ends the last record rather than starting an empty one.
+    final_newline = len(records) > 1 and records[-1] == ''
+    if final_newline:
+        del rows[-1]
+        del records[-1]
+
+    matrix = csvengine.CSVMatrix(tokenizer)
+    matrix.rows = list(rows)
+    matrix.SortByColumns(sort_keys, use_header)
+
+    record_indices = dict((id(row), row_index) for row_index, row in enumerate(rows))
+    output = line_ending.join(records[record_indices[id(row)]] for row in matrix.rows)
+    if final_newline:
+        output += line_ending
+    return output
+
+class CSVFileSorterTest(unittest.TestCase):
+    # Random files sorted.
+    FILE_COUNT = 300
+
+    CELLS = ['', '1', '2', '10', '-3.5', 'a', 'b', 'B', ' a', '"x,y"', '"p\nq"', '"r\r\ns"', '"t""u"']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='csvtest')
+        self.input_path = os.path.join(self.directory, 'input.csv')
+        self.output_path = os.path.join(self.directory, 'output.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def Sort(self, text, tokenizer, memory_budget, sort_keys, use_header):
+        with io.open(self.input_path, 'w', newline='') as file:
+            file.write(text)
+
+        sorter = csvengine.CSVFileSorter(tokenizer, memory_budget)
+        sorter.Sort(self.input_path, self.output_path, sort_keys, use_header)
+
+        with io.open(self.output_path, newline='') as file:
+            return file.read()
+
+    def GenerateText(self, rng):
+        line_ending = rng.choice(['\n', '\r\n'])
+        rows = []
+        for row_index in range(rng.randint(1, 40)):
+            rows.append(','.join(rng.choice(self.CELLS) for i in range(rng.randint(1, 4))))
+
+        text = line_ending.join(rows)
+        if rng.random() < 0.5:
+            text += line_ending
+        return text
+
+    def test_random(self):
+        rng = random.Random(1)
+
+        saved_fan_in = csvengine.CSVFileSorter.MERGE_FAN_IN
+        try:
+            for file_index in range(self.FILE_COUNT):
+                tokenizer = csvengine.CSVTokenizer(',', True)
+                text = self.GenerateText(rng)
+                sort_keys = [(rng.randint(0, 3), rng.choice([SortDirection.Ascending, SortDirection.Descending])) for i in range(rng.randint(1, 3))]
+                use_header = rng.random() < 0.5
+
+                # From one record per run, merged a few at a time in several
+                # passes, to every record in one run.
+                memory_budget = rng.choice([100, 500, 2000, 64 * 1024 * 1024])
+                csvengine.CSVFileSorter.MERGE_FAN_IN = rng.choice([2, 3, saved_fan_in])
+
+                expected = ReferenceSort(text, tokenizer, sort_keys, use_header)
+                actual = self.Sort(text, tokenizer, memory_budget, sort_keys, use_header)
+                self.assertEqual(actual, expected, '{0!r}, {1}, header {2}, budget {3}'.format(text, sort_keys, use_header, memory_budget))
+        finally:
+            csvengine.CSVFileSorter.MERGE_FAN_IN = saved_fan_in
+
+    def test_header(self):
+        tokenizer = csvengine.CSVTokenizer(',', True)
+        text = 'name,n\nb,2\n"a\nc",10\n,1\n'
+
+        self.assertEqual(self.Sort(text, tokenizer, 100, [(1, SortDirection.Descending)], True), 'name,n\n"a\nc",10\nb,2\n,1\n')
+        self.assertEqual(self.Sort(text, tokenizer, 100, [(0, SortDirection.Ascending)], True), 'name,n\n"a\nc",10\nb,2\n,1\n')
+        self.assertEqual(self.Sort(text, tokenizer, 100, [(0, SortDirection.Descending)], False), 'name,n\nb,2\n"a\nc",10\n,1\n')
+
+    def test_record_too_large(self):
+        tokenizer = csvengine.CSVTokenizer(',', True)
+        text = 'a,"stray\n' + 'b,c\n' * 1000
+
+        self.assertRaises(csvengine.CSVRecordTooLarge, self.Sort, text, tokenizer, 1024, [(0, SortDirection.Ascending)], False)
+
+if __name__ == '__main__':
+    unittest.main()
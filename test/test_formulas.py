@@ -0,0 +1,164 @@
+# Checks the order formulas are evaluated in against a simple topological
+# sort, and that evaluating again skips the formulas whose cells didn't
+# change.
+
+import heapq, io, os, random, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from csvengine import csvengine
+
+def Overlaps(a, b, num_columns):
+    """ Whether two (row_begin, row_end, column_begin, column_end) ranges
+    share a cell within the first num_columns columns.
+    """
+    return (max(a[0], b[0]) < min(a[1], b[1]) and
+            max(a[2], b[2]) < min(a[3], b[3], num_columns))
+
+def ReferenceFormulaOrder(formulas, num_columns):
+    """ Orders formulas after every formula whose target they read, lowest
+    index first among those that are ready, comparing every pair.  Formulas
+    left in a cycle follow in document order.
+    """
+    dependents = [[] for formula in formulas]
+    dependency_counts = [0] * len(formulas)
+    for index, formula in enumerate(formulas):
+        for source_index, source in enumerate(formulas):
+            if source_index != index and any(Overlaps(source.target_range, read_range, num_columns) for read_range in formula.read_ranges):
+                dependents[source_index].append(index)
+                dependency_counts[index] += 1
+
+    ready = [index for index in range(len(formulas)) if dependency_counts[index] == 0]
+    order = []
+    while ready:
+        index = heapq.heappop(ready)
+        order.append(index)
+        for dependent_index in dependents[index]:
+            dependency_counts[dependent_index] -= 1
+            if dependency_counts[dependent_index] == 0:
+                heapq.heappush(ready, dependent_index)
+
+    cycle = [index for index in range(len(formulas)) if dependency_counts[index] > 0]
+    return order + cycle, len(cycle)
+
+def CaptureOutput(function, *args):
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        result = function(*args)
+        return result, sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+class GetFormulaOrderTest(unittest.TestCase):
+    # Random formula sets.
+    SET_COUNT = 1000
+
+    def GenerateRange(self, rng, num_rows, num_columns):
+        # Mostly single cells and short ranges, some taller than
+        # TALL_TARGET_ROWS, and columns past the end of the matrix.
+        height = rng.choice([1, 1, 2, 5, csvengine.CSVMatrix.TALL_TARGET_ROWS + rng.randint(-1, 40)])
+        row_begin = rng.randint(0, num_rows)
+        column_begin = rng.randint(0, num_columns + 1)
+        return (row_begin, row_begin + height, column_begin, column_begin + rng.randint(1, 3))
+
+    def test_random(self):
+        rng = random.Random(1)
+        matrix = csvengine.CSVMatrix(csvengine.CSVTokenizer(',', True))
+
+        for set_index in range(self.SET_COUNT):
+            num_rows = rng.choice([10, 100, 300])
+            matrix.num_columns = rng.randint(1, 6)
+
+            formulas = []
+            for index in range(rng.randint(0, 12)):
+                formula = csvengine.CSVFormula(rng.randrange(num_rows), 0, csvengine.CSVValue('='), None)
+                formula.target_range = self.GenerateRange(rng, num_rows, matrix.num_columns)
+                formula.read_ranges = [self.GenerateRange(rng, num_rows, matrix.num_columns) for i in range(rng.randint(0, 3))]
+                formulas.append(formula)
+
+            expected_order, cycle_count = ReferenceFormulaOrder(formulas, matrix.num_columns)
+            order, output = CaptureOutput(matrix.GetFormulaOrder, formulas)
+
+            self.assertEqual([formulas.index(formula) for formula in order], expected_order)
+            self.assertEqual('Circular reference' in output, cycle_count > 0)
+            for index, formula in enumerate(formulas):
+                has_dependents = any(Overlaps(formula.target_range, read_range, matrix.num_columns)
+                                     for other_index, other in enumerate(formulas) if other_index != index
+                                     for read_range in other.read_ranges)
+                self.assertEqual(formula.has_dependents, has_dependents)
+
+class EvaluateTest(unittest.TestCase):
+    def setUp(self):
+        self.tokenizer = csvengine.CSVTokenizer(',', True)
+
+    def Evaluate(self, text, previous_state=None):
+        """ Returns the evaluated text, the evaluation state and the
+        positions of the formulas that were evaluated.
+        """
+        matrix = csvengine.CSVMatrix.FromText(text, self.tokenizer)
+
+        evaluated = []
+        evaluate_cell = matrix.EvaluateExpressionCell
+        def EvaluateExpressionCell(m, row_index, column_index, *args):
+            evaluated.append((row_index, column_index))
+            return evaluate_cell(m, row_index, column_index, *args)
+        matrix.EvaluateExpressionCell = EvaluateExpressionCell
+
+        state, output = CaptureOutput(matrix.Evaluate, previous_state)
+        edits = matrix.GetRowEdits(csvengine.FormatMode.Plain, sorted(matrix.modified_row_indices))
+        return matrix.GetEditedText(edits), state, evaluated
+
+    def test_dependency_order(self):
+        # The totals row reads the cells written by the formula after it.
+        text = '\n'.join([
+            'item,price,qty,total',
+            'shoes,12,2,',
+            'hat,2,1,',
+            'total,,,',
+            '"[3,1:4]=m[1:3,col].sum()"',
+            '"[1:3,3]=m[row,1]*m[row,2]"',
+        ])
+
+        evaluated_text, state, evaluated = self.Evaluate(text)
+        self.assertEqual(evaluated, [(5, 0), (4, 0)])
+        self.assertEqual(evaluated_text.split('\n')[1:4], ['shoes,12,2,24.0', 'hat,2,1,2.0', 'total,14.0,3.0,26.0'])
+
+    def test_cycle(self):
+        text = '0,"[0,1]=m[0,2]+1","[0,2]=m[0,1]+1"'
+
+        evaluated_text, state, evaluated = self.Evaluate(text)
+        self.assertEqual(evaluated, [(0, 1), (0, 2)])
+
+    def test_incremental(self):
+        text = '\n'.join([
+            '1,2,,',
+            '3,4,,',
+            '"[0,2]=m[0,0]+m[0,1]","[1,2]=m[1,0]+m[1,1]","[0:2,3]=m[row,2]*10"',
+        ])
+
+        evaluated_text, state, evaluated = self.Evaluate(text)
+        self.assertEqual(evaluated, [(2, 0), (2, 1), (2, 2)])
+        self.assertEqual(evaluated_text.split('\n')[:2], ['1,2,3.0,30.0', '3,4,7.0,70.0'])
+
+        # Nothing changed, so nothing is evaluated.
+        again_text, again_state, evaluated = self.Evaluate(evaluated_text, state)
+        self.assertEqual(evaluated, [])
+        self.assertEqual(again_text, evaluated_text)
+        self.assertEqual(again_state, state)
+
+        # An input of the second row changes, so its sum and the formula
+        # reading it are evaluated again.
+        edited_text = evaluated_text.replace('3,4,7.0', '3,5,7.0')
+        edited_text, state, evaluated = self.Evaluate(edited_text, state)
+        self.assertEqual(evaluated, [(2, 1), (2, 2)])
+        self.assertEqual(edited_text.split('\n')[:2], ['1,2,3.0,30.0', '3,5,8.0,80.0'])
+
+        # A target cell was overwritten, so its formula is evaluated again.
+        overwritten_text = edited_text.replace('1,2,3.0', '1,2,x')
+        overwritten_text, state, evaluated = self.Evaluate(overwritten_text, state)
+        self.assertEqual(evaluated, [(2, 0)])
+        self.assertEqual(overwritten_text.split('\n')[0], '1,2,3.0,30.0')
+
+if __name__ == '__main__':
+    unittest.main()
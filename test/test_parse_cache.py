@@ -0,0 +1,143 @@
+# Checks the parse cache's incremental re-parse against parsing the whole
+# edited text again.
+
+import os, random, sys, unittest
+
+package_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(package_directory, 'bench', 'stub'))
+sys.path.insert(0, package_directory)
+
+import sublime
+import csvplugin
+from csvengine import csvengine
+
+def GetCells(rows):
+    return [[(value.text, value.first_char_index, value.last_char_index) for value in row] for row in rows]
+
+class ReparseChangedRecordsTest(unittest.TestCase):
+    # Random texts, and random edits made to each.
+    TEXT_COUNT = 300
+    EDIT_COUNT = 20
+
+    # Quotes, newlines and CRLF line endings let an edit change where
+    # records begin and end.
+    ALPHABET = ['a', 'b', '1', ' ', ',', ',', '"', '""', '\n', '\n', '\r\n']
+
+    def GenerateText(self, rng, length):
+        return ''.join(rng.choice(self.ALPHABET) for i in range(length))
+
+    def Edit(self, rng, text):
+        begin = rng.randint(0, len(text))
+        end = min(len(text), begin + rng.choice([0, 0, 1, 2, 5, 20]))
+        return text[:begin] + self.GenerateText(rng, rng.choice([0, 1, 1, 2, 5])) + text[end:]
+
+    def CheckEdits(self, tokenizer, seed):
+        rng = random.Random(seed)
+
+        for text_index in range(self.TEXT_COUNT):
+            text = self.GenerateText(rng, rng.randint(0, 80))
+            rows, row_offsets = tokenizer.ParseText(text)
+
+            for edit_index in range(self.EDIT_COUNT):
+                old_text, old_rows, old_row_offsets = text, rows, row_offsets
+                old_cells = GetCells(old_rows)
+
+                text = self.Edit(rng, text)
+                rows, row_offsets, changed = csvplugin.CSVParseCache.ReparseChangedRecords(tokenizer, old_text, old_rows, old_row_offsets, text)
+
+                expected_rows, expected_row_offsets = tokenizer.ParseText(text)
+                message = 'edit of {0!r} into {1!r}'.format(old_text, text)
+                self.assertEqual(GetCells(rows), GetCells(expected_rows), message)
+                self.assertEqual(list(row_offsets), list(expected_row_offsets), message)
+
+                # The rows outside the changed range are the old ones.
+                begin, old_end, new_end = changed
+                self.assertEqual(GetCells(rows[:begin]), old_cells[:begin], message)
+                self.assertEqual(GetCells(rows[new_end:]), old_cells[old_end:], message)
+                self.assertEqual(len(rows) - new_end, len(old_rows) - old_end, message)
+
+                # The old rows are left as they were.
+                self.assertEqual(GetCells(old_rows), old_cells, message)
+
+    def test_auto_quote(self):
+        self.CheckEdits(csvengine.CSVTokenizer(',', True), 1)
+
+    def test_no_auto_quote(self):
+        self.CheckEdits(csvengine.CSVTokenizer(',', False), 2)
+
+    def test_unchanged(self):
+        tokenizer = csvengine.CSVTokenizer(',', True)
+        rows, row_offsets = tokenizer.ParseText('a,b\nc,d')
+        self.assertEqual(csvplugin.CSVParseCache.ReparseChangedRecords(tokenizer, 'a,b\nc,d', rows, row_offsets, 'a,b\nc,d'), (rows, row_offsets, (0, 0, 0)))
+
+class CSVParseCacheTest(unittest.TestCase):
+    LIMIT = 64 * 1024 * 1024
+
+    def setUp(self):
+        self.cache = csvplugin.CSVParseCache()
+        self.tokenizer = csvengine.CSVTokenizer(',', True)
+
+    def GetRows(self, view, compact_threshold=LIMIT):
+        rows, row_offsets, text = self.cache.GetRows(view, self.tokenizer, self.LIMIT, compact_threshold)
+        return GetCells(rows), list(row_offsets)
+
+    def Parse(self, text):
+        rows, row_offsets = self.tokenizer.ParseText(text)
+        return GetCells(rows), list(row_offsets)
+
+    def test_edits(self):
+        rng = random.Random(3)
+        view = sublime.View('a,b\n"c\nd",e\nf,g\n')
+        self.assertEqual(self.GetRows(view), self.Parse(view.text))
+
+        for edit_index in range(200):
+            begin = rng.randint(0, len(view.text))
+            end = min(len(view.text), begin + rng.randint(0, 3))
+            view.replace(None, sublime.Region(begin, end), rng.choice(['', 'x', ',', '"', '\n', 'y,"z\n']))
+
+            # Half the time the edit is re-parsed ahead of the command.
+            if rng.random() < 0.5:
+                self.cache.Refresh(view)
+            self.assertEqual(self.GetRows(view), self.Parse(view.text), view.text)
+
+    def test_compact(self):
+        view = sublime.View('a,b\nc,d\n')
+        self.assertEqual(self.GetRows(view, 0), self.Parse(view.text))
+
+        view.replace(None, sublime.Region(4, 5), 'x,"y\nz"')
+        self.assertEqual(self.GetRows(view, 0), self.Parse(view.text))
+
+    def test_tokenizer_change(self):
+        view = sublime.View('a,b;c\n')
+        self.GetRows(view)
+
+        self.tokenizer = csvengine.CSVTokenizer(';', True)
+        self.assertEqual(self.GetRows(view), self.Parse(view.text))
+
+    def test_commands_copy_on_write(self):
+        view = sublime.View('b,2\na,1\nc,3\n', 'test.csv')
+        rows = GetCells(csvplugin.CSVMatrix.FromView(view).rows)
+
+        for modify in [lambda matrix: matrix.SortByColumn(0, csvengine.SortDirection.Ascending, False),
+                       lambda matrix: matrix.InsertColumn(1),
+                       lambda matrix: matrix.DeleteColumn(0),
+                       lambda matrix: matrix.DeleteTrailingColumns(0),
+                       lambda matrix: matrix.AddRow([csvengine.CSVValue('d')])]:
+            modify(csvplugin.CSVMatrix.FromView(view))
+            self.assertEqual(GetCells(csvplugin.CSVMatrix.FromView(view).rows), rows)
+
+        csvplugin.parse_cache.Evict(view)
+
+    def test_trim(self):
+        views = [sublime.View('a,b\n' * 100) for i in range(3)]
+        size = None
+        for view in views:
+            # Room for two entries.
+            self.cache.GetRows(view, self.tokenizer, size * 2 if size else self.LIMIT, self.LIMIT)
+            size = size or self.cache.total_size
+
+        # The least recently used entry goes first.
+        self.assertEqual([self.cache.Contains(view) for view in views], [False, True, True])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# Checks CSVMatrix.MapSelection against mapping each point of the selection
+# on its own, and that ApplyEdits produces the edited text.
+
+import os, random, sys, unittest
+
+package_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(package_directory, 'bench', 'stub'))
+sys.path.insert(0, package_directory)
+
+import sublime
+import csvplugin
+from csvengine import csvengine
+
+def ReferenceMapPoint(text, edits, point, moves_past_inserts):
+    """ Moves point by the change in length of each edit before it, checking
+    every edit.
+    """
+    delta = 0
+    for begin, end, new_text in edits:
+        if point < begin or point == begin and (begin < end or not moves_past_inserts):
+            break
+
+        if point > end or begin == end:
+            delta += len(new_text) - (end - begin)
+            continue
+
+        # Inside, or at the end of, the replaced text: keep the line and
+        # column, clamped to the replacement.
+        old_lines = text[begin:point].split('\n')
+        line_index, column = len(old_lines) - 1, len(old_lines[-1])
+
+        new_lines = new_text.split('\n')
+        if line_index < len(new_lines):
+            offset = sum(len(line) + 1 for line in new_lines[:line_index]) + min(column, len(new_lines[line_index]))
+        else:
+            offset = len(new_text)
+        return begin + delta + offset
+
+    return point + delta
+
+def ReferenceMapSelection(text, edits, saved_selection):
+    mapped_selection = []
+    for a, b in saved_selection:
+        begin = ReferenceMapPoint(text, edits, min(a, b), True)
+        end = ReferenceMapPoint(text, edits, max(a, b), a == b)
+        mapped_selection.append((begin, end) if a <= b else (end, begin))
+    return mapped_selection
+
+class MapSelectionTest(unittest.TestCase):
+    # Random texts, each with random edits and selections.
+    TEXT_COUNT = 2000
+
+    ALPHABET = ['a', 'b', ' ', ',', ',', '"', '\n', '\n']
+
+    def GenerateText(self, rng, length):
+        return ''.join(rng.choice(self.ALPHABET) for i in range(length))
+
+    def GenerateEdits(self, rng, text):
+        """ Returns edits made by a column command or by reformatting, or
+        random ones.
+        """
+        matrix = csvengine.CSVMatrix.FromText(text, csvengine.CSVTokenizer(',', True))
+        if matrix.valid:
+            choice = rng.randint(0, 4)
+            if choice == 0:
+                matrix.InsertColumn(rng.randint(0, matrix.num_columns))
+                return matrix.GetEdits()
+            if choice == 1:
+                matrix.DeleteColumn(rng.randint(0, matrix.num_columns))
+                return matrix.GetEdits()
+            if choice == 2:
+                return matrix.GetRowEdits(rng.choice([csvengine.FormatMode.Compacted, csvengine.FormatMode.Expanded]))
+
+        positions = sorted(rng.randint(0, len(text)) for i in range(2 * rng.randint(0, 4)))
+        edits = []
+        for index in range(0, len(positions), 2):
+            begin, end = positions[index], positions[index + 1]
+            if edits and edits[-1][1] == begin == end:
+                continue
+            edits.append([begin, end, self.GenerateText(rng, rng.choice([0, 1, 3, 8]))])
+        return edits
+
+    def GenerateSelection(self, rng, text):
+        selection = []
+        for i in range(rng.randint(1, 4)):
+            a = rng.randint(0, len(text))
+            b = a if rng.random() < 0.4 else rng.randint(0, len(text))
+            selection.append((a, b))
+        return selection
+
+    def test_random(self):
+        rng = random.Random(1)
+
+        for text_index in range(self.TEXT_COUNT):
+            text = self.GenerateText(rng, rng.randint(0, 40))
+            edits = self.GenerateEdits(rng, text)
+            saved_selection = self.GenerateSelection(rng, text)
+
+            view = sublime.View(text)
+            expected_text = csvengine.CSVMatrix.FromText(text, csvengine.CSVTokenizer(',', True)).GetEditedText(edits)
+            expected_selection = ReferenceMapSelection(text, edits, saved_selection)
+            message = '{0!r}, {1!r}, {2!r}'.format(text, edits, saved_selection)
+
+            self.assertEqual(csvplugin.CSVMatrix.MapSelection(view, saved_selection, edits), expected_selection, message)
+
+            csvplugin.CSVMatrix.ApplyEdits(view, None, edits, saved_selection)
+            self.assertEqual(view.text, expected_text, message)
+            self.assertEqual(csvplugin.CSVMatrix.SaveSelection(view), expected_selection, message)
+
+    def test_inserts(self):
+        view = sublime.View('a,b')
+        edits = [[1, 1, ',x']]
+
+        # A caret moves past the insert, a region beginning there covers the
+        # same text, and a region ending there doesn't grow.
+        self.assertEqual(csvplugin.CSVMatrix.MapSelection(view, [(1, 1), (1, 3), (0, 1), (3, 1)], edits), [(3, 3), (3, 5), (0, 1), (5, 3)])
+
+    def test_replaced_row(self):
+        view = sublime.View('a , b\nc , d')
+        edits = [[0, 5, 'a,b']]
+
+        # The caret keeps its column, clamped to the shorter row.
+        self.assertEqual(csvplugin.CSVMatrix.MapSelection(view, [(2, 2), (4, 4), (5, 5), (8, 8)], edits), [(2, 2), (3, 3), (3, 3), (6, 6)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,325 @@
+# Checks TinyNumPy against results NumPy gives for the same operations,
+# on contiguous arrays, non-contiguous views and empty arrays.
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from tinynumpy import tinynumpy as tnp
+
+def ToList(a):
+    """ Returns the elements of a as nested lists, like NumPy's tolist. """
+    values = list(a.flat)
+
+    def nest(values, shape):
+        if len(shape) <= 1:
+            return values
+        size = len(values) // shape[0] if shape[0] else 0
+        return [nest(values[i * size:(i + 1) * size], shape[1:]) for i in range(shape[0])]
+
+    return nest(values, a.shape)
+
+class TinyNumPyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.a = tnp.array([[1, 2, 3], [4, 5, 6], [7, 8, 9], [10, 11, 12]], 'int64')
+        self.empty = tnp.zeros((0, 3))
+
+    def assertArray(self, actual, expected, shape=None):
+        """ Checks actual is an array of the expected nested values, to 7
+        decimal places, and of shape if given.
+        """
+        self.assertIsInstance(actual, tnp.ndarray)
+        if shape is not None:
+            self.assertEqual(actual.shape, shape)
+
+        def check(actual, expected):
+            if isinstance(expected, list):
+                self.assertEqual(len(actual), len(expected))
+                for a, e in zip(actual, expected):
+                    check(a, e)
+            elif isinstance(expected, bool):
+                self.assertIs(bool(actual), expected)
+            else:
+                self.assertAlmostEqual(actual, expected)
+
+        check(ToList(actual), expected)
+
+class ReductionTest(TinyNumPyTestCase):
+    def test_axis(self):
+        a = self.a
+        self.assertArray(a.sum(axis=0), [22, 26, 30], (3,))
+        self.assertArray(a.sum(axis=1), [6, 15, 24, 33], (4,))
+        self.assertArray(a.sum(axis=-1), [6, 15, 24, 33], (4,))
+        self.assertEqual(a.sum(), 78)
+
+        self.assertArray(a.min(axis=1), [1, 4, 7, 10])
+        self.assertArray(a.max(axis=0), [10, 11, 12])
+        self.assertArray(a.prod(axis=1), [6, 120, 504, 1320])
+        self.assertArray(a.ptp(axis=0), [9, 9, 9])
+        self.assertArray(a.mean(axis=0), [5.5, 6.5, 7.5])
+        self.assertArray(a.var(axis=1), [2 / 3.0] * 4)
+        self.assertArray(a.std(axis=0), [11.25 ** 0.5] * 3)
+        self.assertArray(a.argmax(axis=0), [3, 3, 3])
+        self.assertArray(a.argmin(axis=1), [0, 0, 0, 0])
+        self.assertEqual(a.argmax(), 11)
+
+    def test_keepdims(self):
+        self.assertArray(self.a.sum(axis=1, keepdims=True), [[6], [15], [24], [33]], (4, 1))
+        self.assertArray(self.a.max(axis=0, keepdims=True), [[10, 11, 12]], (1, 3))
+        self.assertArray(self.a.sum(keepdims=True), [[78]], (1, 1))
+
+    def test_bool(self):
+        mask = self.a > 5
+        self.assertArray(mask.all(axis=1), [False, False, True, True])
+        self.assertArray(mask.any(axis=0), [True, True, True])
+        self.assertArray(mask.sum(axis=0), [2, 2, 3])
+
+    def test_accumulate(self):
+        a = self.a
+        self.assertArray(a.cumsum(axis=0), [[1, 2, 3], [5, 7, 9], [12, 15, 18], [22, 26, 30]], (4, 3))
+        self.assertArray(a.cumsum(axis=1), [[1, 3, 6], [4, 9, 15], [7, 15, 24], [10, 21, 33]], (4, 3))
+        self.assertArray(a.cumsum(), [1, 3, 6, 10, 15, 21, 28, 36, 45, 55, 66, 78], (12,))
+        self.assertArray(a.cumprod(axis=1), [[1, 2, 6], [4, 20, 120], [7, 56, 504], [10, 110, 1320]])
+
+        out = tnp.zeros((4, 3), 'int64')
+        self.assertIs(a.cumsum(axis=0, out=out), out)
+        self.assertArray(out[3], [22, 26, 30])
+
+    def test_views(self):
+        self.assertArray(self.a.T.sum(axis=0), [6, 15, 24, 33])
+        self.assertArray(self.a.T.cumsum(axis=1), [[1, 5, 12, 22], [2, 7, 15, 26], [3, 9, 18, 30]])
+        self.assertArray(self.a[::2, 1:].sum(axis=0), [10, 12])
+        self.assertArray(self.a[::2, 1:].cumsum(axis=1), [[2, 5], [8, 17]])
+        self.assertArray(self.a[::-1, 0].cumsum(), [10, 17, 21, 22])
+
+    def test_empty(self):
+        self.assertArray(self.empty.sum(axis=0), [0, 0, 0], (3,))
+        self.assertArray(self.empty.sum(axis=1), [], (0,))
+        self.assertEqual(self.empty.sum(), 0)
+        self.assertArray(self.empty.cumsum(axis=0), [], (0, 3))
+
+class BroadcastTest(TinyNumPyTestCase):
+    def setUp(self):
+        TinyNumPyTestCase.setUp(self)
+        self.row = tnp.array([10, 20, 30], 'int64')
+        self.column = tnp.array([[1], [2]], 'int64')
+
+    def test_arithmetic(self):
+        a, row, column = self.a, self.row, self.column
+        self.assertArray(a + row, [[11, 22, 33], [14, 25, 36], [17, 28, 39], [20, 31, 42]], (4, 3))
+        self.assertArray(column * row, [[10, 20, 30], [20, 40, 60]], (2, 3))
+        self.assertArray(row - column, [[9, 19, 29], [8, 18, 28]], (2, 3))
+        self.assertArray(2 ** row[:2], [1024, 1048576])
+        self.assertArray(row / 4, [2.5, 5, 7.5])
+        self.assertArray(row // 7, [1, 2, 4])
+        self.assertArray(row % 7, [3, 6, 2])
+        self.assertArray(-row, [-10, -20, -30])
+        self.assertArray(abs(column - 2), [[1], [0]])
+
+        x = tnp.array([1., 2, 3])
+        x += row
+        self.assertArray(x, [11, 22, 33])
+
+    def test_comparisons(self):
+        a = self.a
+        self.assertArray(a > 6, [[False] * 3, [False] * 3, [True] * 3, [True] * 3])
+        self.assertArray(self.row == 20, [False, True, False])
+        self.assertArray(self.column != 1, [[False], [True]])
+        self.assertArray((a > 3) & (a < 9), [[False, False, False], [True, True, True], [True, True, False], [False, False, False]])
+        self.assertArray(~(a > 6), [[True] * 3, [True] * 3, [False] * 3, [False] * 3])
+
+    def test_ufuncs(self):
+        self.assertArray(tnp.sqrt(tnp.array([4, 9])), [2, 3])
+        self.assertArray(tnp.where(self.a > 6, self.a, 0), [[0, 0, 0], [0, 0, 0], [7, 8, 9], [10, 11, 12]])
+
+    def test_views(self):
+        self.assertArray(self.a.T + tnp.array([1, 2, 3, 4]), [[2, 6, 10, 14], [3, 7, 11, 15], [4, 8, 12, 16]], (3, 4))
+        self.assertArray(self.a[::2, 1:] * self.column, [[2, 3], [16, 18]], (2, 2))
+        self.assertArray(self.a[::2, 1:] > self.a[1::2, :2], [[False, False], [False, False]])
+
+    def test_empty(self):
+        self.assertArray(self.empty + self.row, [], (0, 3))
+        self.assertArray(self.empty[:, :1] * self.row, [], (0, 3))
+        self.assertArray(self.empty == 0, [], (0, 3))
+
+    def test_mismatch(self):
+        self.assertRaises(ValueError, lambda: self.a + tnp.array([1, 2]))
+        self.assertRaises(ValueError, lambda: self.empty + tnp.zeros((2, 3)))
+
+class ViewTest(TinyNumPyTestCase):
+    def test_transpose(self):
+        a = self.a
+        t = a.T
+        self.assertArray(t, [[1, 4, 7, 10], [2, 5, 8, 11], [3, 6, 9, 12]], (3, 4))
+        self.assertIs(t.base, a)
+        self.assertArray(a[::-1].T, [[10, 7, 4, 1], [11, 8, 5, 2], [12, 9, 6, 3]])
+        self.assertArray(tnp.arange(24).reshape(2, 3, 4).transpose(2, 0, 1)[1], [[1, 5, 9], [13, 17, 21]], (2, 3))
+        self.assertArray(self.empty.T, [[], [], []], (3, 0))
+
+        t[0, 1] = 40
+        self.assertEqual(a[1, 0], 40)
+
+    def test_slices(self):
+        a = self.a
+        v = a[::2, 1:]
+        self.assertArray(v, [[2, 3], [8, 9]], (2, 2))
+        self.assertArray(v.T, [[2, 8], [3, 9]])
+        self.assertArray(a[:, ::-1], [[3, 2, 1], [6, 5, 4], [9, 8, 7], [12, 11, 10]])
+
+        v[1, 0] = -8
+        self.assertEqual(a[2, 1], -8)
+
+    def test_reshape(self):
+        a = self.a
+        r = a.reshape(2, 6)
+        self.assertArray(r, [[1, 2, 3, 4, 5, 6], [7, 8, 9, 10, 11, 12]], (2, 6))
+        self.assertIs(r.base, a)
+        self.assertArray(a.reshape(3, -1), [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12]], (3, 4))
+        self.assertArray(self.empty.reshape(3, 0), [[], [], []], (3, 0))
+
+        # A view that isn't contiguous is copied in C order.
+        self.assertArray(a.T.reshape(12), [1, 4, 7, 10, 2, 5, 8, 11, 3, 6, 9, 12], (12,))
+        self.assertArray(a[::2, 1:].reshape(4), [2, 3, 8, 9], (4,))
+
+        self.assertRaises(ValueError, a.reshape, 5, 2)
+
+    def test_copy(self):
+        a = self.a
+        c = a[::2, 1:].copy()
+        self.assertArray(c, [[2, 3], [8, 9]], (2, 2))
+        self.assertTrue(c.flags['C_CONTIGUOUS'])
+
+        c[0, 0] = 0
+        self.assertEqual(a[0, 1], 2)
+
+        c = a.T.copy()
+        self.assertArray(c, ToList(a.T))
+        self.assertTrue(c.flags['C_CONTIGUOUS'])
+        self.assertArray(self.empty.T.copy(), [[], [], []], (3, 0))
+
+class FancyIndexTest(TinyNumPyTestCase):
+    def test_get(self):
+        a = self.a
+        self.assertArray(a[a > 6], [7, 8, 9, 10, 11, 12], (6,))
+        self.assertArray(a[a[:, 2] > 5], [[4, 5, 6], [7, 8, 9], [10, 11, 12]], (3, 3))
+        self.assertArray(a[a[:, 2] > 5, 1], [5, 8, 11])
+        self.assertArray(a[[0, 2]], [[1, 2, 3], [7, 8, 9]])
+        self.assertArray(a[[3, 0, -1], [0, 2, 1]], [10, 3, 11])
+        self.assertArray(a[:, [2, 0]], [[3, 1], [6, 4], [9, 7], [12, 10]], (4, 2))
+        self.assertArray(a[1, [0, 2]], [4, 6])
+
+        # The result is a copy.
+        b = a[[0]]
+        b[0, 0] = 100
+        self.assertEqual(a[0, 0], 1)
+
+    def test_get_views(self):
+        self.assertArray(self.a.T[[0, 2]], [[1, 4, 7, 10], [3, 6, 9, 12]])
+        v = self.a[::2, 1:]
+        self.assertArray(v[[1, 0]], [[8, 9], [2, 3]])
+        self.assertArray(v[v > 3], [8, 9])
+
+    def test_get_empty(self):
+        self.assertArray(self.a[[]], [], (0, 3))
+        self.assertArray(self.a[self.a > 100], [], (0,))
+        self.assertArray(self.empty[self.empty > 0], [], (0,))
+
+    def test_set(self):
+        b = self.a.copy()
+        b[b > 6] = 0
+        self.assertArray(b, [[1, 2, 3], [4, 5, 6], [0, 0, 0], [0, 0, 0]])
+
+        b = self.a.copy()
+        b[[0, 2], 1] = tnp.array([-1, -2])
+        self.assertArray(b[:, 1], [-1, 5, -2, 11])
+
+        b = self.a.copy()
+        b[:, [0, 2]] = 7
+        self.assertArray(b, [[7, 2, 7], [7, 5, 7], [7, 8, 7], [7, 11, 7]])
+
+        b = self.a.copy()
+        b[b[:, 0] > 5] = tnp.array([0, 1, 2])
+        self.assertArray(b, [[1, 2, 3], [4, 5, 6], [0, 1, 2], [0, 1, 2]])
+
+    def test_set_views(self):
+        b = self.a.copy()
+        b.T[[1]] = 5
+        self.assertArray(b[:, 1], [5, 5, 5, 5])
+
+        b = self.a.copy()
+        v = b[::2, 1:]
+        v[v > 3] = -9
+        self.assertArray(b, [[1, 2, 3], [4, 5, 6], [7, -9, -9], [10, 11, 12]])
+
+    def test_errors(self):
+        a = self.a
+        self.assertRaises(IndexError, lambda: a[tnp.array([True, False])])
+        self.assertRaises(IndexError, lambda: a[[0, 5]])
+        self.assertRaises(IndexError, lambda: a[[0, 1], [0, 1, 2]])
+
+class LinalgTest(TinyNumPyTestCase):
+    def test_dot(self):
+        a = self.a
+        b = tnp.array([[1, 0], [0, 1], [2, -1]])
+        expected = [[7, -1], [16, -1], [25, -1], [34, -1]]
+        self.assertArray(tnp.dot(a, b), expected, (4, 2))
+        self.assertArray(tnp.matmul(a, b), expected, (4, 2))
+        self.assertArray(a.dot(b), expected, (4, 2))
+
+        self.assertEqual(tnp.dot(tnp.array([1, 2, 3]), tnp.array([4, 5, 6])), 32)
+        self.assertArray(tnp.dot(a, tnp.array([1, 0, -1])), [-2, -2, -2, -2], (4,))
+        self.assertArray(tnp.dot(tnp.array([1, 1, 1, 1]), a), [22, 26, 30], (3,))
+        self.assertArray(tnp.dot(a, 2), ToList(a * 2))
+
+        self.assertRaises(ValueError, tnp.dot, a, a)
+        self.assertRaises(ValueError, tnp.matmul, a, 2)
+
+    def test_dot_views(self):
+        a = self.a
+        self.assertArray(tnp.dot(a.T, a), [[166, 188, 210], [188, 214, 240], [210, 240, 270]], (3, 3))
+        v = a[::2, 1:]
+        self.assertArray(tnp.dot(v, v.T), [[13, 43], [43, 145]], (2, 2))
+
+    def test_dot_empty(self):
+        self.assertArray(tnp.dot(self.empty, tnp.zeros((3, 2))), [], (0, 2))
+        self.assertArray(tnp.dot(tnp.zeros((2, 0)), tnp.zeros((0, 3))), [[0, 0, 0], [0, 0, 0]], (2, 3))
+
+    def test_solve(self):
+        a = tnp.array([[2, 1], [1, 3]])
+        self.assertArray(tnp.linalg.solve(a, tnp.array([3, 5])), [0.8, 1.4], (2,))
+        self.assertArray(tnp.linalg.solve(a, tnp.array([[3, 1], [5, 0]])), [[0.8, 0.6], [1.4, -0.2]], (2, 2))
+        self.assertArray(tnp.linalg.inv(a), [[0.6, -0.2], [-0.2, 0.4]])
+        self.assertAlmostEqual(tnp.linalg.det(a), 5)
+
+        # A zero pivot is swapped with a lower row.
+        p = tnp.array([[0, 1], [1, 0]])
+        self.assertAlmostEqual(tnp.linalg.det(p), -1)
+        self.assertArray(tnp.linalg.solve(p.T, tnp.array([3, 5])), [5, 3])
+
+        singular = tnp.array([[1, 2], [2, 4]])
+        self.assertEqual(tnp.linalg.det(singular), 0)
+        self.assertRaises(tnp.linalg.LinAlgError, tnp.linalg.solve, singular, tnp.array([1, 2]))
+
+    def test_lstsq(self):
+        x, residuals, rank, s = tnp.linalg.lstsq(tnp.array([[1, 0], [1, 1], [1, 2]]), tnp.array([1, 2, 4]))
+        self.assertArray(x, [5 / 6.0, 1.5], (2,))
+        self.assertArray(residuals, [1 / 6.0], (1,))
+        self.assertEqual(rank, 2)
+        self.assertIsNone(s)
+
+        # An exact solution has no residuals.
+        x, residuals, rank, s = tnp.linalg.lstsq(tnp.array([[2, 0], [0, 4]]), tnp.array([2, 8]))
+        self.assertArray(x, [1, 2])
+        self.assertArray(residuals, [], (0,))
+
+        self.assertRaises(tnp.linalg.LinAlgError, tnp.linalg.lstsq, tnp.array([[1, 2], [2, 4], [3, 6]]), tnp.array([1, 2, 3]))
+
+    def test_lstsq_view(self):
+        a = tnp.array([[1, 1, 0], [0, 1, 1], [1, 2, 3], [4, 4, 4]])[:, ::2]
+        b = tnp.array([[1, 0], [2, 1], [3, 0], [4, 1]])
+        x, residuals, rank, s = tnp.linalg.lstsq(a, b)
+        self.assertArray(x, [[7 / 107.0, 9 / 107.0], [106 / 107.0, 14 / 107.0]], (2, 2))
+        self.assertArray(residuals, [208 / 107.0, 108 / 107.0], (2,))
+
+if __name__ == '__main__':
+    unittest.main()
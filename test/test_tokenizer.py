@@ -0,0 +1,100 @@
+# Checks CSVTokenizer.ParseRow against the original per-character parser.
+
+import os, random, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from csvengine import csvengine
+
+def ReferenceParseRow(row, delimiter, auto_quote):
+    """ The ParseRow state machine from before the regex tokenizer, which
+    parsed one line at a time.  Returns (text, first_char_index,
+    last_char_index) for each cell.
+    """
+    columns = []
+
+    currentword = ''
+    first_char_index = 0
+    insidequotes = False
+
+    char_index = 0
+    while char_index < len(row):
+        char = row[char_index]
+
+        if insidequotes:
+            if char == '"':
+                if char_index < len(row) - 1 and row[char_index + 1] == '"':
+                    if auto_quote:
+                        currentword += '"'
+                    else:
+                        currentword += '""'
+                    char_index += 2
+                    continue
+
+                insidequotes = False
+                if not auto_quote:
+                    currentword += char
+
+            else:
+                currentword += char
+
+        else:
+            if char == '"':
+                insidequotes = True
+                if not auto_quote:
+                    currentword += char
+
+            elif char == delimiter:
+                columns.append((currentword, first_char_index, char_index))
+                currentword = ''
+                first_char_index = char_index + 1
+
+            else:
+                currentword += char
+
+        char_index += 1
+
+    columns.append((currentword, first_char_index, char_index))
+
+    return columns
+
+class ParseRowTest(unittest.TestCase):
+    DELIMITERS = [',', '\t', ';', '|']
+
+    # Random lines per delimiter and auto_quote setting.
+    ROW_COUNT = 20000
+
+    def GenerateRows(self, delimiter, seed):
+        rng = random.Random(seed)
+
+        # Other delimiters appear too, as ordinary characters.
+        alphabet = ['a', 'b', ' ', '"', '""', delimiter, delimiter] + self.DELIMITERS
+
+        for row_index in range(self.ROW_COUNT):
+            yield ''.join(rng.choice(alphabet) for i in range(rng.randint(0, 24)))
+
+    def CheckParity(self, delimiter, auto_quote):
+        tokenizer = csvengine.CSVTokenizer(delimiter, auto_quote)
+
+        for row in self.GenerateRows(delimiter, seed=ord(delimiter)):
+            expected = ReferenceParseRow(row, delimiter, auto_quote)
+            actual = [(value.text, value.first_char_index, value.last_char_index) for value in tokenizer.ParseRow(row)]
+            self.assertEqual(actual, expected, 'row {0!r}'.format(row))
+
+    def test_auto_quote(self):
+        for delimiter in self.DELIMITERS:
+            self.CheckParity(delimiter, True)
+
+    def test_no_auto_quote(self):
+        for delimiter in self.DELIMITERS:
+            self.CheckParity(delimiter, False)
+
+    def test_examples(self):
+        tokenizer = csvengine.CSVTokenizer(',', True)
+        for row in ['', 'a', 'a,b', '"a,b",c', '"a ""b""",c', '"unterminated,a', 'x"y"z,', ',,', ' a , b ']:
+            expected = ReferenceParseRow(row, ',', True)
+            actual = [(value.text, value.first_char_index, value.last_char_index) for value in tokenizer.ParseRow(row)]
+            self.assertEqual(actual, expected, 'row {0!r}'.format(row))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,7 +33,6 @@ numpy, or that certain features may not be supported.
 """
 
 # todo: keep track of readonly better
-# todo: mathematical operators
 # todo: more methods?
 # todo: logspace, meshgrid
 # todo: Fortran order?
@@ -42,8 +41,12 @@ from __future__ import division
 
 import sys
 import ctypes
+import math
+import operator
 
-from math import sqrt
+# Builtins hidden by the abs ufunc and the dtype names below
+_abs = abs
+_bool = bool
 
 # Python 2/3 compat
 if sys.version_info >= (3, ):
@@ -117,6 +120,57 @@ def _strides_for_shape(shape, itemsize):
     return tuple([i * itemsize for i in reversed(strides)])
 
 
+def _extent_for_shape(shape, strides, itemsize):
+    """ Return the number of elements a strided array spans in its buffer,
+    from its offset to its last element, for strides that are not negative.
+    """
+    if 0 in shape:
+        return 0
+    extent = 1
+    for n, stride in zip(shape, strides):
+        if stride > 0:
+            extent += (n - 1) * (stride // itemsize)
+    return extent
+
+
+def _strides_for_reshape(shape, strides, newshape, itemsize):
+    """ Return strides that present an array with the given shape and
+    strides in newshape, without copying, or None if its elements are not
+    laid out evenly enough for that. Follows numpy's
+    _attempt_nocopy_reshape.
+    """
+    if 0 in shape:
+        return _strides_for_shape(newshape, itemsize)
+    # Singleton axes can take any stride, so they are dropped first
+    olddims = [n for n in shape if n != 1]
+    oldstrides = [s for n, s in zip(shape, strides) if n != 1]
+    newstrides = [0] * len(newshape)
+    oi, oj, ni, nj = 0, 1, 0, 1
+    while ni < len(newshape) and oi < len(olddims):
+        # Find the smallest groups of old and new axes with equal size
+        np_, op = newshape[ni], olddims[oi]
+        while np_ != op:
+            if np_ < op:
+                np_ *= newshape[nj]
+                nj += 1
+            else:
+                op *= olddims[oj]
+                oj += 1
+        # The old axes of the group must be contiguous with each other
+        for ok in xrange(oi, oj - 1):
+            if oldstrides[ok] != olddims[ok + 1] * oldstrides[ok + 1]:
+                return None
+        newstrides[nj - 1] = oldstrides[oj - 1]
+        for nk in xrange(nj - 1, ni, -1):
+            newstrides[nk - 1] = newstrides[nk] * newshape[nk]
+        ni, nj = nj, nj + 1
+        oi, oj = oj, oj + 1
+    last_stride = newstrides[ni - 1] if ni > 0 else itemsize
+    for nk in xrange(ni, len(newshape)):
+        newstrides[nk] = last_stride
+    return tuple(newstrides)
+
+
 def _size_for_shape(shape):
     stride_product = 1
     for s in shape:
@@ -164,16 +218,6 @@ def _assign_from_object(array, obj):
     _assign_from_object_r(obj)
 
 
-def _increment_mutable_key(key, shape):
-    for axis in reversed(xrange(len(shape))):
-        key[axis] += 1
-        if key[axis] < shape[axis]:
-            return True
-        if axis == 0:
-            return False
-        key[axis] = 0
-
-
 def _key_for_index(index, shape):
     key = []
     cumshape = [1]
@@ -192,6 +236,107 @@ def _zerositer(n):
         yield 0
 
 
+def _normalize_axis(axis, ndim):
+    if not -ndim <= axis < ndim:
+        raise ValueError('axis %i is out of bounds for array of dimension %i'
+                         % (axis, ndim))
+    return axis + ndim if axis < 0 else axis
+
+
+def _normalize_index(index, size, axis):
+    if not -size <= index < size:
+        raise IndexError('index %i is out of bounds for axis %i '
+                         'with size %s' % (index, axis, size))
+    return index + size if index < 0 else index
+
+
+def _gather(data, offsets):
+    """ Return the elements of a ctypes buffer at the given offsets. """
+    if len(offsets) > 1:
+        return list(operator.itemgetter(*offsets)(data))
+    return [data[offset] for offset in offsets]
+
+
+def _offsets(offset, shape, steps):
+    """ Return the buffer offset of every element of a strided shape, in
+    C order. Steps are in elements rather than bytes.
+    """
+    offsets = [offset]
+    for n, step in zip(shape, steps):
+        offsets = [o + i * step for o in offsets for i in xrange(n)]
+    return offsets
+
+
+def _lane(data, offset, n, step):
+    """ Return n elements of a ctypes buffer, step elements apart. """
+    if n == 0:
+        return []
+    if step == 0:
+        return [data[offset]] * n
+    end = offset + n * step
+    return data[offset:end if end >= 0 else None:step]
+
+
+def _set_lane(data, offset, n, step, values):
+    if n == 0:
+        return
+    end = offset + n * step
+    data[offset:end if end >= 0 else None:step] = values
+
+
+def _prod(values):
+    p = 1.0
+    for x in values:
+        p *= float(x)
+    return p
+
+
+def _ptp(values):
+    return max(values) - min(values)
+
+
+def _mean(values):
+    return sum(values) / len(values)
+
+
+def _argmax(values):
+    return max(xrange(len(values)), key=values.__getitem__)
+
+
+def _argmin(values):
+    return min(xrange(len(values)), key=values.__getitem__)
+
+
+def _cumprod(values):
+    p = 1
+    L = []
+    for x in values:
+        p *= x
+        L.append(p)
+    return L
+
+
+def _cumsum(values):
+    p = 0
+    L = []
+    for x in values:
+        p += x
+        L.append(p)
+    return L
+
+
+def _var(values):
+    m = _mean(values)
+    acc = 0
+    for x in values:
+        acc += _abs(x - m) ** 2
+    return acc / len(values)
+
+
+def _std(values):
+    return math.sqrt(_var(values))
+
+
 def array(obj, dtype=None, copy=True, order=None):
     """ array(obj, dtype=None, copy=True, order=None)
     
@@ -218,7 +363,7 @@ def array(obj, dtype=None, copy=True, order=None):
         # Create array
         if D['strides']:
             itemsize = int(D['typestr'][-1])
-            bufsize = D['strides'][0] * D['shape'][0] // itemsize
+            bufsize = _extent_for_shape(D['shape'], D['strides'], itemsize)
         else:
             bufsize = _size_for_shape(D['shape'])
         
@@ -240,7 +385,9 @@ def array(obj, dtype=None, copy=True, order=None):
             el = obj
             while isinstance(el, (tuple, list)) and el:
                 el = el[0]
-            if isinstance(el, int):
+            if isinstance(el, _bool):
+                dtype = 'bool'
+            elif isinstance(el, int):
                 dtype = 'int64'
         # Create array
         a = ndarray(shape, dtype, order=None)
@@ -360,6 +507,393 @@ def linspace(start, stop, num=50, endpoint=True, retstep=False, dtype=None):
         return a
 
 
+def _is_fancy_key(key):
+    if not isinstance(key, tuple):
+        key = (key,)
+    for k in key:
+        if isinstance(k, (ndarray, list)):
+            return True
+    return False
+
+
+def _broadcast_shapes(*shapes):
+    ndim = max(len(shape) for shape in shapes)
+    padded = [(1,) * (ndim - len(shape)) + tuple(shape) for shape in shapes]
+    result = []
+    for sizes in zip(*padded):
+        # Sizes of 1 stretch to match the others, including an empty axis.
+        other_sizes = set(sizes) - set([1])
+        if len(other_sizes) > 1:
+            raise ValueError('operands could not be broadcast together '
+                             'with shapes %s' % 
+                             ' '.join(str(tuple(shape)) for shape in shapes))
+        result.append(other_sizes.pop() if other_sizes else 1)
+    return tuple(result)
+
+
+def _broadcast_flatlist(a, shape):
+    """ Return the elements of array a broadcast to shape, as a list in
+    C order. Broadcast axes are given a step of zero, and each lane along
+    the last axis is sliced from the buffer in one go.
+    """
+    if a.shape == shape:
+        return a._toflatlist()
+    ndim = len(shape)
+    a_shape = (1,) * (ndim - a.ndim) + a.shape
+    a_steps = [0] * (ndim - a.ndim) + [s // a.itemsize for s in a.strides]
+    steps = [0 if n == 1 else step for n, step in zip(a_shape, a_steps)]
+    values = []
+    for offset in _offsets(a._offset, shape[:-1], steps[:-1]):
+        values += _lane(a._data, offset, shape[-1], steps[-1])
+    return values
+
+
+def _operand_dtype(x):
+    if isinstance(x, ndarray):
+        return x.dtype
+    elif isinstance(x, _bool):
+        return 'bool'
+    elif isinstance(x, int):
+        return 'int64'
+    else:
+        return 'float64'
+
+
+def _result_dtype(operands):
+    dtypes = [_operand_dtype(x) for x in operands]
+    if any(dtype in ('float32', 'float64') for dtype in dtypes):
+        return 'float64'
+    elif all(dtype == 'bool' for dtype in dtypes):
+        return 'bool'
+    else:
+        return 'int64'
+
+
+def _from_flatlist(shape, dtype, values):
+    out = empty(shape, dtype)
+    if values:
+        out._data[out._offset:out._offset + len(values)] = values
+    return out
+
+
+def _elementwise(func, operands, dtype=None):
+    """ Apply func element by element over the broadcast operands, which
+    may be arrays or scalars. Arrays are flattened to lists first, so the
+    work runs in map() rather than through per-element indexing.
+    """
+    operands = [array(x, copy=False) if isinstance(x, (list, tuple)) else x 
+                for x in operands]
+    arrays = [x for x in operands if isinstance(x, ndarray)]
+    if not arrays:
+        return func(*operands)
+    shape = _broadcast_shapes(*[a.shape for a in arrays])
+    size = _size_for_shape(shape)
+    lists = []
+    for x in operands:
+        if isinstance(x, ndarray):
+            lists.append(_broadcast_flatlist(x, shape))
+        else:
+            lists.append([x] * size)
+    values = list(map(func, *lists))
+    if dtype is None:
+        dtype = _result_dtype(operands)
+    if dtype == 'bool' and values and not isinstance(values[0], _bool):
+        dtype = 'int64'
+    return _from_flatlist(shape, dtype, values)
+
+
+def _sqrt(x):
+    return math.sqrt(x) if x >= 0 else float('nan')
+
+
+def _exp(x):
+    try:
+        return math.exp(x)
+    except OverflowError:
+        return float('inf')
+
+
+def _log(x):
+    if x > 0:
+        return math.log(x)
+    elif x == 0:
+        return float('-inf')
+    else:
+        return float('nan')
+
+
+def _truediv(x, y):
+    try:
+        return x / y
+    except ZeroDivisionError:
+        if x == 0 or x != x:
+            return float('nan')
+        return math.copysign(float('inf'), x) * math.copysign(1, y)
+
+
+def _choose(condition, x, y):
+    return x if condition else y
+
+
+def abs(x):
+    """ Calculate the absolute value element-wise.
+    """
+    if isinstance(x, ndarray):
+        return _elementwise(_abs, [x], x.dtype)
+    return _elementwise(_abs, [x])
+
+
+absolute = abs
+
+
+def sqrt(x):
+    """ Return the non-negative square-root of an array, element-wise.
+    """
+    return _elementwise(_sqrt, [x], 'float64')
+
+
+def exp(x):
+    """ Calculate the exponential of all elements in the input array.
+    """
+    return _elementwise(_exp, [x], 'float64')
+
+
+def log(x):
+    """ Natural logarithm, element-wise.
+    """
+    return _elementwise(_log, [x], 'float64')
+
+
+def where(condition, x, y):
+    """ Return elements, either from x or y, depending on condition.
+    """
+    return _elementwise(_choose, [condition, x, y], _result_dtype([x, y]))
+
+
+def _matrix_rows(a):
+    """ Return a 2D array as a list of rows, each a list. """
+    values = a._toflatlist()
+    n = a.shape[1]
+    return [values[i*n:(i+1)*n] for i in xrange(a.shape[0])]
+
+
+# Columns of the right-hand matrix per block in dot, so a block's columns
+# stay in cache while every row is multiplied with them.
+_DOT_BLOCK_SIZE = 64
+
+
+def dot(a, b):
+    """ Dot product of two arrays, for arrays of up to 2 dimensions.
+    """
+    a = array(a, copy=False) if isinstance(a, (list, tuple)) else a
+    b = array(b, copy=False) if isinstance(b, (list, tuple)) else b
+    if not isinstance(a, ndarray) or not isinstance(b, ndarray):
+        return _elementwise(operator.mul, [a, b])
+    if a.ndim > 2 or b.ndim > 2:
+        raise ValueError('dot is only supported for arrays of up to 2 '
+                         'dimensions')
+    a2 = a.reshape((1, a.size)) if a.ndim == 1 else a
+    b2 = b.reshape((b.size, 1)) if b.ndim == 1 else b
+    if a2.shape[1] != b2.shape[0]:
+        raise ValueError('shapes %s and %s not aligned' % (a.shape, b.shape))
+    
+    rows = _matrix_rows(a2)
+    columns = _matrix_rows(b2.T)
+    n, m = len(rows), len(columns)
+    values = [0] * (n * m)
+    mul = operator.mul
+    for j in xrange(0, m, _DOT_BLOCK_SIZE):
+        block = columns[j:j+_DOT_BLOCK_SIZE]
+        for i, row in enumerate(rows):
+            offset = i * m + j
+            values[offset:offset+len(block)] = [sum(map(mul, row, column)) 
+                                                for column in block]
+    
+    shape = a.shape[:-1] + b.shape[1:]
+    if not shape:
+        return values[0]
+    return _from_flatlist(shape, _result_dtype([a, b]), values)
+
+
+def matmul(a, b):
+    """ Matrix product of two arrays, for arrays of up to 2 dimensions.
+    """
+    if not isinstance(a, (ndarray, list, tuple)) or \
+            not isinstance(b, (ndarray, list, tuple)):
+        raise ValueError('matmul: scalar operands are not allowed')
+    return dot(a, b)
+
+
+class LinAlgError(ValueError):
+    pass
+
+
+def _solve_rows(a, b):
+    """ Solve a x = b in place by Gaussian elimination with partial
+    pivoting, where a is n rows of n and b is n rows of k.
+    """
+    n = len(a)
+    for j in xrange(n):
+        pivot = max(xrange(j, n), key=lambda i: _abs(a[i][j]))
+        if a[pivot][j] == 0:
+            raise LinAlgError('Singular matrix')
+        a[j], a[pivot] = a[pivot], a[j]
+        b[j], b[pivot] = b[pivot], b[j]
+        for i in xrange(j + 1, n):
+            f = a[i][j] / a[j][j]
+            if f:
+                a[i] = [x - f * y for x, y in zip(a[i], a[j])]
+                b[i] = [x - f * y for x, y in zip(b[i], b[j])]
+    return _back_substitute(a, b, n)
+
+
+def _back_substitute(r, b, n):
+    """ Solve r x = b for upper triangular r, using its first n rows. """
+    k = len(b[0]) if b else 0
+    x = [[0.0] * k for i in xrange(n)]
+    for i in reversed(xrange(n)):
+        row = r[i]
+        for c in xrange(k):
+            acc = b[i][c]
+            for j in xrange(i + 1, n):
+                acc -= row[j] * x[j][c]
+            x[i][c] = acc / row[i]
+    return x
+
+
+def _as_matrix_rows(b):
+    """ Return a 1D or 2D array as a list of rows, 1D as one column. """
+    if b.ndim == 1:
+        return [[float(v)] for v in b._toflatlist()]
+    return [[float(v) for v in row] for row in _matrix_rows(b)]
+
+
+def _from_rows(rows, ndim):
+    if ndim == 1:
+        return array([row[0] for row in rows], 'float64')
+    return array(rows, 'float64')
+
+
+def _check_square(a):
+    if a.ndim != 2 or a.shape[0] != a.shape[1]:
+        raise LinAlgError('Last 2 dimensions of the array must be square')
+
+
+class linalg:
+    """ Linear algebra for small matrices, in pure Python. Mirrors the
+    numpy.linalg namespace.
+    """
+    
+    LinAlgError = LinAlgError
+    
+    @staticmethod
+    def solve(a, b):
+        """ Solve the linear equation a x = b for x.
+        """
+        a, b = array(a, copy=False), array(b, copy=False)
+        _check_square(a)
+        if b.shape[0] != a.shape[0]:
+            raise ValueError('a and b have incompatible shapes')
+        rows = [[float(v) for v in row] for row in _matrix_rows(a)]
+        x = _solve_rows(rows, _as_matrix_rows(b))
+        return _from_rows(x, b.ndim)
+    
+    @staticmethod
+    def inv(a):
+        """ Compute the inverse of a matrix.
+        """
+        a = array(a, copy=False)
+        _check_square(a)
+        return linalg.solve(a, eye(a.shape[0]))
+    
+    @staticmethod
+    def det(a):
+        """ Compute the determinant of an array.
+        """
+        a = array(a, copy=False)
+        _check_square(a)
+        rows = [[float(v) for v in row] for row in _matrix_rows(a)]
+        n = len(rows)
+        d = 1.0
+        for j in xrange(n):
+            pivot = max(xrange(j, n), key=lambda i: _abs(rows[i][j]))
+            if rows[pivot][j] == 0:
+                return 0.0
+            if pivot != j:
+                rows[j], rows[pivot] = rows[pivot], rows[j]
+                d = -d
+            d *= rows[j][j]
+            for i in xrange(j + 1, n):
+                f = rows[i][j] / rows[j][j]
+                if f:
+                    rows[i] = [x - f * y for x, y in zip(rows[i], rows[j])]
+        return d
+    
+    @staticmethod
+    def lstsq(a, b, rcond=None):
+        """ Return the least-squares solution to a x = b, as the tuple
+        (x, residuals, rank, s). Solved by Householder QR, so the singular
+        values s are not computed (returned as None), and the rank is
+        estimated from the diagonal of R: entries at most rcond times the
+        largest count as zero. rcond defaults to machine precision times
+        max(M, N); a negative rcond means machine precision. a must have
+        full column rank.
+        """
+        a, b = array(a, copy=False), array(b, copy=False)
+        if a.ndim != 2:
+            raise LinAlgError('a must be 2D')
+        m, n = a.shape
+        if b.shape[0] != m:
+            raise ValueError('a and b have incompatible shapes')
+        if m < n:
+            raise LinAlgError('lstsq requires at least as many rows as '
+                              'columns')
+        r = [[float(v) for v in row] for row in _matrix_rows(a)]
+        y = _as_matrix_rows(b)
+        k = len(y[0]) if y else 0
+        
+        eps = 2.220446049250313e-16
+        if rcond is None:
+            rcond = eps * max(m, n)
+        elif rcond < 0:
+            rcond = eps
+        
+        # Reduce r to upper triangular form, applying the same
+        # reflections to y.
+        diagonal = []
+        for j in xrange(n):
+            x = [r[i][j] for i in xrange(j, m)]
+            norm = math.sqrt(sum(v * v for v in x))
+            diagonal.append(norm)
+            if not norm:
+                continue
+            alpha = -math.copysign(norm, x[0])
+            v = x
+            v[0] -= alpha
+            vv = sum(e * e for e in v)
+            for rows, columns in ((r, xrange(j, n)), (y, xrange(k))):
+                for c in columns:
+                    f = 2 * sum(v[i] * rows[j+i][c] for i in xrange(len(v))) / vv
+                    if f:
+                        for i in xrange(len(v)):
+                            rows[j+i][c] -= f * v[i]
+        
+        cutoff = rcond * max(diagonal or [0.0])
+        rank = len([d for d in diagonal if d > cutoff])
+        if rank < n:
+            raise LinAlgError('lstsq requires a matrix of full column rank '
+                              '(rank %i of %i columns)' % (rank, n))
+        
+        solution = _back_substitute(r, y, n)
+        if m > n:
+            residuals = [sum(y[i][c] ** 2 for i in xrange(n, m)) 
+                         for c in xrange(k)]
+        else:
+            residuals = []
+        return (_from_rows(solution, b.ndim), array(residuals, 'float64') 
+                if residuals else empty((0,), 'float64'), rank, None)
+
+
 class ndarray(object):
     """ ndarray(shape, dtype='float64', buffer=None, offset=0,
                 strides=None, order=None)
@@ -397,7 +931,7 @@ class ndarray(object):
     Attributes
     ----------
     T : ndarray
-        Transpose of the array. In tinynumpy only supported for ndim <= 3.
+        Transpose of the array, as a view.
     data : buffer
         The array's elements, in memory. In tinynumpy this is a ctypes array.
     dtype : str
@@ -501,7 +1035,8 @@ class ndarray(object):
             self._strides = strides
         
         # Define our buffer class
-        buffersize = self._strides[0] * self._shape[0] // self._itemsize
+        buffersize = _extent_for_shape(self._shape, self._strides, 
+                                       self._itemsize)
         buffersize += self._offset
         BufferClass = _convert_dtype(dtype, 'ctypes') * buffersize
         # Create buffer
@@ -548,6 +1083,11 @@ class ndarray(object):
         return self.size
     
     def __getitem__(self, key):
+        if _is_fancy_key(key):
+            # Gather into a new array
+            shape, offsets = self._fancy_index_helper(key)
+            return _from_flatlist(shape, self.dtype, 
+                                  _gather(self._data, offsets))
         offset, shape, strides = self._index_helper(key)
         if not shape:
             # Return scalar
@@ -559,6 +1099,24 @@ class ndarray(object):
     
     def __setitem__(self, key, value):
         
+        if _is_fancy_key(key):
+            # Scatter to the selected elements
+            shape, offsets = self._fancy_index_helper(key)
+            if isinstance(value, (float, int)):
+                value_list = [value] * len(offsets)
+            else:
+                if not isinstance(value, ndarray):
+                    value = array(value, copy=False)
+                if _broadcast_shapes(value.shape, shape) != shape:
+                    raise ValueError('could not broadcast input array from '
+                                     'shape %s into shape %s' % 
+                                     (value.shape, shape))
+                value_list = _broadcast_flatlist(value, shape)
+            data = self._data
+            for offset, v in zip(offsets, value_list):
+                data[offset] = v
+            return
+        
         # Get info for view
         offset, shape, strides = self._index_helper(key)
         
@@ -587,26 +1145,12 @@ class ndarray(object):
             raise ValueError('Number of elements in source does not match '
                                 'number of elements in target.')
         
-        # Assign data in most efficient way that we can. This code
-        # looks for the largest semi-contiguous block: the block that
-        # we can access as a 1D array with a stepsize.
-        subviews = [view]
+        # Assign data one evenly spaced block at a time.
         value_index = 0
-        count = 0
-        while subviews:
-            subview = subviews.pop(0)
-            step = _get_step(subview)
-            if step:
-                block = value_list[value_index:value_index+subview.size]
-                s = slice(subview._offset, 
-                            subview._offset + subview.size * step, 
-                            step)
-                view._data[s] = block
-                value_index += subview.size
-                count += 1
-            else:
-                for i in range(subview.shape[0]):
-                    subviews.append(subview[i])
+        for offset, n, step in view._blocks():
+            _set_lane(view._data, offset, n, step, 
+                      value_list[value_index:value_index+n])
+            value_index += n
         assert value_index == len(value_list)
     
     def __float__(self):
@@ -654,13 +1198,138 @@ class ndarray(object):
         else:
             return "array(" + s + ")"
     
+    ## Arithmetic and comparison operators
+    
     def __eq__(self, other):
-        if other.__module__.split('.')[0] == 'numpy':
+        if type(other).__module__.split('.')[0] == 'numpy':
             return other == self
         else:
-            out = empty(self.shape, 'bool')
-            out[:] = [i1==i2 for (i1, i2) in zip(self.flat, other.flat)]
-            return out
+            return _elementwise(operator.eq, [self, other], 'bool')
+    
+    def __ne__(self, other):
+        return _elementwise(operator.ne, [self, other], 'bool')
+    
+    def __lt__(self, other):
+        return _elementwise(operator.lt, [self, other], 'bool')
+    
+    def __le__(self, other):
+        return _elementwise(operator.le, [self, other], 'bool')
+    
+    def __gt__(self, other):
+        return _elementwise(operator.gt, [self, other], 'bool')
+    
+    def __ge__(self, other):
+        return _elementwise(operator.ge, [self, other], 'bool')
+    
+    def __add__(self, other):
+        return _elementwise(operator.add, [self, other])
+    
+    def __radd__(self, other):
+        return _elementwise(operator.add, [other, self])
+    
+    def __sub__(self, other):
+        return _elementwise(operator.sub, [self, other])
+    
+    def __rsub__(self, other):
+        return _elementwise(operator.sub, [other, self])
+    
+    def __mul__(self, other):
+        return _elementwise(operator.mul, [self, other])
+    
+    def __rmul__(self, other):
+        return _elementwise(operator.mul, [other, self])
+    
+    # Division by zero gives inf or nan, as in numpy, but that is only
+    # checked for once operator.truediv has raised.
+    
+    def __truediv__(self, other):
+        try:
+            return _elementwise(operator.truediv, [self, other], 'float64')
+        except ZeroDivisionError:
+            return _elementwise(_truediv, [self, other], 'float64')
+    
+    def __rtruediv__(self, other):
+        try:
+            return _elementwise(operator.truediv, [other, self], 'float64')
+        except ZeroDivisionError:
+            return _elementwise(_truediv, [other, self], 'float64')
+    
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+    
+    def __floordiv__(self, other):
+        return _elementwise(operator.floordiv, [self, other])
+    
+    def __rfloordiv__(self, other):
+        return _elementwise(operator.floordiv, [other, self])
+    
+    def __mod__(self, other):
+        return _elementwise(operator.mod, [self, other])
+    
+    def __rmod__(self, other):
+        return _elementwise(operator.mod, [other, self])
+    
+    def __pow__(self, other):
+        return _elementwise(operator.pow, [self, other])
+    
+    def __rpow__(self, other):
+        return _elementwise(operator.pow, [other, self])
+    
+    def __and__(self, other):
+        return _elementwise(operator.and_, [self, other])
+    
+    def __rand__(self, other):
+        return _elementwise(operator.and_, [other, self])
+    
+    def __or__(self, other):
+        return _elementwise(operator.or_, [self, other])
+    
+    def __ror__(self, other):
+        return _elementwise(operator.or_, [other, self])
+    
+    def __xor__(self, other):
+        return _elementwise(operator.xor, [self, other])
+    
+    def __rxor__(self, other):
+        return _elementwise(operator.xor, [other, self])
+    
+    def __matmul__(self, other):
+        return matmul(self, other)
+    
+    def __rmatmul__(self, other):
+        return matmul(other, self)
+    
+    def __neg__(self):
+        return _elementwise(operator.neg, [self], self.dtype)
+    
+    def __pos__(self):
+        return self.copy()
+    
+    def __abs__(self):
+        return abs(self)
+    
+    def __invert__(self):
+        if self.dtype == 'bool':
+            return _elementwise(operator.not_, [self], 'bool')
+        return _elementwise(operator.invert, [self], self.dtype)
+    
+    def __iadd__(self, other):
+        self[:] = self + other
+        return self
+    
+    def __isub__(self, other):
+        self[:] = self - other
+        return self
+    
+    def __imul__(self, other):
+        self[:] = self * other
+        return self
+    
+    def __itruediv__(self, other):
+        self[:] = self / other
+        return self
+    
+    __idiv__ = __itruediv__
     
     ## Private helper functions
     
@@ -681,9 +1350,7 @@ class ndarray(object):
         for k in key:
             axissize = self._shape[axis]
             if isinstance(k, int):
-                if k >= axissize:
-                    raise IndexError('index %i is out of bounds for axis %i '
-                                     'with size %s' % (k, axis, axissize))
+                k = _normalize_index(k, axissize, axis)
                 offset += k * self._strides[axis] // self.itemsize
                 axis += 1
             elif isinstance(k, slice):
@@ -708,22 +1375,122 @@ class ndarray(object):
         
         return offset, tuple(shape), tuple(strides)
     
+    def _fancy_index_helper(self, key):
+        """ Return (shape, offsets) for a key containing integer or boolean
+        arrays, where offsets are the buffer offsets of the selected
+        elements in C order. Index arrays must be 1D, apart from a boolean
+        mask of the same shape as the array.
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        
+        # A mask over the whole array selects elements in C order.
+        if (len(key) == 1 and isinstance(key[0], ndarray) and 
+                key[0].dtype == 'bool' and key[0].ndim > 1):
+            mask = key[0]
+            if mask.shape != self.shape:
+                raise IndexError('boolean index did not match indexed array')
+            offsets = [offset for offset, flag in 
+                       zip(self._flat_offsets(), mask._toflatlist()) if flag]
+            return (len(offsets),), offsets
+        
+        if len(key) > self.ndim:
+            raise IndexError('too many indices for array')
+        key = key + (slice(None),) * (self.ndim - len(key))
+        
+        # For each axis, whether it is indexed by an array or int, and the
+        # offset of each index along it.
+        axes = []
+        for axis, k in enumerate(key):
+            size = self._shape[axis]
+            step = self._strides[axis] // self.itemsize
+            if isinstance(k, (list, tuple)):
+                k = array(k) if k else empty((0,), 'int64')
+            if isinstance(k, ndarray):
+                if k.ndim != 1:
+                    raise IndexError('index arrays must be 1D')
+                values = k._toflatlist()
+                if k.dtype == 'bool':
+                    if len(values) != size:
+                        raise IndexError('boolean index did not match indexed '
+                                         'array along dimension %i' % axis)
+                    indices = [i for i, flag in enumerate(values) if flag]
+                else:
+                    indices = [_normalize_index(int(i), size, axis) 
+                               for i in values]
+                axes.append((True, [i * step for i in indices]))
+            elif isinstance(k, slice):
+                axes.append((False, [i * step for i in xrange(*k.indices(size))]))
+            elif isinstance(k, int):
+                axes.append((True, [_normalize_index(k, size, axis) * step]))
+            else:
+                raise TypeError('key elements must be ints, slices or index '
+                                'arrays.')
+        
+        # Index arrays and ints are broadcast together into one axis.
+        advanced = [axis for axis, (is_array, steps) in enumerate(axes) 
+                    if is_array]
+        lengths = set(len(axes[axis][1]) for axis in advanced) - set([1])
+        if len(lengths) > 1:
+            raise IndexError('shape mismatch: indexing arrays could not be '
+                             'broadcast together')
+        length = lengths.pop() if lengths else 1
+        combined = [0] * length
+        for axis in advanced:
+            steps = axes[axis][1]
+            if len(steps) == 1:
+                steps = steps * length
+            combined = [a + b for a, b in zip(combined, steps)]
+        
+        # The broadcast axis replaces the indexed axes if they are next to
+        # each other, and goes first otherwise.
+        out_axes = [steps for is_array, steps in axes if not is_array]
+        if advanced == list(xrange(advanced[0], advanced[-1] + 1)):
+            out_axes.insert(advanced[0], combined)
+        else:
+            out_axes.insert(0, combined)
+        
+        offsets = [self._offset]
+        for steps in out_axes:
+            offsets = [o + s for o in offsets for s in steps]
+        return tuple([len(steps) for steps in out_axes]), offsets
+    
+    def _flat_offsets(self):
+        offsets = []
+        for offset, n, step in self._blocks():
+            offsets.extend(xrange(offset, offset + n * step, step))
+        return offsets
+    
+    def _blocks(self):
+        """ Return (offset, size, step) for each run of elements that is
+        evenly spaced in the buffer, in C order. Trailing axes are merged
+        into one run for as long as the spacing stays even, so a
+        contiguous array is a single run. Steps are in elements.
+        """
+        shape = self._shape
+        if 0 in shape:
+            return []
+        steps = [s // self.itemsize for s in self._strides]
+        axis = len(shape) - 1
+        n, step = shape[axis], steps[axis]
+        while axis > 0:
+            if shape[axis-1] == 1:
+                pass
+            elif n == 1:
+                n, step = shape[axis-1], steps[axis-1]
+            elif steps[axis-1] == step * n:
+                n *= shape[axis-1]
+            else:
+                break
+            axis -= 1
+        return [(offset, n, step) 
+                for offset in _offsets(self._offset, shape[:axis], steps[:axis])]
+    
     def _toflatlist(self):
+        data = self._data
         value_list = []
-        subviews = [self]
-        count = 0
-        while subviews:
-            subview = subviews.pop(0)
-            step = _get_step(subview)
-            if step:
-                s = slice(subview._offset, 
-                          subview._offset + subview.size * step, 
-                          step)
-                value_list += self._data[s]
-                count += 1
-            else:
-                for i in range(subview.shape[0]):
-                    subviews.append(subview[i])
+        for offset, n, step in self._blocks():
+            value_list += _lane(data, offset, n, step)
         return value_list
     
     ## Properties
@@ -748,46 +1515,13 @@ class ndarray(object):
             return
         if self.size != _size_for_shape(newshape):
             raise ValueError('Total size of new array must be unchanged')
-        if _get_step(self) == 1:
-            # Contiguous, hooray!
-            self._shape = tuple(newshape)
-            self._strides = _strides_for_shape(self._shape, self.itemsize)
-            return
-        
-        # Else, try harder ... This code supports adding /removing
-        # singleton dimensions. Although it may sometimes be possible
-        # to split a dimension in two if the contiguous blocks allow
-        # this, we don't bother with such complex cases for now.
-        # Squeeze shape / strides 
-        N = self.ndim
-        shape = [self.shape[i] for i in range(N) if self.shape[i] > 1]
-        strides = [self.strides[i] for i in range(N) if self.shape[i] > 1]
-        # Check if squeezed shapes match
-        newshape_ = [newshape[i] for i in range(len(newshape)) 
-                     if newshape[i] > 1]
-        if newshape_ != shape:
+        newshape = tuple(newshape)
+        strides = _strides_for_reshape(self._shape, self._strides, newshape, 
+                                       self.itemsize)
+        if strides is None:
             raise AttributeError('incompatible shape for non-contiguous array')
-        # Modify to make this data work in loop
-        strides.append(strides[-1])
-        shape.append(1)
-        # Form new strides
-        i = -1
-        newstrides = []
-        try:
-            for s in reversed(newshape):
-                if s == 1:
-                    newstrides.append(strides[i] * shape[i])
-                else:
-                    i -= 1
-                    newstrides.append(strides[i])
-        except IndexError:
-            # Fail
-            raise AttributeError('incompatible shape for non-contiguous array')
-        else:
-            # Success
-            newstrides.reverse()
-            self._shape = tuple(newshape)
-            self._strides = tuple(newstrides)
+        self._shape = newshape
+        self._strides = strides
     
     shape = property(_get_shape, _set_shape)  # Python 2.5 compat (e.g. Jython)
     
@@ -813,20 +1547,10 @@ class ndarray(object):
     
     @property
     def flat(self):
-        subviews = [self]
-        count = 0
-        while subviews:
-            subview = subviews.pop(0)
-            step = _get_step(subview)
-            if step:
-                s = slice(subview._offset, 
-                          subview._offset + subview.size * step, 
-                          step)
-                for i in self._data[s]:
-                    yield i
-            else:
-                for i in range(subview.shape[0]):
-                    subviews.append(subview[i])
+        data = self._data
+        for offset, n, step in self._blocks():
+            for i in _lane(data, offset, n, step):
+                yield i
     
     @property
     def T(self):
@@ -863,26 +1587,46 @@ class ndarray(object):
     
     def copy(self):
         out = empty(self.shape, self.dtype)
-        out[:] = self
+        blocks = self._blocks()
+        if not blocks:
+            return out
+        offset, n, step = blocks[0]
+        if step != 1 or n < 64:
+            # Short or strided blocks: gather them all, assign once.
+            out._data[:] = self._toflatlist()
+            return out
+        # Long contiguous blocks: one memmove each.
+        itemsize = self.itemsize
+        src = ctypes.addressof(self._data)
+        dst = ctypes.addressof(out._data)
+        for index, (offset, n, step) in enumerate(blocks):
+            ctypes.memmove(dst + index * n * itemsize, 
+                           src + offset * itemsize, n * itemsize)
         return out
     
     def flatten(self):
-        out = empty((self.size,), self.dtype)
-        out[:] = self
-        return out
+        return self.copy().reshape((self.size,))
     
     def ravel(self):
         return self.reshape((self.size, ))
     
     def repeat(self, repeats, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
+        if axis is not None:
+            raise TypeError("axis argument is not supported")
         out = empty((self.size * repeats,), self.dtype)
         for i in range(repeats):
             out[i*self.size:(i+1)*self.size] = self
         return out
     
-    def reshape(self, newshape):
+    def reshape(self, *newshape):
+        if len(newshape) == 1 and isinstance(newshape[0], (tuple, list)):
+            newshape = newshape[0]
+        newshape = tuple(newshape)
+        if -1 in newshape:
+            known = -_size_for_shape(newshape)
+            if known:
+                newshape = tuple([self.size // known if n == -1 else n 
+                                  for n in newshape])
         out = self.view()
         try:
             out.shape = newshape
@@ -891,29 +1635,34 @@ class ndarray(object):
             out.shape = newshape
         return out
     
-    def transpose(self):
-        # Numpy returns a view, but we cannot do that since we do not
-        # support Fortran ordering
-        ndim = self.ndim
-        if ndim < 2:
-            return self.view()
-        shape = self.shape[::-1]
-        out = empty(shape, self.dtype)
-        #
-        if ndim == 2:
-            for i in xrange(self.shape[0]):
-                out[:, i] = self[i, :]
-        elif ndim == 3:
-            for i in xrange(self.shape[0]):
-                for j in xrange(self.shape[1]):
-                    out[:, j, i] = self[i, j, :]
-        else:
-            raise ValueError('Tinynumpy supports transpose up to ndim=3')
-        return out
+    def transpose(self, *axes):
+        if len(axes) == 1 and isinstance(axes[0], (tuple, list)):
+            axes = axes[0]
+        if not axes:
+            axes = tuple(reversed(xrange(self.ndim)))
+        axes = [_normalize_axis(axis, self.ndim) for axis in axes]
+        if sorted(axes) != list(xrange(self.ndim)):
+            raise ValueError("axes don't match array")
+        shape = tuple([self._shape[axis] for axis in axes])
+        strides = tuple([self._strides[axis] for axis in axes])
+        return ndarray(shape, self.dtype, buffer=self, 
+                       offset=self._offset, strides=strides)
     
     def astype(self, dtype):
-        out = empty(self.shape, dtype)
-        out[:] = self
+        dtype = _convert_dtype(dtype)
+        if dtype == self.dtype:
+            return self.copy()
+        if dtype == 'bool':
+            convert = _bool
+        elif dtype in ('float32', 'float64'):
+            convert = float
+        else:
+            convert = int
+        return _from_flatlist(self.shape, dtype, 
+                              list(map(convert, self._toflatlist())))
+    
+    def dot(self, b):
+        return dot(self, b)
     
     def view(self, dtype=None, type=None):
         if dtype is None:
@@ -932,123 +1681,115 @@ class ndarray(object):
     
     ## Methods - statistics
     
-    # We use the self.flat generator here. self._toflatlist() would be
-    # faster, but it might take up significantly more memory.
-    
-    def all(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return all(self.flat)
-    
-    def any(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return any(self.flat)
-    
-    def min(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return min(self.flat)
-    
-    def max(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return max(self.flat)
-    
-    def sum(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return sum(self.flat)
-    
-    def prod(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        p = 1.0
-        for i in self.flat:
-            p *= float(i)
-        return p
+    # Reductions over the whole array work on self._toflatlist(), which
+    # slices the ctypes buffer block by block.  Reductions along an axis
+    # slice each lane along that axis straight out of the buffer.
+    
+    def _reduce(self, func, axis, keepdims, dtype=None):
+        """ Apply func, which takes a list and returns a scalar, to the
+        whole array or to each lane along axis.
+        """
+        if axis is None:
+            result = func(self._toflatlist())
+            if keepdims:
+                out = empty((1,) * self.ndim, dtype or self.dtype)
+                out[:] = [result]
+                return out
+            return result
+        
+        axis = _normalize_axis(axis, self.ndim)
+        n = self._shape[axis]
+        step = self._strides[axis] // self.itemsize
+        shape = self._shape[:axis] + self._shape[axis+1:]
+        steps = [s // self.itemsize for s in self._strides[:axis] + self._strides[axis+1:]]
+        
+        data = self._data
+        values = [func(_lane(data, offset, n, step)) 
+                  for offset in _offsets(self._offset, shape, steps)]
+        
+        if keepdims:
+            shape = self._shape[:axis] + (1,) + self._shape[axis+1:]
+        elif not shape:
+            return values[0]
+        out = empty(shape, dtype or self.dtype)
+        out[:] = values
+        return out
+    
+    def _accumulate(self, func, axis, out):
+        """ Apply func, which takes a list and returns a list of the same
+        length, to the flattened array or to each lane along axis.
+        """
+        if axis is None:
+            if out is None:
+                out = empty((self.size,), self.dtype)
+            out[:] = func(self._toflatlist())
+            return out
+        
+        axis = _normalize_axis(axis, self.ndim)
+        if out is None:
+            out = empty(self.shape, self.dtype)
+        n = self._shape[axis]
+        shape = self._shape[:axis] + self._shape[axis+1:]
+        
+        step = self._strides[axis] // self.itemsize
+        steps = [s // self.itemsize for s in self._strides[:axis] + self._strides[axis+1:]]
+        out_step = out._strides[axis] // out.itemsize
+        out_steps = [s // out.itemsize for s in out._strides[:axis] + out._strides[axis+1:]]
+        
+        data = self._data
+        out_offsets = _offsets(out._offset, shape, out_steps)
+        for offset, out_offset in zip(_offsets(self._offset, shape, steps), out_offsets):
+            _set_lane(out._data, out_offset, n, out_step, 
+                      func(_lane(data, offset, n, step)))
+        return out
+    
+    def all(self, axis=None, keepdims=False):
+        return self._reduce(all, axis, keepdims, 'bool')
+    
+    def any(self, axis=None, keepdims=False):
+        return self._reduce(any, axis, keepdims, 'bool')
+    
+    def min(self, axis=None, keepdims=False):
+        return self._reduce(min, axis, keepdims)
+    
+    def max(self, axis=None, keepdims=False):
+        return self._reduce(max, axis, keepdims)
+    
+    def sum(self, axis=None, keepdims=False):
+        dtype = 'int64' if self.dtype == 'bool' else self.dtype
+        return self._reduce(sum, axis, keepdims, dtype)
+    
+    def prod(self, axis=None, keepdims=False):
+        return self._reduce(_prod, axis, keepdims, 'float64')
         
-    def ptp(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        mn = self.data[self._offset]
-        mx = mn
-        for i in self.flat:
-            if i > mx:
-                mx = i
-            if i < mn:
-                mn = i
-        return mx - mn
-
-    def mean(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return self.sum() / self.size
+    def ptp(self, axis=None, keepdims=False):
+        return self._reduce(_ptp, axis, keepdims)
+
+    def mean(self, axis=None, keepdims=False):
+        return self._reduce(_mean, axis, keepdims, 'float64')
     
     def argmax(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        r = self.data[self._offset]
-        r_index = 0
-        for i_index, i in enumerate(self.flat):
-            if i > r:
-                r = i
-                r_index = i_index
-        return r_index
+        return self._reduce(_argmax, axis, False, 'int64')
 
     def argmin(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        r = self.data[self._offset]
-        r_index = 0
-        for i_index, i in enumerate(self.flat):
-            if i < r:
-                r = i
-                r_index = i_index
-        return r_index
+        return self._reduce(_argmin, axis, False, 'int64')
     
     def cumprod(self, axis=None, out=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        if out is None:
-            out = empty((self.size,), self.dtype)
-        p = 1
-        L = []
-        for x in self.flat:
-            p *= x
-            L.append(p)
-        out[:] = L
-        return out
+        return self._accumulate(_cumprod, axis, out)
 
     def cumsum(self, axis=None, out=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        if out is None:
-            out = empty((self.size,), self.dtype)
-        p = 0
-        L = []
-        for x in self.flat:
-            p += x
-            L.append(p)
-        out[:] = L
-        return out
+        return self._accumulate(_cumsum, axis, out)
 
-    def var(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        m = self.mean()
-        acc = 0
-        for x in self.flat:
-            acc += abs(x - m) ** 2
-        return acc / self.size
+    def var(self, axis=None, keepdims=False):
+        return self._reduce(_var, axis, keepdims, 'float64')
 
-    def std(self, axis=None):
-        return sqrt(self.var(axis))
+    def std(self, axis=None, keepdims=False):
+        return self._reduce(_std, axis, keepdims, 'float64')
 
 class nditer:
     def __init__(self, array):
         self.array = array
-        self.key = [0] * len(self.array.shape)
+        self.values = array.flat
 
     def __iter__(self):
         return self
@@ -1061,12 +1802,7 @@ class nditer:
         return self.array[key]
 
     def __next__(self):
-        if self.key is None:
-            raise StopIteration
-        value = self.array[tuple(self.key)]
-        if not _increment_mutable_key(self.key, self.array.shape):
-            self.key = None
-        return value
+        return next(self.values)
 
     def next(self):
         return self.__next__()